@@ -79,6 +79,14 @@ def formats():
                ('<http://www.metarelate.net/metOcean/format/cf>', 'CF')]
     return choices
 
+def _notation_choices(graph):
+    """
+    Returns the subject and notation choices of the concepts in a graph
+
+    """
+    results = fuseki_process.subject_and_plabel(graph, columns=True)
+    return zip(results['subject'], results['notation'])
+
 class MappingFormats(forms.Form):
     """
     form to define the file format of the source and target
@@ -144,49 +152,37 @@ class Value(forms.Form):
     _name = forms.CharField(required=False)
     value = forms.CharField(required=False)
     operator = forms.CharField(required=False)
-    ops = fuseki_process.subject_and_plabel('http://openmath/tests.ttl')
-    ops = [(op['subject'], op['notation']) for op in ops]
-    ops = [('','')] + ops
+    ops = [('','')] + _notation_choices('http://openmath/tests.ttl')
     operator = forms.ChoiceField(required=False, choices=ops)
     
     def __init__(self, *args, **kwargs):
         self.fformat = kwargs.pop('fformat')
         super(Value, self).__init__(*args, **kwargs)
         if self.fformat == 'um':
-            umRes = fuseki_process.subject_and_plabel('http://um/umdpF3.ttl')
-            choices = [(um['subject'], um['notation']) for um in umRes]
-            choices = [('','')] + choices
+            choices = [('','')] + _notation_choices('http://um/umdpF3.ttl')
             self.fields['name'].choices = choices
-            sns = fuseki_process.subject_and_plabel('http://um/stashconcepts.ttl')
             sn_choices = [('','')]
-            sn_choices += [(um['subject'], um['notation']) for um in sns]
+            sn_choices += _notation_choices('http://um/stashconcepts.ttl')
             self.fields['stash_code'] = forms.ChoiceField(required=False,
                                                           choices=sn_choices)
-            fcs = fuseki_process.subject_and_plabel('http://um/fieldcode.ttl')
             fc_choices = [('','')]
-            fc_choices += [(um['subject'], um['notation']) for um in fcs]
+            fc_choices += _notation_choices('http://um/fieldcode.ttl')
             self.fields['field_code'] = forms.ChoiceField(required=False,
                                                           choices=fc_choices)
         elif self.fformat == 'cf':
-            cfRes = fuseki_process.subject_and_plabel('http://cf/cf-model.ttl')
-            choices = [(cf['subject'], cf['notation']) for cf in cfRes]
-            choices = [('','')] + choices
+            choices = [('','')] + _notation_choices('http://cf/cf-model.ttl')
             self.fields['name'].choices = choices
-            sns = fuseki_process.subject_and_plabel('http://cf/cf-standard-name-table.ttl')
             sn_choices = [('','')]
-            sn_choices += [(sn['subject'], sn['notation']) for sn in sns]
+            sn_choices += _notation_choices('http://cf/cf-standard-name-table.ttl')
             self.fields['standard_name'] = forms.ChoiceField(required=False,
                                                              choices=sn_choices)
-            mod = fuseki_process.subject_and_plabel('http://cf/cf-model.ttl')
             md_choices = [('','')]
-            md_choices += [(mo['subject'], mo['notation']) for mo in mod]
+            md_choices += _notation_choices('http://cf/cf-model.ttl')
             print md_choices
             self.fields['cf model'] = forms.ChoiceField(required=False,
                                                         choices=md_choices)
         elif self.fformat == 'grib':
-            grRes = fuseki_process.subject_and_plabel('http://grib/apikeys.ttl')
-            choices = [(grib['subject'], grib['notation']) for grib in grRes]
-            choices = [('','')] + choices
+            choices = [('','')] + _notation_choices('http://grib/apikeys.ttl')
             self.fields['name'].choices = choices
         else:
             raise ValueError('invalid format supplied: {}'.format(self.fformat))
@@ -309,8 +305,7 @@ class DerivedValue(forms.Form):
     using the available values
     
     """        
-    ops = fuseki_process.subject_and_plabel('http://openmath/ops.ttl')
-    ops = [('','')] + [(op['subject'], op['notation']) for op in ops]
+    ops = [('','')] + _notation_choices('http://openmath/ops.ttl')
     _operator = forms.ChoiceField(choices=ops)
     _subject = forms.ChoiceField()
     _object = forms.ChoiceField(required=False)
@@ -464,7 +459,7 @@ class HomeForm(forms.Form):
     def clean(self):
         if self.data.has_key('load'):
             print 'data loaded'
-            fuseki_process.load()
+            fuseki_process.load(incremental=True)
         elif self.data.has_key('revert'):
             print 'save cache reverted'
             fuseki_process.revert()
@@ -473,7 +468,20 @@ class HomeForm(forms.Form):
             fuseki_process.save()
         elif self.data.has_key('validate'):
             print 'validate triplestore'
-            self.cleaned_data['validation'] = fuseki_process.validate()
+            timeout = metocean.site_config['validation_timeout']
+            validation = fuseki_process.validate(incremental=True,
+                                                 timeout=timeout)
+            for name, elapsed in sorted(validation.timings.iteritems()):
+                print '{} check took {:.2f}s'.format(name, elapsed)
+            if validation.timed_out:
+                msg = 'The following checks did not complete within ' \
+                      '{}s: {}'.format(timeout,
+                                       ', '.join(validation.timed_out))
+                validation[msg] = []
+            for name, error in sorted(validation.failed.iteritems()):
+                msg = 'The {} check failed: {}'.format(name, error)
+                validation[msg] = []
+            self.cleaned_data['validation'] = validation
         return self.cleaned_data
 
 
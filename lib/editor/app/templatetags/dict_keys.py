@@ -26,7 +26,6 @@ import metocean.prefixes as pref
 register = template.Library()
 
 pre = pref.Prefixes()
-inv_pre = dict([[v,k] for k,v in pre.items()])
 
 @register.filter
 @register.simple_tag
@@ -34,11 +33,9 @@ def prefix_uri(adict, keys=''):
     uri = multi_key(adict, keys)
     if uri and uri.startswith('<http:'):
         label = uri
-        url = uri.lstrip('<').rstrip('>')
-        for p in inv_pre:
-            if url.startswith(p):
-                suffix = url.split(p)[1]
-                label = '{}: {}'.format(inv_pre[p],suffix)
+        curie = pre.compact(uri)
+        if curie is not None:
+            label = curie.replace(':', ': ', 1)
     else:
         label = uri
     return label
@@ -41,6 +41,12 @@ import metocean.prefixes as prefixes
 from settings import READ_ONLY
 from settings import fuseki_process
 
+# The number of cached change statements listed on the home page.
+CACHE_PREVIEW = 100
+
+# The number of mappings listed on each page of search results.
+SEARCH_PAGE = 50
+
 
 def home(request):
     """
@@ -49,23 +55,6 @@ def home(request):
     and reporting on status
     
     """
-    persist = fuseki_process.query_cache()
-    cache_status = '{} statements in the local triple store are' \
-                   ' flagged as not existing in the persistent ' \
-                   'StaticData store'.format(len(persist))
-    print_string = ''
-    for r in persist:
-        if len(r.keys()) == 3 and r.has_key('s') and \
-            r.has_key('p') and r.has_key('o'):
-            print_string += '%s\n' % r['s']
-            print_string += '\t%s\n' % r['p']
-            print_string += '\t\t%s\n' % r['o']
-            print_string += '\n'
-        else:
-            for k,v in r.iteritems():
-                print_string += '%s %s\n' (k, v)
-            print_string += '\n'
-    cache_state = print_string
     if request.method == 'POST':
         form = forms.HomeForm(request.POST)
         if form.is_valid():
@@ -78,6 +67,28 @@ def home(request):
                 url = url_qstr(reverse('home'))
                 response = HttpResponseRedirect(url)
     else:
+        count = fuseki_process.cache_count()
+        cache_status = '{} statements in the local triple store are' \
+                       ' flagged as not existing in the persistent ' \
+                       'StaticData store'.format(count)
+        persist = []
+        if count:
+            persist = fuseki_process.query_cache(limit=CACHE_PREVIEW)
+        if count > len(persist):
+            cache_status += ', the first {} are listed'.format(len(persist))
+        print_string = ''
+        for r in persist:
+            if len(r.keys()) == 3 and r.has_key('s') and \
+                r.has_key('p') and r.has_key('o'):
+                print_string += '%s\n' % r['s']
+                print_string += '\t%s\n' % r['p']
+                print_string += '\t\t%s\n' % r['o']
+                print_string += '\n'
+            else:
+                for k,v in r.iteritems():
+                    print_string += '%s %s\n' % (k, v)
+                print_string += '\n'
+        cache_state = print_string
         form = forms.HomeForm(initial={'cache_status':cache_status,
                                        'cache_state':cache_state})
         con_dict = {}
@@ -128,8 +139,8 @@ def _prop_id(members):
                 for i, (prop, new_prop) in enumerate(zip(props, new_props)):
                     # remove old property id
                     prop.pop('property', None)
-                    qstr, instr = metocean.Property.sparql_creator(prop)
-                    prop_res = fuseki_process.create(qstr, instr)
+                    record, qstr, upstr = metocean.Property.sparql_get_or_create(prop)
+                    prop_res = fuseki_process.get_or_create(record, qstr, upstr)
                     cpid = '{}'.format(prop_res['property'])
                     props[i] = cpid
                     new_props[i]['component'] = cpid
@@ -137,14 +148,14 @@ def _prop_id(members):
                 #validation error please
                 raise ValueError('If a property has a component that component'
                                  'must itself reference properties')
-            qstr, instr = metocean.Component.sparql_creator(comp_mem)
-            cres = fuseki_process.create(qstr, instr)
+            record, qstr, upstr = metocean.Component.sparql_get_or_create(comp_mem)
+            cres = fuseki_process.get_or_create(record, qstr, upstr)
             mem['mr:hasComponent'] = cres['component']
             new_mem['mr:hasComponent']['component'] = cres['component']
         # remove old property id
         mem.pop('property', None)
-        qstr, instr = metocean.Property.sparql_creator(mem)
-        res = fuseki_process.create(qstr, instr)
+        record, qstr, upstr = metocean.Property.sparql_get_or_create(mem)
+        res = fuseki_process.get_or_create(record, qstr, upstr)
         pid = res['property']
         new_mem['property'] = pid
         prop_ids.append(pid)
@@ -174,14 +185,14 @@ def _create_components(key, requestor, new_map, components):
             sub_concept_dict = {
                 'mr:hasFormat': '%s' % requestor[key]['mr:hasFormat'],
                 'mr:hasProperty':pr_ids}
-            qstr, instr = metocean.Component.sparql_creator(sub_concept_dict)
-            sub_comp = fuseki_process.create(qstr, instr)
+            record, qstr, upstr = metocean.Component.sparql_get_or_create(sub_concept_dict)
+            sub_comp = fuseki_process.get_or_create(record, qstr, upstr)
             subc_ids.append('%s' % sub_comp['component'])
             newm['component'] = '%s' % sub_comp['component']
     comp_dict = {'mr:hasFormat':'%s' % requestor[key]['mr:hasFormat'],
                                 'mr:hasComponent':subc_ids}
-    qstr, instr = metocean.Component.sparql_creator(comp_dict)
-    comp = fuseki_process.create(qstr, instr)
+    record, qstr, upstr = metocean.Component.sparql_get_or_create(comp_dict)
+    comp = fuseki_process.get_or_create(record, qstr, upstr)
     if comp:
         components[key] = comp['component']
     else:
@@ -203,8 +214,8 @@ def _create_properties(key, requestor, new_map, components):
         comp_dict['dc:mediator'] = requestor[key]['dc:mediator']
     if requestor[key].get('dc:requires'):
         comp_dict['dc:requires'] = requestor[key]['dc:requires']
-    qstr, instr = metocean.Component.sparql_creator(comp_dict)
-    comp = fuseki_process.create(qstr, instr)
+    record, qstr, upstr = metocean.Component.sparql_get_or_create(comp_dict)
+    comp = fuseki_process.get_or_create(record, qstr, upstr)
     if comp:
         components[key] = comp['component']
     else:
@@ -639,12 +650,12 @@ def _get_value(value):
         subj_id = _get_value(value.get('mr:subject'))
     else:
         po_dict = value['mr:subject']['mr:hasProperty']
-        qstr, instr = metocean.Property.sparql_creator(po_dict)
-        prop = fuseki_process.create(qstr, instr)
+        record, qstr, upstr = metocean.Property.sparql_get_or_create(po_dict)
+        prop = fuseki_process.get_or_create(record, qstr, upstr)
         po_dict = {'mr:hasProperty':prop['property'],
                    'mr:scope':value['mr:subject']['mr:scope']}
-        qstr, instr = metocean.ScopedProperty.sparql_creator(po_dict)
-        sc_prop = fuseki_process.create(qstr, instr)
+        record, qstr, upstr = metocean.ScopedProperty.sparql_get_or_create(po_dict)
+        sc_prop = fuseki_process.get_or_create(record, qstr, upstr)
         subj_id = sc_prop['scopedProperty']
     new_val = {'mr:subject':subj_id}
     if value.get('mr:object'):
@@ -654,20 +665,20 @@ def _get_value(value):
         else:
             if isinstance(value.get('mr:object'), dict):
                 po_dict = value['mr:object']['mr:hasProperty']
-                qstr, instr = metocean.Property.sparql_creator(po_dict)
-                oprop = fuseki_process.create(qstr, instr)
+                record, qstr, upstr = metocean.Property.sparql_get_or_create(po_dict)
+                oprop = fuseki_process.get_or_create(record, qstr, upstr)
                 po_dict = {'mr:hasProperty':oprop['property'],
                            'mr:scope':value['mr:object']['mr:scope']}
-                qstr, instr = metocean.ScopedProperty.sparql_creator(po_dict)
-                o_sc_prop = fuseki_process.create(qstr, instr)
+                record, qstr, upstr = metocean.ScopedProperty.sparql_get_or_create(po_dict)
+                o_sc_prop = fuseki_process.get_or_create(record, qstr, upstr)
                 obj_id = o_sc_prop['scopedProperty']
             else:
                 obj_id = value.get('mr:object')
         new_val['mr:object'] = obj_id
     if value.get('mr:operator'):
         new_val['mr:operator'] = value.get('mr:operator')
-    qstr, instr = metocean.Value.sparql_creator(new_val)
-    value = fuseki_process.create(qstr, instr)
+    record, qstr, upstr = metocean.Value.sparql_get_or_create(new_val)
+    value = fuseki_process.get_or_create(record, qstr, upstr)
     v_id = value['value']
     return v_id
         
@@ -696,8 +707,8 @@ def value_maps(request):
         for valuemap in requestor.get('mr:hasValueMap',[]):
             vmap_dict = {'mr:source':_get_value(valuemap['mr:source']),
                          'mr:target':_get_value(valuemap['mr:target'])}
-            qstr, instr = metocean.ValueMap.sparql_creator(vmap_dict)
-            vmap = fuseki_process.create(qstr, instr)
+            record, qstr, upstr = metocean.ValueMap.sparql_get_or_create(vmap_dict)
+            vmap = fuseki_process.get_or_create(record, qstr, upstr)
             valuemap['valueMap'] = vmap['valueMap']
             #value['value'] = val_id
         url = url_qstr(reverse('mapping_edit'),
@@ -928,7 +939,11 @@ def mapping_edit(request):
                                                                [])])}
         map_id = requestor.get('mapping')
         if map_id:
-            qstr = metocean.Mapping.sparql_retriever(map_id, valid=False)
+            # Edit the current version of a mapping which has been replaced.
+            map_id = fuseki_process.mapping_head(map_id)
+            requestor['mapping'] = map_id
+            qstr = metocean.Mapping.sparql_retriever(map_id, valid=False,
+                                                     rep=False)
             mapping = fuseki_process.retrieve(qstr)
             ## quick example of dot notation, needs refactor
             amap = mapping.copy()
@@ -1010,9 +1025,7 @@ def process_form(form, requestor_path):
         mapping_p_o['mr:hasValueMap'] = ['%s' % vm for vm in
                                   data['valueMaps'].split('&')]
 
-    mapping = mapping_p_o
-    qstr, instr = metocean.Mapping.sparql_creator(mapping_p_o)
-    mapping = fuseki_process.create(qstr, instr)
+    mapping = fuseki_process.create_mapping(mapping_p_o)
     map_id = mapping['mapping']
 
     return map_id
@@ -1143,17 +1156,31 @@ def search_maps(request):
     if requestor_path == '':
         requestor_path = '[]'
     prop_list = json.loads(requestor_path)
-    mappings = fuseki_process.mapping_by_properties(prop_list)
+    try:
+        page = max(int(request.GET.get('page', 0)), 0)
+    except ValueError:
+        page = 0
+    # Ask for one more mapping than a page, to know if there is another.
+    mappings = fuseki_process.mapping_by_properties(prop_list,
+                                                    offset=page * SEARCH_PAGE,
+                                                    limit=SEARCH_PAGE + 1)
+    more = len(mappings) > SEARCH_PAGE
+    mappings = mappings[:SEARCH_PAGE]
     mapurls = {'label': 'These mappings contain the search properties',
                'mappings':[]}
-    for amap in mappings:
-        qstr = metocean.Mapping.sparql_retriever(amap)
-        mapping = fuseki_process.retrieve(qstr)
-        referrer = fuseki_process.structured_mapping(mapping).json_referrer()
-        map_json = json.dumps(referrer)
+    for mapping in fuseki_process.mappings_by_uri(mappings):
+        map_json = json.dumps(mapping.json_referrer())
         url = url_qstr(reverse('mapping_edit'), ref=map_json)
         label = 'mapping'
         mapurls['mappings'].append({'url':url, 'label':label})
+    if page > 0:
+        url = url_qstr(reverse('search_maps'), ref=requestor_path,
+                       page=page - 1)
+        mapurls['mappings'].append({'url':url, 'label':'previous page'})
+    if more:
+        url = url_qstr(reverse('search_maps'), ref=requestor_path,
+                       page=page + 1)
+        mapurls['mappings'].append({'url':url, 'label':'next page'})
     context_dict = {'invalid': [mapurls]}  
     context = RequestContext(request, context_dict)
     response = render_to_response('select_list.html', context)
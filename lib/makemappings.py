@@ -16,141 +16,32 @@
 # along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
 
 
-import copy
+"""
+Import the Iris 1.1 UM, CF and GRIB mappings into the metOcean triple
+store, replacing the metarelate.net static data.
+
+"""
+
+import argparse
 import datetime
 import glob
-import time
 
-import iris.fileformats.um_cf_map as umcf
-
-import metocean.fuseki as fu
-import metocean.queries as moq
+import metocean.importer as importer
 import metocean.prefixes as prefixes
 
 import moreumcf
 
-gribParams = {}
-end=False
-with open('grib2paramrules', 'r') as gribp:
-    for line in gribp.readlines():
-        if line.startswith('IF'):
-            container = {}
-            end = False
-        elif line.startswith('THEN'):
-            end=False
-        elif line.startswith('grib'):
-            elems = line.split('==')
-            container[elems[0].split('.')[1].strip()] = elems[1].strip()
-        elif line.startswith('CM'):
-            #CMAttribute("standard_name", "potential_temperature")
-            #CMAttribute("units", "K")
-            line = line.split('CMAttribute("')[1]
-            line = line.split('")')[0]
-            elems=line.split('", "')
-            container[elems[0]] = elems[1]
-        else:
-            end = True
-        #print container, end
-        if container.has_key('standard_name') and end is True:
-            if gribParams.has_key(container['standard_name']):
-                raise ValueError('got this s_n')
-            else:
-                gribParams[container['standard_name']] = {}
-                for key, elem in container.iteritems():
-                    gribParams[container['standard_name']][key] = elem
-            end=False
-
-umcfdict = dict(umcf.STASH_TO_CF, **moreumcf.MOSIG_STASH_TO_CF)
-
-
-linkages = []
-
-fcuri = 'http://reference.metoffice.gov.uk/def/um/fieldcode/'
-
-
-
-for fc,cf in umcf.LBFC_TO_CF.iteritems():
-    adict = {}
-    adict['mr:target'] = {'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/cf>'],
-                       'mr:hasProperty':[{'mr:name':'cfm:standard_name', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfsn:%s' % cf[0]},
-                    {'mr:name':'cfm:units', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'"%s"' % cf[1]},
-                    {'mr:name':'cfm:type', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfm:Field'}]}
-    if umcf.CF_TO_LBFC.has_key(cf) and umcf.CF_TO_LBFC[cf] == fc:
-        adict['mr:invertible'] = '"True"'
-    else:
-        adict['mr:invertible'] = '"False"'
-    adict['mr:source'] = {'mr:hasProperty':[{'mr:name':'moumdpF3:lbfc', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'mofc:%s' % fc}],
-                       'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/um>']}
-    linkages.append(adict)
-
-for cf,fc in umcf.CF_TO_LBFC.iteritems():
-    if not (umcf.LBFC_TO_CF.has_key(fc) and umcf.LBFC_TO_CF[fc] == cf):
-        adict = {}
-        adict['mr:source'] = {'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/cf>'],
-                       'mr:hasProperty':[{'mr:name':'cfm:standard_name', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfsn:%s' % cf[0]},
-                    {'mr:name':'cfm:units', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'"%s"' % cf[1]},
-                    {'mr:name':'cfm:type', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfm:Field'}]}
-        adict['mr:target'] = {'mr:hasProperty':[{'mr:name':'moumdpF3:lbfc', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'mofc:%i' % fc}],
-                           'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/um>']}
-        adict['mr:invertible'] = '"False"'
-        linkages.append(adict)
-
-
-
-for stash,cf in umcfdict.iteritems():
-    adict = {}
-    adict['mr:target'] = {'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/cf>'],
-                       'mr:hasProperty':[{'mr:name':'cfm:standard_name', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfsn:%s' % cf[0]},
-                    {'mr:name':'cfm:units', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'"%s"' % cf[1]},
-                    {'mr:name':'cfm:type', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfm:Field'}]}
-    adict['mr:invertible'] = '"False"'
-    adict['mr:source'] = {'mr:hasProperty':[{'mr:name':'moumdpF3:stash', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'moStCon:%s' % stash}],
-                       'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/um>']}
-    linkages.append(adict)
-
-#griburi = 'http://codes.wmo.int/grib/2/codeflag/4.2'
-
-for sn,gribcf in gribParams.iteritems():
-    adict = {}
-    adict['mr:target'] = {'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/cf>'],
-                       'mr:hasProperty':[{'mr:name':'cfm:standard_name', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfsn:%s' % gribcf['standard_name']},
-                    {'mr:name':'cfm:units', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'"%s"' % gribcf['units']},
-                    {'mr:name':'cfm:type', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfm:Field'}]}
-    adict['mr:invertible'] = '"True"'
-    adict['mr:source'] = {'mr:hasProperty':[{'mr:name':'gribapi:editionNumber', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'2'},
-                                         {'mr:name':'gribapi:discipline', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'%s' % gribcf['discipline']},
-                                         {'mr:name':'gribapi:parameterCategory', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'%s' % gribcf['parameterCategory']},
-                                         {'mr:name':'gribapi:parameterNumber', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'%s' % gribcf['parameterNumber']}],
-                       'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/grib>']}
-    linkages.append(adict)
-    
-
-adict = {}
-adict['mr:target'] = {'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/cf>'],
-                       'mr:hasProperty':[{'mr:name':'cfm:standard_name', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfsn:%s' % 'eastward_wind'},
-                    {'mr:name':'cfm:units', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'"%s"' % 'm s-1'},
-                    {'mr:name':'cfm:type', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfm:Field'}]}
-adict['mr:source'] = {'mr:hasProperty':[{'mr:name':'moumdpF3:stash', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'moStCon:%s' % 'm01s00i002'}],
-                       'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/um>']}
-adict['mr:invertible'] = '"False"'
-linkages.append(adict)
-
-adict = {}
-adict['mr:target'] = {'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/cf>'],
-                       'mr:hasProperty':[{'mr:name':'cfm:standard_name', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfsn:%s' % 'northward_wind'},
-                    {'mr:name':'cfm:units', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'"%s"' % 'm s-1'},
-                    {'mr:name':'cfm:type', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'cfm:Field'}]}
-adict['mr:source'] = {'mr:hasProperty':[{'mr:name':'moumdpF3:stash', 'mr:operator':'<http://www.openmath.org/cd/relation1.xhtml#eq>', 'rdf:value':'moStCon:%s' % 'm01s00i003'}],
-                       'mr:hasFormat':['<http://www.metarelate.net/metOcean/format/um>']}
-adict['mr:invertible'] = '"False"'
-linkages.append(adict)
-
-
-# print linkages
-# print len(linkages)
-
-
-#print len(linkages)
+
+# Linkages which are not provided by the Iris tables.
+WIND_LINKAGES = [
+    importer.linkage('um', [('moumdpF3:stash', 'moStCon:m01s00i002')], 'cf',
+                     [('cfm:standard_name', 'cfsn:eastward_wind'),
+                      ('cfm:units', '"m s-1"'),
+                      ('cfm:type', 'cfm:Field')]),
+    importer.linkage('um', [('moumdpF3:stash', 'moStCon:m01s00i003')], 'cf',
+                     [('cfm:standard_name', 'cfsn:northward_wind'),
+                      ('cfm:units', '"m s-1"'),
+                      ('cfm:type', 'cfm:Field')])]
 
 ttl_str = '''#(C) British Crown Copyright 2011 - 2012, Met Office This file is part of metOcean-mapping.
 #metOcean-mapping is free software: you can redistribute it and/or modify it under the terms of the
@@ -161,53 +52,70 @@ ttl_str = '''#(C) British Crown Copyright 2011 - 2012, Met Office This file is p
 #GNU Lesser General Public License along with metOcean-mapping. If not, see http://www.gnu.org/licenses/."
 
 '''
-pre = prefixes.Prefixes()
-
-for st_file in glob.glob('../staticData/metarelate.net/*.ttl'):
-    if st_file.split('/')[-1] != 'contacts.ttl':
-        with open(st_file, 'w') as st:
-            st.write(ttl_str)
-            st.write(pre.turtle)
-
-
-globalDateTime = datetime.datetime.now().isoformat()
-mapping_p_o = {}
-mapping_p_o['dc:creator'] = ['<http://www.metarelate.net/metOcean/people/marqh>']
-mapping_p_o['dc:date'] = ['"%s"^^xsd:dateTime' % globalDateTime]
-mapping_p_o['mr:status'] = ['"Draft"']
-mapping_p_o['skos:note'] = ['"Imported from external mapping resource: Iris 1.1"']
-mapping_p_o['mr:reason'] = ['"new mapping"']
-
-
-
-with fu.FusekiServer(3131) as fu_p:
-    fu_p.load()
-    print 'load complete'
-    for newlink in linkages:
-        map_dict = copy.deepcopy(mapping_p_o)
-        map_dict['mr:invertible'] = newlink['mr:invertible']
-        st = ['mr:source', 'mr:target']
-        for pref in st:
-            members = newlink[pref]['mr:hasProperty']
-            memberids = []
-            for v_dict in members:
-                prop_res = moq.get_property(fu_p, v_dict)
-                if prop_res:
-                    prop_id = '%s' % prop_res['property']
-                else:
-                    raise ValueError('%i results returned from get_value %s' %
-                                     (len(val_res), str(val_res)))
-                memberids.append(prop_id)
-            fc_dict = {'mr:hasFormat' : newlink[pref]['mr:hasFormat'],
-                       'mr:hasProperty' : memberids}
-            fc_res = moq.get_component(fu_p, fc_dict)
-            if fc_res:
-                fcID = '%s' % fc_res['component']
-            else:
-                raise ValueError('%i results returned from get_component %s' %
-                                 (len(fc_res), str(fc_res)))
-            map_dict[pref] = fcID
-        map_res = moq.create_mapping(fu_p, map_dict)
-    print 'saving cached changes'
-    fu_p.save()
 
+
+def clear_static_data():
+    """
+    Replace each metarelate.net static data file, other than the contacts,
+    with only the copyright header and prefixes.
+
+    """
+    pre = prefixes.Prefixes()
+    for st_file in glob.glob('../staticData/metarelate.net/*.ttl'):
+        if st_file.split('/')[-1] != 'contacts.ttl':
+            with open(st_file, 'w') as st:
+                st.write(ttl_str)
+                st.write(pre.turtle)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--grib', default='grib2paramrules',
+                        help='the Iris GRIB edition 2 parameter rules file')
+    parser.add_argument('--csv', nargs='*', default=[],
+                        help='additional CSV files of linkages')
+    parser.add_argument('--processes', type=int,
+                        help='the number of worker processes')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='resolve the mappings without writing them')
+    parser.add_argument('--offline', action='store_true',
+                        help='write the mappings straight to the static '
+                        'data Turtle files, without a triple store')
+    args = parser.parse_args()
+
+    readers = [importer.IrisReader(moreumcf.MOSIG_STASH_TO_CF),
+               importer.GribParamRulesReader(args.grib),
+               WIND_LINKAGES]
+    readers.extend(importer.CSVReader(fname) for fname in args.csv)
+
+    globalDateTime = datetime.datetime.now().isoformat()
+    mapping_p_o = {}
+    mapping_p_o['dc:creator'] = ['<http://www.metarelate.net/metOcean/people/marqh>']
+    mapping_p_o['dc:date'] = ['"%s"^^xsd:dateTime' % globalDateTime]
+    mapping_p_o['mr:status'] = ['"Draft"']
+    mapping_p_o['skos:note'] = ['"Imported from external mapping resource: Iris 1.1"']
+    mapping_p_o['mr:reason'] = ['"new mapping"']
+
+    if args.dry_run:
+        importer.Importer(None, readers, mapping_p_o,
+                          processes=args.processes, dry_run=True).run()
+    elif args.offline:
+        clear_static_data()
+        importer.Importer(None, readers, mapping_p_o,
+                          processes=args.processes,
+                          turtle_dir='../staticData').run()
+    else:
+        # The triple store is only required, and configured, online.
+        import metocean.fuseki as fu
+        clear_static_data()
+        with fu.FusekiServer() as fu_p:
+            fu_p.load()
+            print 'load complete'
+            importer.Importer(fu_p, readers, mapping_p_o,
+                              processes=args.processes).run()
+            print 'saving cached changes'
+            fu_p.save()
+
+
+if __name__ == '__main__':
+    main()
@@ -15,7 +15,7 @@
 # You should have received a copy of the GNU Lesser General Public License
 # along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
 
-from collections import Iterable, MutableMapping, namedtuple
+from collections import Iterable, MutableMapping, namedtuple, OrderedDict
 import hashlib
 import os
 from urlparse import urlparse
@@ -35,6 +35,10 @@ site_config = {
 
 update(site_config)
 
+# The named graph of the current mappings, those which no other mapping
+# replaces. It is derived from the mappings graph, so is not saved.
+CURRENT_MAPPINGS = '<http://metarelate.net/currentMappings>'
+
 
 class _ComponentMixin(object):
     """
@@ -182,7 +186,7 @@ class Mapping(_DotMixin, namedtuple('Mapping', 'uri source target')):
         if valid:
             vstr += '\tFILTER (?status NOT IN ("Deprecated", "Broken"))'
         if rep:
-            vstr += '\n\tMINUS {?mapping ^dc:replaces+ ?anothermap}'
+            vstr += '\n\t%s' % sparql_current_pattern('?mapping')
         qstr = '''SELECT ?mapping ?source ?target ?invertible ?replaces ?status
                          ?note ?reason ?date ?creator ?inverted
         (GROUP_CONCAT(DISTINCT(?owner); SEPARATOR = '&') AS ?owners)
@@ -213,8 +217,7 @@ class Mapping(_DotMixin, namedtuple('Mapping', 'uri source target')):
         return qstr
 
     @staticmethod
-    def sparql_creator(po_dict):
-        subj_pref = 'http://www.metarelate.net/metOcean/mapping'
+    def _sparql_validate(po_dict):
         allowed_preds = set(('mr:source', 'mr:target', 'mr:invertible',
                                 'dc:replaces', 'mr:hasValueMap', 'mr:status',
                                 'skos:note', 'mr:reason', 'dc:date', 'dc:creator',
@@ -238,20 +241,17 @@ class Mapping(_DotMixin, namedtuple('Mapping', 'uri source target')):
         singular_preds = set(('mr:source', 'mr:target', 'mr:invertible',
                                  'dc:replaces', 'mr:status', 'skos:note',
                                  'mr:reason', 'dc:date', 'dc:creator'))
-        search_string = ''
-        for pred in po_dict:
-            if isinstance(po_dict[pred], list):
-                if pred in singular_preds and len(po_dict[pred]) != 1:
-                    ec = 'create_mapping limits {} to one statement per record '
-                    ec = ec.format(pred)
-                    raise ValueError(ec)
-                else:
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-            else:
-                search_string += '''
-                %s %s ;''' % (pred, po_dict[pred])
+        for pred in singular_preds.intersection(preds):
+            if isinstance(po_dict[pred], list) and len(po_dict[pred]) != 1:
+                ec = 'create_mapping limits {} to one statement per record '
+                ec = ec.format(pred)
+                raise ValueError(ec)
+
+    @staticmethod
+    def sparql_creator(po_dict):
+        Mapping._sparql_validate(po_dict)
+        subj_pref = 'http://www.metarelate.net/metOcean/mapping'
+        search_string = _sparql_statements(po_dict)
         sha1 = make_hash(po_dict, ['''dc:date'''])
         mapping = '%s/%s' % (subj_pref, sha1)
         qstr = '''SELECT ?mapping
@@ -266,10 +266,31 @@ class Mapping(_DotMixin, namedtuple('Mapping', 'uri source target')):
                     %s
                     mr:saveCache "True" .
         }
-        }
-        ''' % (mapping, search_string)
+        } ;
+        %s
+        ''' % (mapping, search_string,
+               sparql_current_update('<%s>' % mapping))
         return qstr, instr
 
+    @staticmethod
+    def hash_record(po_dict):
+        """
+        Return the content hash uri, graph and rdf:type of the record
+        described by the po_dict (object list) dictionary.
+
+        """
+        Mapping._sparql_validate(po_dict)
+        sha1 = make_hash(po_dict, ['''dc:date'''])
+        uri = '<http://www.metarelate.net/metOcean/mapping/%s>' % sha1
+        return uri, '<http://metarelate.net/mappings.ttl>', 'mr:Mapping'
+
+    @staticmethod
+    def sparql_get_or_create(po_dict):
+        uri, graph, rdf_type = Mapping.hash_record(po_dict)
+        upstr = sparql_insert_record(graph, uri, rdf_type, po_dict)
+        # A mapping is only ever identified by its content hash.
+        return {'mapping': uri}, None, upstr
+
 
 class Component(_ComponentMixin, _DotMixin, MutableMapping):
     """
@@ -425,7 +446,7 @@ class Component(_ComponentMixin, _DotMixin, MutableMapping):
         return qstr
 
     @staticmethod
-    def sparql_creator(po_dict):
+    def _sparql_validate(po_dict):
         allowed_prefixes = set(('mr:hasFormat','mr:hasComponent', 'mr:hasProperty',
                                 'dc:requires', 'dc:mediator'))
         preds = set(po_dict)
@@ -434,47 +455,23 @@ class Component(_ComponentMixin, _DotMixin, MutableMapping):
                  'a component record {}'
             ec = ec.format(preds, allowed_prefixes)
             raise ValueError(ec)
+        mediator = po_dict.get('dc:mediator')
+        if isinstance(mediator, list) and len(mediator) != 1:
+            ec = 'get_format_concept only accepts 1 dc:mediator statement'\
+                 ' The po_dict in this case is not valid {} '
+            ec = ec.format(str(po_dict))
+            raise ValueError(ec)
+
+    @staticmethod
+    def sparql_creator(po_dict):
+        Component._sparql_validate(po_dict)
         subj_pref = 'http://www.metarelate.net/metOcean/component'
-        search_string = ''
-        n_propertys = 0
-        n_components = 0
-        n_reqs = 0
-        for pred in po_dict:
-            if isinstance(po_dict[pred], list):
-                if pred == 'mr:format' and len(po_dict[pred]) != 1:
-                    ec = 'get_format_concept only accepts 1 mr:format statement '\
-                         ' The po_dict in this case is not valid {} '
-                    ec = ec.format(str(po_dict))
-                    raise ValueError(ec)
-                elif pred == 'dc:mediator' and len(po_dict[pred]) != 1:
-                    ec = 'get_format_concept only accepts 1 dc:mediator statement'\
-                         ' The po_dict in this case is not valid {} '
-                    ec = ec.format(str(po_dict))
-                    raise ValueError(ec)
-                elif pred == 'dc:requires':
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-                        n_reqs +=1
-                elif pred == 'mr:hasProperty':
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-                        n_propertys +=1
-                elif pred == 'mr:hasComponent':
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-                        n_components +=1
-                else:
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-            else:
-                search_string += '''
-                %s %s ;''' % (pred, po_dict[pred])
-                if pred == 'skos:member':
-                    n_members =1
+        search_string = _sparql_statements(po_dict)
+        counts = dict((pred, len(objs)) for pred, objs in po_dict.iteritems()
+                      if isinstance(objs, list))
+        n_propertys = counts.get('mr:hasProperty', 0)
+        n_components = counts.get('mr:hasComponent', 0)
+        n_reqs = counts.get('dc:requires', 0)
         if search_string != '':
             qstr = '''SELECT ?component ?format
             WHERE { {
@@ -509,6 +506,27 @@ class Component(_ComponentMixin, _DotMixin, MutableMapping):
             ''' % (subj_pref, sha1, search_string)
         return qstr, instr
 
+    @staticmethod
+    def hash_record(po_dict):
+        """
+        Return the content hash uri, graph and rdf:type of the record
+        described by the po_dict (object list) dictionary.
+
+        """
+        Component._sparql_validate(po_dict)
+        if not po_dict:
+            raise ValueError('A component record requires statements.')
+        sha1 = make_hash(po_dict)
+        uri = '<http://www.metarelate.net/metOcean/component/%s>' % sha1
+        return uri, '<http://metarelate.net/concepts.ttl>', 'mr:Component'
+
+    @staticmethod
+    def sparql_get_or_create(po_dict):
+        uri, graph, rdf_type = Component.hash_record(po_dict)
+        qstr = sparql_match_records(graph, rdf_type, [(uri, po_dict)])
+        upstr = sparql_insert_record(graph, uri, rdf_type, po_dict)
+        return {'component': uri}, qstr, upstr
+
 
 class Concept(Component):
     """
@@ -910,9 +928,7 @@ class Property(_DotMixin, namedtuple('Property', 'uri name value operator')):
         return qstr
 
     @staticmethod
-    def sparql_creator(po_dict):
-        qstr = ''
-        instr = ''
+    def _sparql_validate(po_dict):
         allowed_predicates = set(('mr:name','rdf:value',
                                 'mr:operator', 'mr:hasComponent'))
         single_predicates = set(('mr:name', 'mr:operator', 'mr:hasComponent'))
@@ -922,6 +938,20 @@ class Property(_DotMixin, namedtuple('Property', 'uri name value operator')):
                  'for a value record {}'
             ec = ec.format(preds, allowed_predicates)
             raise ValueError(ec)
+        for pred in single_predicates.intersection(preds):
+            if isinstance(po_dict[pred], list) and len(po_dict[pred]) != 1:
+                ec = 'get_property only accepts 1 statement per predicate {}'
+                ec = ec.format(str(po_dict))
+                raise ValueError(ec)
+
+    @staticmethod
+    def sparql_creator(po_dict):
+        qstr = ''
+        instr = ''
+        Property._sparql_validate(po_dict)
+        allowed_predicates = set(('mr:name','rdf:value',
+                                'mr:operator', 'mr:hasComponent'))
+        preds = set(po_dict)
         subj_pref = 'http://www.metarelate.net/metOcean/property'
         count_string = ''
         search_string = ''
@@ -930,22 +960,17 @@ class Property(_DotMixin, namedtuple('Property', 'uri name value operator')):
         block_string = ''
         for pred in allowed_predicates.intersection(preds):
             if isinstance(po_dict[pred], list):
-                if len(po_dict[pred]) != 1 and pred in single_predicates:
-                    ec = 'get_property only accepts 1 statement per predicate {}'
-                    ec = ec.format(str(po_dict))
-                    raise ValueError(ec)
-                else:
-                    counter = 0
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-                        counter +=1
-                    assign_string += '''
-                    %s ?%s ;''' % (pred, pred.split(':')[-1])
-                    count_string += '''COUNT(DISTINCT(?%(p)s)) AS ?%(p)ss
-                    ''' % {'p':pred.split(':')[-1]}
-                    filter_string += '''
-                    FILTER(?%ss = %i)''' % (pred.split(':')[-1], counter)
+                counter = 0
+                for obj in po_dict[pred]:
+                    search_string += '''
+                    %s %s ;''' % (pred, obj)
+                    counter +=1
+                assign_string += '''
+                %s ?%s ;''' % (pred, pred.split(':')[-1])
+                count_string += '''COUNT(DISTINCT(?%(p)s)) AS ?%(p)ss
+                ''' % {'p':pred.split(':')[-1]}
+                filter_string += '''
+                FILTER(?%ss = %i)''' % (pred.split(':')[-1], counter)
             else:
                 search_string += '''
                 %s %s ;''' % (pred, po_dict[pred])
@@ -987,6 +1012,27 @@ class Property(_DotMixin, namedtuple('Property', 'uri name value operator')):
             ''' % (subj_pref, sha1, search_string)
         return qstr, instr
 
+    @staticmethod
+    def hash_record(po_dict):
+        """
+        Return the content hash uri, graph and rdf:type of the record
+        described by the po_dict (object list) dictionary.
+
+        """
+        Property._sparql_validate(po_dict)
+        if not po_dict:
+            raise ValueError('A property record requires statements.')
+        sha1 = make_hash(po_dict)
+        uri = '<http://www.metarelate.net/metOcean/property/%s>' % sha1
+        return uri, '<http://metarelate.net/concepts.ttl>', 'mr:Property'
+
+    @staticmethod
+    def sparql_get_or_create(po_dict):
+        uri, graph, rdf_type = Property.hash_record(po_dict)
+        qstr = sparql_match_records(graph, rdf_type, [(uri, po_dict)])
+        upstr = sparql_insert_record(graph, uri, rdf_type, po_dict)
+        return {'property': uri}, qstr, upstr
+
 
 class Item(_DotMixin, namedtuple('Item', 'data notation')):
     """
@@ -1087,9 +1133,7 @@ class ValueMap(object):
         return qstr
 
     @staticmethod
-    def sparql_creator(po_dict):
-        qstr = ''
-        instr = ''
+    def _sparql_validate(po_dict):
         allowed_preds = set(('mr:source','mr:target'))
         preds = set(po_dict)
         if not preds == allowed_preds:
@@ -1098,21 +1142,19 @@ class ValueMap(object):
                     {}'''
             ec = ec.format(preds, allowed_preds)
             raise ValueError(ec)
-        subj_pref = 'http://www.metarelate.net/metOcean/valueMap'
-        search_string = ''
         for pred in po_dict:
-            if isinstance(po_dict[pred], list):
-                if len(po_dict[pred]) != 1:
-                    ec = 'get_format_concept only accepts 1 mr:format statement }'
-                    ec = ec.format(po_dict)
-                    raise ValueError(ec)
-                else:
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-            else:
-                search_string += '''
-                %s %s ;''' % (pred, po_dict[pred])
+            if isinstance(po_dict[pred], list) and len(po_dict[pred]) != 1:
+                ec = 'get_format_concept only accepts 1 mr:format statement }'
+                ec = ec.format(po_dict)
+                raise ValueError(ec)
+
+    @staticmethod
+    def sparql_creator(po_dict):
+        qstr = ''
+        instr = ''
+        ValueMap._sparql_validate(po_dict)
+        subj_pref = 'http://www.metarelate.net/metOcean/valueMap'
+        search_string = _sparql_statements(po_dict)
         if search_string != '':
             qstr = '''SELECT ?valueMap 
             WHERE{
@@ -1133,6 +1175,25 @@ class ValueMap(object):
             ''' % (subj_pref, sha1, search_string)
         return qstr, instr
 
+    @staticmethod
+    def hash_record(po_dict):
+        """
+        Return the content hash uri, graph and rdf:type of the record
+        described by the po_dict (object list) dictionary.
+
+        """
+        ValueMap._sparql_validate(po_dict)
+        sha1 = make_hash(po_dict)
+        uri = '<http://www.metarelate.net/metOcean/valueMap/%s>' % sha1
+        return uri, '<http://metarelate.net/concepts.ttl>', 'mr:ValueMap'
+
+    @staticmethod
+    def sparql_get_or_create(po_dict):
+        uri, graph, rdf_type = ValueMap.hash_record(po_dict)
+        qstr = sparql_match_records(graph, rdf_type, [(uri, po_dict)])
+        upstr = sparql_insert_record(graph, uri, rdf_type, po_dict)
+        return {'valueMap': uri}, qstr, upstr
+
 
 class Value(object):
     @staticmethod
@@ -1150,9 +1211,7 @@ class Value(object):
         return qstr
 
     @staticmethod
-    def sparql_creator(po_dict):
-        qstr = ''
-        instr = ''
+    def _sparql_validate(po_dict):
         allowed_preds = set(('mr:operator','mr:subject', 'mr:object'))
         preds = set(po_dict)
         if not preds.issubset(allowed_preds):
@@ -1161,21 +1220,19 @@ class Value(object):
                     {}'''
             ec = ec.format(preds, allowed_preds)
             raise ValueError(ec)
-        subj_pref = 'http://www.metarelate.net/metOcean/value'
-        search_string = ''
         for pred in po_dict:
-            if isinstance(po_dict[pred], list):
-                if len(po_dict[pred]) != 1:
-                    ec = 'get_value only accepts 1 mr:format statement }'
-                    ec = ec.format(po_dict)
-                    raise ValueError(ec)
-                else:
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-            else:
-                search_string += '''
-                %s %s ;''' % (pred, po_dict[pred])
+            if isinstance(po_dict[pred], list) and len(po_dict[pred]) != 1:
+                ec = 'get_value only accepts 1 mr:format statement }'
+                ec = ec.format(po_dict)
+                raise ValueError(ec)
+
+    @staticmethod
+    def sparql_creator(po_dict):
+        qstr = ''
+        instr = ''
+        Value._sparql_validate(po_dict)
+        subj_pref = 'http://www.metarelate.net/metOcean/value'
+        search_string = _sparql_statements(po_dict)
         if search_string != '':
             qstr = '''SELECT ?value
             WHERE{
@@ -1196,6 +1253,27 @@ class Value(object):
             ''' % (subj_pref, sha1, search_string)
         return qstr, instr
 
+    @staticmethod
+    def hash_record(po_dict):
+        """
+        Return the content hash uri, graph and rdf:type of the record
+        described by the po_dict (object list) dictionary.
+
+        """
+        Value._sparql_validate(po_dict)
+        if not po_dict:
+            raise ValueError('A value record requires statements.')
+        sha1 = make_hash(po_dict)
+        uri = '<http://www.metarelate.net/metOcean/value/%s>' % sha1
+        return uri, '<http://metarelate.net/concepts.ttl>', 'mr:Value'
+
+    @staticmethod
+    def sparql_get_or_create(po_dict):
+        uri, graph, rdf_type = Value.hash_record(po_dict)
+        qstr = sparql_match_records(graph, rdf_type, [(uri, po_dict)])
+        upstr = sparql_insert_record(graph, uri, rdf_type, po_dict)
+        return {'value': uri}, qstr, upstr
+
 
 class ScopedProperty(object):
     @staticmethod
@@ -1212,9 +1290,7 @@ class ScopedProperty(object):
         return qstr
 
     @staticmethod
-    def sparql_creator(po_dict):
-        qstr = ''
-        instr = ''
+    def _sparql_validate(po_dict):
         allowed_preds = set(('mr:scope','mr:hasProperty'))
         preds = set(po_dict)
         if not preds == allowed_preds:
@@ -1223,21 +1299,19 @@ class ScopedProperty(object):
                     {}'''
             ec = ec.format(preds, allowed_preds)
             raise ValueError(ec)
-        subj_pref = 'http://www.metarelate.net/metOcean/scopedProperty'
-        search_string = ''
         for pred in po_dict:
-            if isinstance(po_dict[pred], list):
-                if len(po_dict[pred]) != 1:
-                    ec = 'get_scopedProperty only accepts 1 mr:format statement {}'
-                    ec = ec.format(po_dict)
-                    raise ValueError(ec)
-                else:
-                    for obj in po_dict[pred]:
-                        search_string += '''
-                        %s %s ;''' % (pred, obj)
-            else:
-                search_string += '''
-                %s %s ;''' % (pred, po_dict[pred])
+            if isinstance(po_dict[pred], list) and len(po_dict[pred]) != 1:
+                ec = 'get_scopedProperty only accepts 1 mr:format statement {}'
+                ec = ec.format(po_dict)
+                raise ValueError(ec)
+
+    @staticmethod
+    def sparql_creator(po_dict):
+        qstr = ''
+        instr = ''
+        ScopedProperty._sparql_validate(po_dict)
+        subj_pref = 'http://www.metarelate.net/metOcean/scopedProperty'
+        search_string = _sparql_statements(po_dict)
         if search_string != '':
             qstr = '''SELECT ?scopedProperty
             WHERE{
@@ -1258,6 +1332,25 @@ class ScopedProperty(object):
             ''' % (subj_pref, sha1, search_string)
         return qstr, instr
 
+    @staticmethod
+    def hash_record(po_dict):
+        """
+        Return the content hash uri, graph and rdf:type of the record
+        described by the po_dict (object list) dictionary.
+
+        """
+        ScopedProperty._sparql_validate(po_dict)
+        sha1 = make_hash(po_dict)
+        uri = '<http://www.metarelate.net/metOcean/scopedProperty/%s>' % sha1
+        return uri, '<http://metarelate.net/concepts.ttl>', 'mr:Property'
+
+    @staticmethod
+    def sparql_get_or_create(po_dict):
+        uri, graph, rdf_type = ScopedProperty.hash_record(po_dict)
+        qstr = sparql_match_records(graph, rdf_type, [(uri, po_dict)])
+        upstr = sparql_insert_record(graph, uri, rdf_type, po_dict)
+        return {'scopedProperty': uri}, qstr, upstr
+
 
 class Mediator(object):
     @staticmethod
@@ -1314,6 +1407,290 @@ class Mediator(object):
         return qstr, instr
 
 
+def _sparql_statements(po_dict):
+    """
+    Return the SPARQL predicate object list of the po_dict (object list)
+    dictionary, each statement terminated by a semicolon.
+
+    """
+    search_string = ''
+    for pred in po_dict:
+        if isinstance(po_dict[pred], list):
+            for obj in po_dict[pred]:
+                search_string += '''
+                %s %s ;''' % (pred, obj)
+        else:
+            search_string += '''
+            %s %s ;''' % (pred, po_dict[pred])
+    return search_string
+
+
+def _sparql_content(var, rdf_type, po_dict):
+    """
+    Return the SPARQL graph pattern which matches the subject variable to
+    a record of the rdf_type with exactly the po_dict statements, other
+    than its saveCache flag.
+
+    """
+    others = ''
+    for pred in sorted(po_dict):
+        objs = po_dict[pred]
+        if not isinstance(objs, list):
+            objs = [objs]
+        for obj in sorted(objs):
+            others += ''' &&
+            !(sameTerm(?p, %s) && sameTerm(?o, %s))''' % (pred, obj)
+    pattern = '''%(var)s a %(type)s ;%(statements)s
+        .
+        FILTER NOT EXISTS {
+            %(var)s ?p ?o .
+            FILTER (!sameTerm(?p, rdf:type) &&
+            !sameTerm(?p, mr:saveCache)%(others)s)
+        }''' % {'var': var, 'type': rdf_type,
+               'statements': _sparql_statements(po_dict), 'others': others}
+    return pattern
+
+
+def sparql_match_records(graph, rdf_type, candidates):
+    """
+    Return a SPARQL query for the ?key and ?record uris of each record of
+    the rdf_type in the graph with exactly the content of one of the
+    candidates, a list of (key uri, po_dict), ordered by key and record.
+
+    Many records of the static data predate content hash uris, so an
+    existing record with the content of a candidate need not have its
+    hash uri.
+
+    """
+    branches = ['''{
+        BIND(%s AS ?key)
+        %s
+        }''' % (key, _sparql_content('?record', rdf_type, po_dict))
+                for key, po_dict in candidates]
+    qstr = '''SELECT ?key ?record
+    WHERE {
+    GRAPH %s {
+        %s
+    }
+    }
+    ORDER BY ?key ?record
+    ''' % (graph, '\n        UNION\n        '.join(branches))
+    return qstr
+
+
+# The record types created by FusekiServer.bulk_create, in dependency
+# order, with the predicates of each which may reference a nested record.
+_BULK_RECORDS = OrderedDict([
+    ('property', (Property, {})),
+    ('component', (Component, {'mr:hasProperty': 'property',
+                               'mr:hasComponent': 'component'})),
+    ('mapping', (Mapping, {'mr:source': 'component',
+                           'mr:target': 'component'}))])
+
+
+def bulk_records():
+    """
+    Return an empty mapping of each record kind created by
+    :meth:`metocean.fuseki.FusekiServer.bulk_create`, in dependency order, to an ordered
+    mapping of record uris to their (graph, rdf:type, po_dict) content.
+
+    """
+    return OrderedDict((kind, OrderedDict()) for kind in _BULK_RECORDS)
+
+
+def bulk_record(kind, po_dict, records):
+    """
+    Return the uri of the record of the kind described by the po_dict,
+    having added its content, and that of any nested records, to the
+    records of each kind.
+
+    """
+    cls, nested = _BULK_RECORDS[kind]
+    po_dict = dict(po_dict)
+    for pred, nested_kind in nested.iteritems():
+        objs = po_dict.get(pred)
+        if isinstance(objs, dict):
+            po_dict[pred] = bulk_record(nested_kind, objs, records)
+        elif isinstance(objs, list):
+            po_dict[pred] = [bulk_record(nested_kind, obj, records)
+                             if isinstance(obj, dict) else obj
+                             for obj in objs]
+    uri, graph, rdf_type = cls.hash_record(po_dict)
+    records[kind].setdefault(uri, (graph, rdf_type, po_dict))
+    return uri
+
+
+def resolve_records(records, match):
+    """
+    Return a dictionary of the uri of each of the records of each kind,
+    from :func:`bulk_records`, to the uri of the record to use in its
+    place, having replaced the records which already exist with the same
+    content and rewritten the others to refer to the existing records.
+
+    The match function is called with an ordered mapping of uris to the
+    (graph, rdf:type, po_dict) content of records of one kind, and returns
+    a dictionary of those uris to the uris of the existing records with
+    the same content. A record which refers to an existing record in
+    place of its own has a new hash uri.
+
+    """
+    resolved = {}
+    for kind, kind_records in records.iteritems():
+        cls, nested = _BULK_RECORDS[kind]
+        pending = kind_records.items()
+        kind_records.clear()
+        while pending:
+            # A record which refers to a pending record of the same kind
+            # waits until that has been resolved.
+            waiting = set(uri for uri, _ in pending)
+            ready = OrderedDict()
+            hashed = []
+            later = []
+            for uri, (graph, rdf_type, po_dict) in pending:
+                po_dict = dict(po_dict)
+                refers = False
+                for pred, nested_kind in nested.iteritems():
+                    objs = po_dict.get(pred)
+                    if objs is None:
+                        continue
+                    if isinstance(objs, list):
+                        objs = [resolved.get(obj, obj) for obj in objs]
+                        refs = objs
+                    else:
+                        objs = resolved.get(objs, objs)
+                        refs = [objs]
+                    if nested_kind == kind and waiting.intersection(refs):
+                        refers = True
+                    po_dict[pred] = objs
+                if refers:
+                    later.append((uri, (graph, rdf_type, po_dict)))
+                    continue
+                new_uri, graph, rdf_type = cls.hash_record(po_dict)
+                hashed.append((uri, new_uri))
+                ready.setdefault(new_uri, (graph, rdf_type, po_dict))
+            matches = match(ready)
+            for uri, content in ready.iteritems():
+                if uri not in matches:
+                    kind_records.setdefault(uri, content)
+            for uri, new_uri in hashed:
+                resolved[uri] = matches.get(new_uri, new_uri)
+            pending = later
+    return resolved
+
+
+def record_updates(records):
+    """
+    Return the list of SPARQL updates which create each of the records
+    of each kind, in dependency order, unless they already exist.
+
+    """
+    return [sparql_insert_record(graph, uri, rdf_type, po_dict)
+            for kind_records in records.itervalues()
+            for uri, (graph, rdf_type, po_dict) in kind_records.iteritems()]
+
+
+def sparql_insert_record(graph, subject, rdf_type, po_dict):
+    """
+    Return a SPARQL update which inserts the record of the rdf_type with
+    the subject uri and the po_dict statements into the graph, unless
+    the graph already holds a record of that type with that subject or,
+    other than for a mapping, with exactly those statements.
+
+    The subject is the hash of the statements, but many records of the
+    static data predate content hash uris, so are matched by content. A
+    mapping is only identified by its hash, and also updates the current
+    mappings graph.
+
+    """
+    existing = ''
+    if rdf_type != 'mr:Mapping':
+        content = _sparql_content('?existing', rdf_type, po_dict)
+        existing = '''
+    OPTIONAL {
+    GRAPH %s {
+        %s
+    }
+    }
+    FILTER (!BOUND(?existing))''' % (graph, content)
+    upstr = '''INSERT {
+    GRAPH %(graph)s {
+    %(subject)s a %(type)s ;
+            %(statements)s
+            mr:saveCache "True" .
+    }
+    }
+    WHERE {
+    FILTER NOT EXISTS {
+    GRAPH %(graph)s { %(subject)s a %(type)s . }
+    }%(existing)s
+    }
+    ''' % {'graph': graph, 'subject': subject, 'type': rdf_type,
+           'statements': _sparql_statements(po_dict), 'existing': existing}
+    if rdf_type == 'mr:Mapping':
+        upstr += ' ;\n%s' % sparql_current_update(subject)
+    return upstr
+
+
+def sparql_current_pattern(var):
+    """
+    Return the SPARQL graph pattern which matches the mapping variable
+    only to current mappings, those which no other mapping replaces.
+
+    This is equivalent to, but far cheaper than, the property path
+    pattern MINUS {var ^dc:replaces+ ?anothermap}.
+
+    """
+    return 'GRAPH %s { %s a mr:Mapping . }' % (CURRENT_MAPPINGS, var)
+
+
+def sparql_current_update(mapping):
+    """
+    Return a SPARQL update which maintains the current mappings graph
+    for the newly created mapping uri, which is current unless replaced,
+    and which makes any mappings it replaces no longer current.
+
+    """
+    upstr = '''DELETE {
+    GRAPH %(current)s { ?replaced a mr:Mapping . }
+    }
+    WHERE {
+    GRAPH <http://metarelate.net/mappings.ttl> {
+    %(mapping)s dc:replaces ?replaced .
+    }
+    } ;
+    INSERT {
+    GRAPH %(current)s { %(mapping)s a mr:Mapping . }
+    }
+    WHERE {
+    GRAPH <http://metarelate.net/mappings.ttl> {
+    %(mapping)s a mr:Mapping .
+    FILTER NOT EXISTS { ?another dc:replaces %(mapping)s . }
+    }
+    }
+    ''' % {'current': CURRENT_MAPPINGS, 'mapping': mapping}
+    return upstr
+
+
+def sparql_current_rebuild():
+    """
+    Return a SPARQL update which rebuilds the current mappings graph from
+    all of the mappings.
+
+    """
+    upstr = '''DROP SILENT GRAPH %(current)s ;
+    INSERT {
+    GRAPH %(current)s { ?mapping a mr:Mapping . }
+    }
+    WHERE {
+    GRAPH <http://metarelate.net/mappings.ttl> {
+    ?mapping a mr:Mapping .
+    FILTER NOT EXISTS { ?another dc:replaces ?mapping . }
+    }
+    }
+    ''' % {'current': CURRENT_MAPPINGS}
+    return upstr
+
+
 def make_hash(pred_obj, omitted=None):
     """ creates and returns an sha-1 hash of the elements in the pred_obj
     (object list) dictionary
@@ -1323,7 +1700,8 @@ def make_hash(pred_obj, omitted=None):
     
     * pred_obj:
         A dictionary of predicates and lists of objects, or single objects
-        which will be used, in order, to construct the hash
+        which will be used to construct the hash. The objects of a list
+        are sorted, so the hash does not depend upon their order.
     * omitted:
         A list of predicate strings to be ignored when building the hash
         
@@ -1347,7 +1725,7 @@ def make_hash(pred_obj, omitted=None):
                 raise ValueError('make hash passed a predicate '
                                  'which is not of the form <prefix>:<item>')
             if isinstance(pred_obj[pred], list):
-                for obj in pred_obj[pred]:
+                for obj in sorted(pred_obj[pred]):
                     sha1.update(predicate)
                     sha1.update(obj)
             else:
@@ -0,0 +1,108 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides in-process caching of triple-store query results.
+
+"""
+
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """
+    A thread safe mapping of bounded size, which evicts the least
+    recently used entry when full.
+
+    The number of cache hits and misses are recorded by :meth:`get`.
+
+    """
+    def __init__(self, size):
+        if size < 1:
+            msg = 'Invalid cache size {!r}, must be at least 1.'
+            raise ValueError(msg.format(size))
+        self.size = size
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __repr__(self):
+        fmt = '{cls}(size={self.size!r}, len={len}, hits={self.hits!r}, ' \
+            'misses={self.misses!r})'
+        return fmt.format(self=self, cls=type(self).__name__, len=len(self))
+
+    def get(self, key, default=None):
+        """
+        Return the value for the key, marking it as the most recently
+        used entry, or the default if the key is not cached.
+
+        """
+        with self._lock:
+            try:
+                value = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        Cache the value for the key, evicting the least recently used
+        entry if the cache is full.
+
+        """
+        with self._lock:
+            self._data.pop(key, None)
+            self._data[key] = value
+            while len(self._data) > self.size:
+                self._data.popitem(last=False)
+
+    def update(self, items):
+        """
+        Cache each of the key value pairs of the mapping.
+
+        """
+        for key, value in items.iteritems():
+            self.set(key, value)
+
+    def clear(self):
+        """
+        Remove all of the cached entries, retaining the hit and
+        miss counts.
+
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        Return a dictionary of the cache size, number of entries, and
+        the hit and miss counts.
+
+        """
+        with self._lock:
+            return dict(size=self.size, entries=len(self._data),
+                        hits=self.hits, misses=self.misses)
@@ -34,6 +34,11 @@ _DEFAULT_FUSEKI_PORT = 3131
 _DEFAULT_FUSEKI_TEST_PORT = 3636
 _DEFAULT_FUSEKI_TIMEOUT_ATTEMPTS = 1000
 _DEFAULT_FUSEKI_TIMEOUT_SLEEP = 0.1
+_DEFAULT_FUSEKI_POOL_SIZE = 4
+_DEFAULT_FUSEKI_LABEL_CACHE_SIZE = 10000
+_DEFAULT_FUSEKI_STARTUP_TIMEOUT = 100.0
+_DEFAULT_FUSEKI_MONITOR_INTERVAL = 10.0
+_DEFAULT_FUSEKI_VALIDATION_TIMEOUT = 60.0
 
 
 def _get_option(parser, section, option, default=None):
@@ -178,6 +183,83 @@ def update(config):
                 warnings.warn(msg.format(_SECTION_FUSEKI, option,
                                          _DEFAULT_FUSEKI_TIMEOUT_ATTEMPTS))
                 config[option] = _DEFAULT_FUSEKI_TIMEOUT_ATTEMPTS
+
+            option = 'startup_timeout'
+            result = _get_option(parser, _SECTION_FUSEKI, option,
+                                 _DEFAULT_FUSEKI_STARTUP_TIMEOUT)
+            try:
+                config[option] = float(result)
+                if config[option] <= 0:
+                    raise ValueError
+            except ValueError:
+                msg = 'MetOcean Configuration - Ignoring invalid startup ' \
+                    'timeout for Apache Fuseki server. Section {!r}, ' \
+                    'option {!r}. Defaulting to {} seconds.'
+                warnings.warn(msg.format(_SECTION_FUSEKI, option,
+                                         _DEFAULT_FUSEKI_STARTUP_TIMEOUT))
+                config[option] = _DEFAULT_FUSEKI_STARTUP_TIMEOUT
+
+            option = 'monitor_interval'
+            result = _get_option(parser, _SECTION_FUSEKI, option,
+                                 _DEFAULT_FUSEKI_MONITOR_INTERVAL)
+            try:
+                config[option] = float(result)
+                if config[option] < 0:
+                    raise ValueError
+            except ValueError:
+                msg = 'MetOcean Configuration - Ignoring invalid health ' \
+                    'monitor interval for Apache Fuseki server. Section ' \
+                    '{!r}, option {!r}. Defaulting to {} seconds.'
+                warnings.warn(msg.format(_SECTION_FUSEKI, option,
+                                         _DEFAULT_FUSEKI_MONITOR_INTERVAL))
+                config[option] = _DEFAULT_FUSEKI_MONITOR_INTERVAL
+
+            option = 'pool_size'
+            result = _get_option(parser, _SECTION_FUSEKI, option,
+                                 _DEFAULT_FUSEKI_POOL_SIZE)
+            try:
+                config[option] = int(result)
+                if config[option] < 1:
+                    raise ValueError
+            except ValueError:
+                msg = 'MetOcean Configuration - Ignoring invalid HTTP ' \
+                    'connection pool size for Apache Fuseki server. ' \
+                    'Section {!r}, option {!r}. Defaulting to {} ' \
+                    'connections.'
+                warnings.warn(msg.format(_SECTION_FUSEKI, option,
+                                         _DEFAULT_FUSEKI_POOL_SIZE))
+                config[option] = _DEFAULT_FUSEKI_POOL_SIZE
+
+            option = 'label_cache_size'
+            result = _get_option(parser, _SECTION_FUSEKI, option,
+                                 _DEFAULT_FUSEKI_LABEL_CACHE_SIZE)
+            try:
+                config[option] = int(result)
+                if config[option] < 1:
+                    raise ValueError
+            except ValueError:
+                msg = 'MetOcean Configuration - Ignoring invalid notation ' \
+                    'label cache size for Apache Fuseki server. ' \
+                    'Section {!r}, option {!r}. Defaulting to {} ' \
+                    'labels.'
+                warnings.warn(msg.format(_SECTION_FUSEKI, option,
+                                         _DEFAULT_FUSEKI_LABEL_CACHE_SIZE))
+                config[option] = _DEFAULT_FUSEKI_LABEL_CACHE_SIZE
+
+            option = 'validation_timeout'
+            result = _get_option(parser, _SECTION_FUSEKI, option,
+                                 _DEFAULT_FUSEKI_VALIDATION_TIMEOUT)
+            try:
+                config[option] = float(result)
+                if config[option] <= 0:
+                    raise ValueError
+            except ValueError:
+                msg = 'MetOcean Configuration - Ignoring invalid validation ' \
+                    'check timeout for Apache Fuseki server. Section ' \
+                    '{!r}, option {!r}. Defaulting to {} seconds.'
+                warnings.warn(msg.format(_SECTION_FUSEKI, option,
+                                         _DEFAULT_FUSEKI_VALIDATION_TIMEOUT))
+                config[option] = _DEFAULT_FUSEKI_VALIDATION_TIMEOUT
         else:
             msg = 'MetOcean Configuration - Missing configuration file {!r}'
             warnings.warn(msg.format(config_file))
@@ -16,18 +16,30 @@
 # along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
 
 
+import codecs
 import glob
+import hashlib
+import httplib
 import json
+import multiprocessing
 import os
+import Queue
+import re
+import shutil
 import socket
 import subprocess
 import sys
+import tempfile
+import threading
 import time
 import urllib
-import urllib2
 
 import metocean
+from metocean.cache import LRUCache
+import metocean.index as index
 import metocean.prefixes as prefixes
+import metocean.turtle as turtle
+import metocean.validation as validation
 
 
 # Configure the Apache Jena environment.
@@ -47,6 +59,36 @@ else:
     raise ValueError(msg)
 
 
+# The maximum number of uris bound in a single VALUES block.
+_BULK_CHUNK = 500
+
+# The maximum number of records created by a single SPARQL update request.
+_CREATE_CHUNK = 1000
+
+# The maximum number of records matched by content in a single query.
+_MATCH_CHUNK = 100
+
+# The size, in bytes, of each block of a streamed query response.
+_STREAM_BLOCK = 1 << 16
+
+# The static data checksum manifest in the triple store database directory.
+_MANIFEST = 'static_checksums.json'
+
+# The persisted report of the last validation, in the triple store
+# database directory.
+_VALIDATION = 'validation_report.json'
+
+# The longest pause, in seconds, between startup readiness probes.
+_MAX_BACKOFF = 2.0
+
+# The start of the bindings array of a SPARQL JSON results document. A
+# quote within a JSON string is always escaped, so cannot match.
+_BINDINGS = re.compile(r'"bindings"[ \t\n\r]*:[ \t\n\r]*\[')
+_VARS = re.compile(r'"vars"[ \t\n\r]*:[ \t\n\r]*(\[[^\]]*\])')
+_JSON_SPACE = re.compile(r'[ \t\n\r]*')
+_JSON = json.JSONDecoder()
+
+
 class FusekiServer(object):
     """
     A class to represent an instance of a process managing
@@ -88,6 +130,16 @@ class FusekiServer(object):
         self.host = host
         self.test = test
         self._process = None
+        self.startup_time = None
+        self._lock = threading.RLock()
+        self._monitor = None
+        self._monitor_stop = threading.Event()
+        self._pool = _ConnectionPool(self.host, self.port,
+                                     metocean.site_config['pool_size'])
+        self._labels = LRUCache(metocean.site_config['label_cache_size'])
+        self._replacements = None
+        self._vocabulary = None
+        self._properties = None
 
     def __enter__(self):
         self.start()
@@ -102,31 +154,48 @@ class FusekiServer(object):
         port, using the configured Apache Jena triple store database.
         
         """
-        if not self.alive():
-            nohup_dir = metocean.site_config['root_dir']
-            if self.test:
-                nohup_dir = metocean.site_config['test_dir']
-            nohup_file = os.path.join(nohup_dir, 'nohup.out')
-            if os.path.exists(nohup_file):
-                os.remove(nohup_file)
-            cwd = os.getcwd()
-            os.chdir(nohup_dir)
-            args = ['nohup',
-                    os.path.join(self._fuseki_dir, 'fuseki-server'),
-                    '--loc={}'.format(self._tdb_dir),
-                    '--update',
-                    '--port={}'.format(self.port),
-                    self._fuseki_dataset]
-            self._process = subprocess.Popen(args)
-            os.chdir(cwd)
-            for attempt in xrange(metocean.site_config['timeout_attempts']):
-                if self.alive():
-                    break
-                time.sleep(metocean.site_config['timeout_sleep'])
-            else:
+        with self._lock:
+            if not self.alive():
+                self._launch()
+        self._start_monitor()
+
+    def _launch(self):
+        """
+        Launch the Apache Fuseki SPARQL server process, and wait until it
+        is ready to answer queries.
+
+        """
+        nohup_dir = metocean.site_config['root_dir']
+        if self.test:
+            nohup_dir = metocean.site_config['test_dir']
+        nohup_file = os.path.join(nohup_dir, 'nohup.out')
+        if os.path.exists(nohup_file):
+            os.remove(nohup_file)
+        cwd = os.getcwd()
+        os.chdir(nohup_dir)
+        args = ['nohup',
+                os.path.join(self._fuseki_dir, 'fuseki-server'),
+                '--loc={}'.format(self._tdb_dir),
+                '--update',
+                '--port={}'.format(self.port),
+                self._fuseki_dataset]
+        self._process = subprocess.Popen(args)
+        os.chdir(cwd)
+        started = time.time()
+        deadline = started + metocean.site_config['startup_timeout']
+        delay = metocean.site_config['timeout_sleep']
+        while not self.ready():
+            now = time.time()
+            if now >= deadline or self._process.poll() is not None:
                 msg = 'The metOcean Apache Fuseki SPARQL server failed ' \
                     'to start.'
                 raise RuntimeError(msg)
+            time.sleep(min(delay, deadline - now))
+            delay = min(delay * 2, _MAX_BACKOFF)
+        self.startup_time = time.time() - started
+        msg = 'The metOcean Apache Fuseki SPARQL server started in ' \
+            '{:.2f}s.'
+        print msg.format(self.startup_time)
 
     def stop(self, save=False):
         """
@@ -140,19 +209,80 @@ class FusekiServer(object):
         """
         if save:
             self.save()
-        if self.alive():
-            pid = self._process.pid
-            self._process.terminate()
-            for attempt in xrange(metocean.site_config['timeout_attempts']):
-                if not self.alive():
-                    break
-                time.sleep(metocean.site_config['timeout_sleep'])
-            else:
-                msg = 'The metOcean Apache Fuseki SPARQL server failed ' \
-                    'to shutdown, PID={}.'
-                raise RuntimeError(msg.format(pid))
-                             
-            self._process = None
+        self._stop_monitor()
+        with self._lock:
+            if self.alive():
+                pid = self._process.pid
+                self._process.terminate()
+                attempts = metocean.site_config['timeout_attempts']
+                for attempt in xrange(attempts):
+                    if not self.alive():
+                        break
+                    time.sleep(metocean.site_config['timeout_sleep'])
+                else:
+                    msg = 'The metOcean Apache Fuseki SPARQL server failed ' \
+                        'to shutdown, PID={}.'
+                    raise RuntimeError(msg.format(pid))
+
+                self._process = None
+            self._pool.close()
+
+    def _start_monitor(self):
+        """
+        Start the background health monitor of the Apache Fuseki SPARQL
+        server process, unless disabled by the configured monitor interval.
+
+        """
+        interval = metocean.site_config['monitor_interval']
+        if interval and self._monitor is None:
+            self._monitor_stop.clear()
+            self._monitor = threading.Thread(target=self._watch,
+                                             args=(interval,))
+            self._monitor.daemon = True
+            self._monitor.start()
+
+    def _stop_monitor(self):
+        """
+        Stop the background health monitor, and wait for it to finish.
+
+        """
+        monitor, self._monitor = self._monitor, None
+        if monitor is not None:
+            self._monitor_stop.set()
+            if monitor is not threading.current_thread():
+                monitor.join()
+
+    def _watch(self, interval):
+        """
+        Periodically check that the Apache Fuseki SPARQL server process
+        managed by this instance is still running, and relaunch it if
+        it has died.
+
+        """
+        while not self._monitor_stop.wait(interval):
+            process = self._process
+            if process is not None and process.poll() is not None:
+                with self._lock:
+                    if self._monitor_stop.is_set():
+                        break
+                    msg = 'The metOcean Apache Fuseki SPARQL server died, ' \
+                        'PID={}, exit status {}.'
+                    print msg.format(process.pid, process.returncode)
+                    try:
+                        self._recover()
+                    except RuntimeError as err:
+                        print err
+
+    def _recover(self):
+        """
+        Relaunch the Apache Fuseki SPARQL server if it is no longer
+        available, discarding any pooled connections to it.
+
+        """
+        with self._lock:
+            if not self.alive():
+                self._pool.close()
+                self._launch()
 
     def restart(self):
         """
@@ -184,6 +314,32 @@ class FusekiServer(object):
             raise RuntimeError(msg.format(self.port))
         return result
 
+    def ready(self):
+        """
+        Determine whether the Apache Fuseki SPARQL server answers queries
+        against the configured dataset, by issuing a trivial ASK query.
+
+        Returns:
+            Boolean.
+
+        """
+        result = False
+        path = '{}/query'.format(self._fuseki_dataset)
+        body = urllib.urlencode([('query', 'ASK {}'), ('output', 'json')])
+        headers = {'Content-Type': 'application/x-www-form-urlencoded'}
+        conn = httplib.HTTPConnection(self.host, self.port,
+                                      timeout=_MAX_BACKOFF)
+        try:
+            conn.request('POST', path, body, headers)
+            response = conn.getresponse()
+            if response.status == 200:
+                result = 'boolean' in json.loads(response.read())
+        except (httplib.HTTPException, socket.error, ValueError):
+            pass
+        finally:
+            conn.close()
+        return result
+
     def clean(self):
         """
         Delete all of the files in the configured Apache Jena triple
@@ -197,33 +353,118 @@ class FusekiServer(object):
             os.remove(tdb_file)
         return glob.glob(files)
 
-    def save(self):
+    def save(self, dry_run=False, debug=False):
         """
         write out all saveCache flagged changes in the metocean graph,
         appending to the relevant ttl files
         remove saveCache flags after saving
-        
+
+        The save is made in two phases. The flagged records are first
+        snapshot, and streamed from the server onto temporary copies of
+        their ttl files, which are synced to disk. Only once every copy
+        has been written do they replace the originals, which are kept
+        until the flags of exactly the snapshot records have been removed,
+        in a single update. Should any replacement or the update fail, the
+        originals are restored, so a failed save leaves both the files and
+        the flags unchanged, rather than records which would be appended
+        again by the next save.
+
+        Kwargs:
+        * dry_run:
+            Report the changes which would be saved, without writing them
+            or removing their flags.
+
+        Returns:
+            A dictionary of each graph with changes to a dictionary of the
+            number of 'records', 'triples' and 'bytes' saved.
+
+        """
+        snapshot = self._cache_snapshot(debug=debug)
+        report = {}
+        temps = []
+        backups = []
+        try:
+            for graph, filename in self._static_graphs():
+                if graph not in snapshot:
+                    continue
+                subjects, triples = snapshot[graph]
+                lines = self._cache_lines(graph, subjects, debug=debug)
+                if dry_run:
+                    size = sum(len(line) for line in lines) + 1
+                else:
+                    temp, size = _append_copy(filename, lines)
+                    temps.append((temp, filename))
+                report[graph] = {'records': len(subjects),
+                                 'triples': triples, 'bytes': size}
+            if not dry_run:
+                for temp, filename in temps:
+                    shutil.copymode(filename, temp)
+                    os.link(filename, temp + '.orig')
+                    backups.append((temp + '.orig', filename))
+                try:
+                    for temp, filename in temps:
+                        os.rename(temp, filename)
+                    _fsync_dirs([filename for _, filename in temps])
+                    self._clear_cache(snapshot, debug=debug)
+                except:
+                    for backup, filename in backups:
+                        os.rename(backup, filename)
+                    _fsync_dirs([filename for _, filename in backups])
+                    raise
+        finally:
+            for temp, _ in temps + backups:
+                if os.path.exists(temp):
+                    os.remove(temp)
+        return report
+
+    def _static_graphs(self):
+        """
+        Return the list of the (graph, ttl file) of each static data file
+        of the metocean graph.
+
         """
-        
         main_graph = metocean.site_config['graph']
         files = os.path.join(self._static_dir, main_graph, '*.ttl')
-        for subgraph in glob.glob(files):
-            graph = 'http://%s/%s' % (main_graph, subgraph.split('/')[-1])
-            save_string = self.save_cache(graph)
-            with open(subgraph, 'a') as sg:
-                for line in save_string.splitlines():
-                    if not line.startswith('@prefix'):
-                        sg.write(line)
-                        sg.write('\n')
-
+        return [('http://%s/%s' % (main_graph, subgraph.split('/')[-1]),
+                 subgraph) for subgraph in glob.glob(files)]
 
+    def _cache_snapshot(self, debug=False):
+        """
+        Return a dictionary of each graph of the metocean graph with
+        saveCache flagged records to the sorted list of their subjects and
+        the number of their triples, other than the flags.
 
-    def save_cache(self, graph, debug=False):
         """
-        export new records from a graph in the triple store to an external location,
-        as flagged by the manager application
-        clear the 'not saved' flags on records, updating a graph in the triple store
-        with the fact that changes have been persisted to ttl
+        qstr = '''
+        SELECT ?g ?s (COUNT(?p) AS ?triples)
+        WHERE
+        {  GRAPH ?g
+            {
+        ?s mr:saveCache "True" ;
+            ?p ?o .
+            }
+        }
+        GROUP BY ?g ?s
+        '''
+        graphs = set(graph for graph, _ in self._static_graphs())
+        snapshot = {}
+        for result in self.run_query(qstr, debug=debug):
+            graph = result['g'].strip('<>')
+            if graph in graphs:
+                subjects, triples = snapshot.get(graph, ([], 0))
+                subjects.append(result['s'])
+                # The count includes the saveCache flag itself.
+                triples += int(result['triples']) - 1
+                snapshot[graph] = (subjects, triples)
+        for subjects, _ in snapshot.itervalues():
+            subjects.sort()
+        return snapshot
+
+    def _cache_lines(self, graph, subjects, debug=False):
+        """
+        Generate the lines of the Turtle serialisation of the saveCache
+        flagged records of the subjects in the graph, without the flags or
+        the prefix declarations, as they are received from the server.
 
         """
         qstr = '''
@@ -235,38 +476,57 @@ class FusekiServer(object):
         {
         GRAPH <%s>
         {
+        VALUES ?s { %s }
         ?s ?p ?o ;
             mr:saveCache "True" .
         }
         } 
-        ''' % graph
-        results = self.run_query(qstr, output="text", debug=debug)
-        qstr = '''
-        DELETE
-        {  GRAPH <%s>
-            {
-            ?s mr:saveCache "True" .
-            }
-        }
-        WHERE
-        {  GRAPH <%s>
-            {
-        ?s ?p ?o ;
-            mr:saveCache "True" .
-            }
-        } 
-        ''' % (graph,graph)
-        delete_results = self.run_query(qstr, update=True, debug=debug)
-        save_string = ''
-        for line in results.split('\n'):
-            if not line.strip().startswith('mr:saveCache'):
-                save_string += line
-                save_string += '\n'
-            else:
-                if line.endswith('.'):
-                    save_string += '\t.\n'
-        return save_string
+        '''
+        for i in xrange(0, len(subjects), _BULK_CHUNK):
+            chunk = '\n\t'.join(subjects[i:i + _BULK_CHUNK])
+            for line in self.stream_query(qstr % (graph, chunk),
+                                          output='text', debug=debug):
+                stripped = line.strip()
+                if stripped.startswith('mr:saveCache'):
+                    if stripped.endswith('.'):
+                        yield '\t.\n'
+                elif not stripped.startswith('@prefix'):
+                    yield line
+
+    def _clear_cache(self, snapshot, debug=False):
+        """
+        Remove the saveCache flags from exactly the records of the
+        snapshot, in a single update.
+
+        """
+        if not snapshot:
+            return
+        qstr = 'DELETE DATA\n{'
+        for graph, (subjects, _) in sorted(snapshot.iteritems()):
+            qstr += '\n  GRAPH <%s> {' % graph
+            for subject in subjects:
+                qstr += '\n\t%s mr:saveCache "True" .' % subject
+            qstr += '\n  }'
+        qstr += '\n}'
+        self.run_query(qstr, update=True, debug=debug)
+
+    def save_cache(self, graph, debug=False):
+        """
+        export new records from a graph in the triple store to an external location,
+        as flagged by the manager application
+        clear the 'not saved' flags on records, updating a graph in the triple store
+        with the fact that changes have been persisted to ttl
 
+        """
+        snapshot = self._cache_snapshot(debug=debug)
+        if graph not in snapshot:
+            return ''
+        snapshot = {graph: snapshot[graph]}
+        subjects, _ = snapshot[graph]
+        save_string = ''.join(self._cache_lines(graph, subjects,
+                                                debug=debug))
+        self._clear_cache(snapshot, debug=debug)
+        return save_string
 
     def revert(self):
         """
@@ -274,102 +534,584 @@ class FusekiServer(object):
         and remove them, reverting the TDB to the same state
         as the saved ttl files
         
+        """
+        for qstring in self._revert_updates():
+            revert_string = self.run_query(qstring, update=True)
+        # A reverted mapping may have replaced another.
+        self.run_query(metocean.sparql_current_rebuild(), update=True)
+        self._invalidate()
+
+    def _revert_updates(self):
+        """
+        return the list of SPARQL updates which remove the cached changes
+        from each graph of the metocean graph
+
         """
         qstr = '''
         DELETE
-        {  GRAPH <%s>
+        {  GRAPH ?g
             {
             ?s ?p ?o .
             }
         }
         WHERE
-        {  GRAPH <%s>
+        {  VALUES ?g { %s }
+           GRAPH ?g
             {
             ?s ?p ?o ;
             mr:saveCache "True" .
             }
         } 
-        '''
-        main_graph = metocean.site_config['graph']
-        files = os.path.join(self._static_dir, main_graph, '*.ttl')
-        for infile in glob.glob(files):
-            ingraph = infile.split('/')[-1]
-            graph = 'http://%s/%s' % (main_graph, ingraph)
-            qstring = qstr % (graph, graph)
-            revert_string = self.run_query(qstring, update=True)
+        ''' % self._graph_values()
+        return [qstr]
+
+    def _graph_values(self):
+        """
+        return the SPARQL VALUES data block of each graph of the metocean
+        graph
 
-    def query_cache(self):
+        """
+        return '\n\t'.join('<%s>' % graph
+                            for graph, _ in self._static_graphs())
+
+    def query_cache(self, limit=None):
         """
         identify all cached changes in the metocean graph
 
+        Kwargs:
+        * limit:
+            The maximum number of statements to return.
+
         """
         qstr = '''
         SELECT ?s ?p ?o
         WHERE
-        {  GRAPH <%s>
+        {  VALUES ?g { %s }
+           GRAPH ?g
             {
         ?s ?p ?o ;
             mr:saveCache "True" .
             }
         } 
-        '''
-        results = []
-        main_graph = metocean.site_config['graph']
-        files = os.path.join(self._static_dir, main_graph, '*.ttl')
-        for infile in glob.glob(files):
-            ingraph = infile.split('/')[-1]
-            graph = 'http://%s/%s' % (main_graph, ingraph)
-            query_string = qstr % (graph)
-            result = self.run_query(query_string)
-            results = results + result
-        return results
+        ''' % self._graph_values()
+        if limit is not None:
+            qstr += 'LIMIT %i' % limit
+        return self.run_query(qstr)
 
+    def cache_count(self):
+        """
+        return the number of cached change statements in the metocean
+        graph, as listed by :meth:`query_cache`
+
+        """
+        qstr = '''
+        SELECT (COUNT(*) AS ?count)
+        WHERE
+        {  VALUES ?g { %s }
+           GRAPH ?g
+            {
+        ?s ?p ?o ;
+            mr:saveCache "True" .
+            }
+        } 
+        ''' % self._graph_values()
+        results = self.run_query(qstr)
+        if not results:
+            return 0
+        return int(results[0]['count'])
 
-    def load(self):
+    def load(self, incremental=False):
         """
         Load all the static data turtle files into the new Apache Jena
         triple store database.
 
+        The turtle files are parsed into N-Quads in parallel, and loaded
+        into their named graphs with a single tdbloader invocation.
+
+        Kwargs:
+        * incremental:
+            Only reload the named graphs whose static data turtle file
+            has been changed, added or removed since the last load, as
+            recorded by the checksum manifest in the triple store database.
+            Cached changes are reverted. Without a manifest, all of the
+            graphs are loaded.
+
+        Returns:
+            The list of the named graphs loaded.
+
+        """
+        self._invalidate()
+        checksums = self._static_checksums()
+        manifest = None
+        if incremental:
+            manifest = self._read_manifest()
+        restart = False
+        if manifest is None:
+            self.clean()
+            manifest = {}
+            stale = sorted(checksums)
+        else:
+            stale = sorted(graph for graph in checksums
+                           if manifest.get(graph, {}).get('checksum') !=
+                           checksums[graph]['checksum'])
+            removed = sorted(set(manifest) - set(checksums))
+            if self.alive():
+                self.stop()
+                restart = True
+            for graph in stale + removed:
+                manifest.pop(graph, None)
+            self._write_manifest(manifest)
+            updates = self._revert_updates()
+            updates.extend('DROP SILENT GRAPH <{}>'.format(graph)
+                           for graph in stale + removed)
+            if not stale:
+                updates.append(metocean.sparql_current_rebuild())
+            self._tdb_update(updates)
+        if stale:
+            self._bulk_load(dict((graph, checksums[graph]['file'])
+                                 for graph in stale))
+            for graph in stale:
+                manifest[graph] = checksums[graph]
+            self._write_manifest(manifest)
+            # The current mappings are derived from the loaded mappings.
+            self._tdb_update([metocean.sparql_current_rebuild()])
+        if restart:
+            self.start()
+        return stale
+
+    def _tdb_update(self, updates):
+        """
+        Run the SPARQL updates directly on the Apache Jena triple store
+        database, with a single tdbupdate invocation.
+
+        """
+        pre = prefixes.Prefixes()
+        update = '{} {}'.format(pre.sparql, ' ;\n'.join(updates))
+        tdb_update = [os.path.join(self._jena_dir, 'bin/tdbupdate'),
+                      '--loc={}'.format(self._tdb_dir), update]
+        subprocess.check_call(tdb_update)
+
+    def _bulk_load(self, graphs):
+        """
+        Load the turtle files of the named graphs into the Apache Jena
+        triple store database with a single tdbloader invocation, having
+        parsed them into N-Quads in parallel worker processes.
+
+        Args:
+        * graphs:
+            A dictionary of each named graph to its turtle file.
+
+        Returns:
+            A dictionary of each named graph to its number of triples
+            and parse time in seconds.
+
+        """
+        tmp_dir = tempfile.mkdtemp()
+        try:
+            jobs = []
+            for i, graph in enumerate(sorted(graphs)):
+                nquads = os.path.join(tmp_dir, '{}.nq'.format(i))
+                jobs.append((graph, graphs[graph], nquads, i))
+            pool = multiprocessing.Pool()
+            try:
+                results = pool.map(_parse_nquads, jobs)
+            finally:
+                pool.close()
+                pool.join()
+            report = {}
+            for graph, triples, seconds in results:
+                print '{}: {} triples parsed in {:.2f}s'.format(graph, triples,
+                                                              seconds)
+                report[graph] = (triples, seconds)
+            tdb_load = [os.path.join(self._jena_dir, 'bin/tdbloader'),
+                        '--loc={}'.format(self._tdb_dir)]
+            tdb_load.extend(job[2] for job in jobs)
+            print ' '.join(tdb_load)
+            start = time.time()
+            subprocess.check_call(tdb_load)
+            total = sum(triples for triples, _ in report.itervalues())
+            print '{} triples in {} graphs loaded in {:.2f}s'.format(
+                total, len(report), time.time() - start)
+        finally:
+            shutil.rmtree(tmp_dir)
+        return report
+
+    def _static_checksums(self):
+        """
+        Return a dictionary of each named graph of the static data to the
+        path and the checksum of its turtle file.
+
         """
-        self.clean()
+        checksums = {}
         graphs = os.path.join(self._static_dir, '*')
         for ingraph in glob.glob(graphs):
             graph = ingraph.split('/')[-1]
             subgraphs = os.path.join(ingraph, '*.ttl')
             for insubgraph in glob.glob(subgraphs):
                 subgraph = insubgraph.split('/')[-1]
-                tdb_load = [os.path.join(self._jena_dir, 'bin/tdbloader'),
-                            '--graph=http://{}/{}'.format(graph, subgraph),
-                            '--loc={}'.format(self._tdb_dir),
-                            insubgraph]
-                print ' '.join(tdb_load)
-                subprocess.check_call(tdb_load)
+                name = 'http://{}/{}'.format(graph, subgraph)
+                checksums[name] = {'file': insubgraph,
+                                   'checksum': _file_checksum(insubgraph)}
+        return checksums
+
+    def _read_manifest(self):
+        """
+        Return the static data checksum manifest of the triple store
+        database, or None if there is no manifest.
+
+        """
+        result = None
+        manifest = os.path.join(self._tdb_dir, _MANIFEST)
+        if os.path.exists(manifest):
+            with open(manifest) as infile:
+                result = json.load(infile)
+        return result
+
+    def _write_manifest(self, manifest):
+        """
+        Atomically replace the static data checksum manifest of the
+        triple store database.
+
+        """
+        filename = os.path.join(self._tdb_dir, _MANIFEST)
+        with open(filename + '.tmp', 'w') as outfile:
+            json.dump(manifest, outfile, indent=1, sort_keys=True)
+        os.rename(filename + '.tmp', filename)
+
+    def validate(self, incremental=False, timeout=None):
+        """
+        run the registered validation checks concurrently, as
+        :func:`metocean.validation.run`
+
+        Kwargs:
+        * incremental:
+            Only check the mappings which have become current since the
+            last validation, reusing the persisted report of that
+            validation for the rest. Every mapping is checked when the
+            static data has been reloaded, or a vocabulary record has been
+            created, since then, and by any check which did not complete
+            in the last validation.
+        * timeout:
+            The time in seconds to wait for the checks to complete, or
+            None to wait indefinitely.
 
-    def validate(self):
+        Returns:
+            The :class:`metocean.validation.Report` dictionary of each
+            failure description to the list of the failing results, for
+            each check which completed.
+
+        """
+        report = None
+        if incremental:
+            report = self._read_report()
+        current = self._valid_mappings()
+        vocab = self._cached_vocab()
+        manifest = self._read_manifest()
+        changed = None
+        if report is not None and report['manifest'] == manifest and \
+                report['vocab'] == vocab:
+            changed = sorted(current.difference(report['mappings']))
+            if len(changed) > _BULK_CHUNK:
+                changed = None
+        previous = {} if changed is None else report['failures']
+        checks = validation.checks()
+        # Only check the changed mappings where there is a previous result.
+        mappings = dict((check.name, changed) for check in checks
+                        if check.label in previous)
+        names = [check.name for check in checks
+                 if check.name not in mappings or changed]
+        result = validation.run(self, names=names, mappings=mappings,
+                                timeout=timeout)
+        failures = {}
+        for check in checks:
+            if check.name in names and check.label not in result:
+                # The check timed out or failed, so is run in full next.
+                continue
+            rows = self._failures(result.get(check.label, []))
+            if check.name in mappings:
+                # Keep the previous failures of the mappings which are
+                # still current.
+                for amap, amap_rows in previous[check.label].iteritems():
+                    if amap not in current:
+                        continue
+                    for row in amap_rows:
+                        if row.get('bmap', amap) in current and \
+                                row not in rows.get(amap, []):
+                            rows.setdefault(amap, []).append(row)
+            failures[check.label] = rows
+        self._write_report({'manifest': manifest, 'mappings': sorted(current),
+                            'vocab': vocab, 'failures': failures})
+        output = validation.Report()
+        output.timings = result.timings
+        output.timed_out = result.timed_out
+        output.failed = result.failed
+        for label, rows in failures.iteritems():
+            output[label] = [row for amap in sorted(rows) for row in
+                             sorted(rows[amap], key=_row_key)]
+        return output
+
+    def _failures(self, rows):
         """
-        run the validation queries
+        Return a dictionary of each mapping uri to the list of the failing
+        validation results for that mapping.
 
         """
         failures = {}
-        mm_string = 'The following mappings are ambiguous, providing multiple '\
-                    'targets in the same format for a particular source'
-        failures[mm_string] = self.run_query(multiple_mappings())
-        invalid_vocab = 'The following mappings contain an undeclared URI'
-        failures[invalid_vocab] = self.run_query(valid_vocab())
+        for row in rows:
+            failures.setdefault(row['amap'], []).append(row)
         return failures
 
+    def ambiguous_mappings(self, amaps=None, bmaps=None, debug=False):
+        """
+        Return the pairs of current mappings which map the same source to
+        different targets of the same format, in the form of the results
+        of the :func:`multiple_mappings` query.
+
+        The mappings are retrieved as a flat table with a single query and
+        grouped by source and target format by
+        :func:`metocean.index.ambiguous_pairs`, rather than joined against
+        each other by the triple store.
+
+        Kwargs:
+        * amaps, bmaps:
+            Only return the pairs with the first mapping in the amaps list
+            of uris, or the second mapping in the bmaps list of uris.
+
+        """
+        qstr = '''SELECT ?mapping ?source ?sourceFormat ?target ?targetFormat
+        ?invertible
+        WHERE {
+        GRAPH <http://metarelate.net/mappings.ttl> {
+        ?mapping mr:source ?source ;
+                 mr:target ?target ;
+                 mr:status ?status .
+        OPTIONAL {?mapping mr:invertible ?invertible . }
+        FILTER (?status NOT IN ("Deprecated", "Broken"))
+        }
+        GRAPH <http://metarelate.net/currentMappings> { ?mapping a mr:Mapping . }
+        GRAPH <http://metarelate.net/concepts.ttl> {
+        ?source mr:hasFormat ?sourceFormat .
+        ?target mr:hasFormat ?targetFormat .
+        }
+        }
+        '''
+        columns = self.run_query(qstr, output='columns', debug=debug)
+        mappings = columns.get('mapping', [])
+        invertible = [value == '"True"' for value in
+                      columns.get('invertible', [None] * len(mappings))]
+        table = zip(mappings, columns.get('source', []),
+                    columns.get('sourceFormat', []), columns.get('target', []),
+                    columns.get('targetFormat', []), invertible)
+        pairs = index.ambiguous_pairs(table)
+        if amaps is not None or bmaps is not None:
+            amaps = set(amaps or [])
+            bmaps = set(bmaps or [])
+            pairs = [pair for pair in pairs
+                     if pair[0] in amaps or pair[3] in bmaps]
+        signatures = self._signatures(set((pair[1], pair[2])
+                                          for pair in pairs), debug=debug)
+        keys = ('amap', 'asource', 'atarget', 'bmap', 'bsource', 'btarget')
+        result = []
+        for pair in pairs:
+            signature = signatures.get((pair[1], pair[2]))
+            # As for the query, a pair of concepts without any properties
+            # is not reported.
+            if signature is not None:
+                row = dict(zip(keys, pair))
+                row['signature'] = signature
+                result.append(row)
+        return result
+
+    def _signatures(self, concepts, debug=False):
+        """
+        Return a dictionary of each (source, target) pair of concept uris
+        to the concatenated values of their properties, for each pair
+        with any properties.
+
+        """
+        signatures = {}
+        concepts = sorted(concepts)
+        for i in xrange(0, len(concepts), _BULK_CHUNK):
+            values = ' '.join('(%s %s)' % pair for pair in
+                              concepts[i:i + _BULK_CHUNK])
+            qstr = '''SELECT ?asource ?atarget
+            (GROUP_CONCAT(DISTINCT(?value); SEPARATOR='&') AS ?signature)
+            WHERE {
+            VALUES (?asource ?atarget) { %s }
+            GRAPH <http://metarelate.net/concepts.ttl> { {
+            ?asource mr:hasProperty ?prop . }
+            UNION {
+            ?atarget mr:hasProperty ?prop . }
+            UNION {
+            ?asource mr:hasComponent|mr:hasProperty ?prop . }
+            UNION {
+            ?atarget mr:hasComponent|mr:hasProperty ?prop . }
+            OPTIONAL { ?prop rdf:value ?value . }
+            } }
+            GROUP BY ?asource ?atarget
+            ''' % values
+            for row in self.run_query(qstr, debug=debug):
+                signatures[(row['asource'], row['atarget'])] = \
+                    row.get('signature', '""')
+        return signatures
+
+    def vocabulary_index(self, debug=False):
+        """
+        Return the :class:`metocean.index.VocabularyIndex` of the subjects
+        declared in each graph, built with a single query when first
+        required.
+
+        The index is rebuilt after a load, revert or any update.
+
+        """
+        vocabulary = self._vocabulary
+        if vocabulary is None:
+            qstr = '''SELECT DISTINCT ?g ?s
+            WHERE {
+            GRAPH ?g { ?s ?p ?o . }
+            FILTER (ISURI(?s))
+            }
+            '''
+            columns = self.run_query(qstr, output='columns', debug=debug)
+            vocabulary = index.VocabularyIndex(zip(columns.get('g', []),
+                                                   columns.get('s', [])))
+            self._vocabulary = vocabulary
+        return vocabulary
+
+    def undeclared_vocab(self, amaps=None, debug=False):
+        """
+        Return the current mappings which reference a uri which is not
+        declared in any graph, in the form of the results of the
+        :func:`valid_vocab` query.
+
+        The uris referenced by each mapping are retrieved with a single
+        query and checked against the :meth:`vocabulary_index`. Each
+        result also maps each undeclared uri which is a near miss to the
+        vocabulary graph it probably belongs to, as 'vocabulary'.
+
+        Kwargs:
+        * amaps:
+            Only check the mappings in the amaps list of uris.
+
+        """
+        qstr = '''SELECT DISTINCT ?amap ?vocab
+        WHERE {%s
+        GRAPH <http://metarelate.net/mappings.ttl> {
+        ?amap mr:status ?astatus .
+        FILTER (?astatus NOT IN ("Deprecated", "Broken"))
+        { ?amap mr:source ?fc . }
+        UNION
+        { ?amap mr:target ?fc . }
+        }
+        GRAPH <http://metarelate.net/currentMappings> { ?amap a mr:Mapping . }
+        GRAPH <http://metarelate.net/concepts.ttl> {
+        ?fc mr:hasComponent|mr:hasProperty ?prop .
+        { ?prop mr:name ?vocab . }
+        UNION
+        { ?prop mr:operator ?vocab . }
+        UNION
+        { ?prop rdf:value ?vocab . }
+        FILTER (ISURI(?vocab))
+        }
+        }
+        ''' % _values('?amap', amaps)
+        columns = self.run_query(qstr, output='columns', debug=debug)
+        references = {}
+        for amap, uri in zip(columns.get('amap', []),
+                             columns.get('vocab', [])):
+            references.setdefault(amap, set()).add(uri)
+        vocabulary = self.vocabulary_index(debug=debug)
+        result = []
+        for amap in sorted(references):
+            undeclared = vocabulary.undeclared(references[amap])
+            if undeclared:
+                signature = '&'.join(uri.strip('<>') for uri in undeclared)
+                hints = {}
+                for uri in undeclared:
+                    graph = vocabulary.vocabulary(uri)
+                    if graph is not None:
+                        hints[uri] = graph
+                result.append({'amap': amap,
+                               'signature': index.result_value(signature),
+                               'vocabulary': hints})
+        return result
+
+    def _valid_mappings(self):
+        """
+        Return the set of the uris of the current mappings which are
+        neither deprecated nor broken, as checked by the validation.
+
+        """
+        qstr = '''SELECT ?mapping
+        WHERE {
+        GRAPH <http://metarelate.net/currentMappings> {
+        ?mapping a mr:Mapping .
+        }
+        GRAPH <http://metarelate.net/mappings.ttl> {
+        ?mapping mr:status ?status .
+        FILTER (?status NOT IN ("Deprecated", "Broken"))
+        }
+        }
+        '''
+        return set(self.run_query(qstr, output='columns').get('mapping', []))
+
+    def _cached_vocab(self):
+        """
+        Return the sorted list of the uris of the cached change records in
+        the vocabulary graphs.
+
+        """
+        graphs = ['http://metarelate.net/mappings.ttl',
+                  'http://metarelate.net/concepts.ttl']
+        qstr = '''SELECT DISTINCT ?s
+        WHERE {
+        GRAPH ?g { ?s mr:saveCache "True" . }
+        FILTER (?g NOT IN (%s))
+        }
+        ''' % ', '.join('<%s>' % graph for graph in graphs)
+        return sorted(self.run_query(qstr, output='columns').get('s', []))
+
+    def _read_report(self):
+        """
+        Return the persisted report of the last validation of the triple
+        store database, or None if there is no report.
+
+        """
+        result = None
+        report = os.path.join(self._tdb_dir, _VALIDATION)
+        if os.path.exists(report):
+            with open(report) as infile:
+                result = json.load(infile)
+        return result
+
+    def _write_report(self, report):
+        """
+        Atomically replace the persisted validation report of the triple
+        store database.
+
+        """
+        filename = os.path.join(self._tdb_dir, _VALIDATION)
+        with open(filename + '.tmp', 'w') as outfile:
+            json.dump(report, outfile, sort_keys=True)
+        os.rename(filename + '.tmp', filename)
+
+    def _invalidate(self):
+        """
+        Drop the cached labels, vocabulary and indexes, which are rebuilt
+        from the triple store when next required.
+
+        """
+        self._labels.clear()
+        self._replacements = None
+        self._vocabulary = None
+        self._properties = None
+
     def run_query(self, query_string, output='json', update=False, debug=False):
         """
         run a query_string on the FusekiServer instance
         return the results
         
         """
-        if not self.alive():
-            self.restart()
-        # use null ProxyHandler to ignore proxy for localhost access
-        proxy_support = urllib2.ProxyHandler({})
-        opener = urllib2.build_opener(proxy_support)
-        urllib2.install_opener(opener)
         pre = prefixes.Prefixes()
         if debug == True:
             k=0
@@ -384,32 +1126,104 @@ class FusekiServer(object):
                 (action, "%s %s" % (pre.sparql, query_string))])
         else:
             action = 'query'
+            # Graph results are requested from Fuseki as RDF/JSON.
             qstr = urllib.urlencode([
                 (action, "%s %s" % (pre.sparql, query_string)),
-                ("output", output),
+                ("output", "json" if output == "graph" else output),
                 ("stylesheet","/static/xml-to-html-links.xsl")])
-        BASEURL = "http://%s:%i%s/%s?" % (self.host, self.port,
-                                          self._fuseki_dataset, action)
-        data = ''
+        path = '%s/%s' % (self._fuseki_dataset, action)
+        if not update and output in ('json', 'columns'):
+            # Decode the results as they are received, so the response is
+            # never held in memory as a whole.
+            blocks = self._stream(path, qstr)
+            if output == 'json':
+                return process_data(blocks)
+            return process_columns(blocks)
+        BASEURL = "http://%s:%i%s?" % (self.host, self.port, path)
         try:
-            data = opener.open(urllib2.Request(BASEURL), qstr).read()
-        except urllib2.URLError as err:
+            try:
+                data = self._pool.post(path, qstr)
+            except socket.error:
+                # The server cannot be reached, so relaunch it if it has
+                # died, before trying once more.
+                self._recover()
+                data = self._pool.post(path, qstr)
+        except (httplib.HTTPException, socket.error) as err:
             ec = 'Error connection to Fuseki server on {}.\n server returned {}'
             ec = ec.format(BASEURL, err)
             raise RuntimeError(ec)
-        if output == "json":
-            return process_data(data)
+        finally:
+            if update:
+                # Any update may change the notation of a cached label,
+                # declare a subject or create, replace or remove a mapping.
+                # Drop the caches once it has been applied, so that a
+                # concurrent lookup cannot cache a result from before it.
+                self._invalidate()
+        if output == "graph":
+            return process_graph(data)
         elif output == "text":
             return data
         else:
             return data
 
+    def stream_query(self, query_string, output='text', debug=False):
+        """
+        run a query_string on the FusekiServer instance
+        generate the lines of the results in turn, as they are received,
+        without holding all of the results in memory
+
+        """
+        pre = prefixes.Prefixes()
+        if debug == True:
+            print query_string
+        qstr = urllib.urlencode([
+            ('query', "%s %s" % (pre.sparql, query_string)),
+            ("output", output),
+            ("stylesheet","/static/xml-to-html-links.xsl")])
+        path = '%s/query' % self._fuseki_dataset
+        pending = ''
+        for block in self._stream(path, qstr):
+            lines = (pending + block).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        if pending:
+            yield pending
+
+    def _stream(self, path, body):
+        """
+        Generate the blocks of the response to the POST of the url encoded
+        body to the path on the server, as they are received.
+
+        """
+        BASEURL = "http://%s:%i%s?" % (self.host, self.port, path)
+        try:
+            blocks = self._pool.stream(path, body)
+            try:
+                block = next(blocks, '')
+            except socket.error:
+                # The server cannot be reached, so relaunch it if it has
+                # died, before trying once more.
+                self._recover()
+                blocks = self._pool.stream(path, body)
+                block = next(blocks, '')
+            while block:
+                yield block
+                block = next(blocks, '')
+        except (httplib.HTTPException, socket.error) as err:
+            ec = 'Error connection to Fuseki server on {}.\n server returned {}'
+            ec = ec.format(BASEURL, err)
+            raise RuntimeError(ec)
+
     def get_label(self, subject, debug=False):
         """
         return the skos:notation for a subject, if it exists
 
         """
         subject = str(subject)
+        label = self._labels.get(subject)
+        if label is not None:
+            return label
         if not subject.startswith('<') and not subject.startswith('"'):
             subj_str = '"{}"'.format(subject)
         else:
@@ -422,19 +1236,80 @@ class FusekiServer(object):
         qstr = qstr.rstrip('\n\tUNION {')
         qstr += '\n\tFILTER(?s = %(sub)s) }' % {'sub':subj_str}
         results = self.run_query(qstr, debug=debug)
-        if len(results) == 0:
-            hash_split = subject.split('#')
-            if len(hash_split) == 2 and hash_split[1].endswith('>'):
-                label = hash_split[1].rstrip('>')
-            else:
-                # raise ValueError('{} returns no notation'.format(subject))
-                label = subject
-        elif len(results) >1:
-            raise ValueError('{} returns multiple notation'.format(subject))
-        else:
-            label = results[0]['notation']
+        label = index.notation_label(subject, [result['notation']
+                                               for result in results])
+        self._labels.set(subject, label)
         return label
 
+    def get_labels(self, subjects, debug=False):
+        """
+        return a dictionary of the skos:notation for each of the subjects,
+        following the conventions of :meth:`get_label`, retrieving the
+        notations for all of the uncached subjects in bulk
+
+        """
+        labels = {}
+        subjects = set(str(subject) for subject in subjects)
+        for subject in subjects:
+            label = self._labels.get(subject)
+            if label is not None:
+                labels[subject] = label
+        subjects.difference_update(labels)
+        uris = sorted(subject for subject in subjects
+                      if subject.startswith('<'))
+        notations = {}
+        for i in xrange(0, len(uris), _BULK_CHUNK):
+            qstr = '''SELECT ?s ?notation
+            WHERE {
+            VALUES ?g { %s }
+            VALUES ?s { %s }
+            GRAPH ?g { ?s skos:notation ?notation . }
+            }
+            ''' % ('\n\t'.join(_vocab_graphs()),
+                   '\n\t'.join(uris[i:i + _BULK_CHUNK]))
+            for result in self.run_query(qstr, debug=debug):
+                notations.setdefault(result['s'], []).append(
+                    result['notation'])
+        for subject in subjects:
+            label = index.notation_label(subject,
+                                         notations.get(subject, []))
+            self._labels.set(subject, label)
+            labels[subject] = label
+        return labels
+
+    def preload_labels(self, debug=False):
+        """
+        retrieve every skos:notation declared in the vocabulary graphs
+        in a single query, populating the label cache
+
+        returns the number of labels cached
+
+        """
+        qstr = '''SELECT ?s ?notation
+        WHERE {
+        VALUES ?g { %s }
+        GRAPH ?g { ?s skos:notation ?notation . }
+        }
+        ''' % '\n\t'.join(_vocab_graphs())
+        notations = {}
+        for result in self.run_query(qstr, debug=debug):
+            notations.setdefault(result['s'], []).append(result['notation'])
+        count = 0
+        for subject, snotations in notations.iteritems():
+            # Leave ambiguous notations to raise on retrieval.
+            if len(snotations) == 1:
+                self._labels.set(subject, snotations[0])
+                count += 1
+        return count
+
+    def label_cache_stats(self):
+        """
+        return a dictionary of the label cache size, number of entries,
+        and the hit and miss counts
+
+        """
+        return self._labels.stats()
+
     def get_contacts(self, register, debug=False):
         """
         return a list of contacts from the tdb which are part of the named register
@@ -453,10 +1328,15 @@ class FusekiServer(object):
         results = self.run_query(qstr, debug=debug)
         return results
 
-    def subject_and_plabel(self, graph, debug=False):
+    def subject_and_plabel(self, graph, columns=False, debug=False):
         """
         selects subject and prefLabel from a particular graph
 
+        Kwargs:
+        * columns:
+            Return the results as a dictionary of the subject, prefLabel
+            and notation columns, rather than a list of rows.
+
         """
         qstr = '''
             SELECT ?subject ?prefLabel ?notation
@@ -467,7 +1347,8 @@ class FusekiServer(object):
             }
             ORDER BY ?subject
         ''' % graph
-        results = self.run_query(qstr, debug=debug)
+        output = 'columns' if columns else 'json'
+        results = self.run_query(qstr, output=output, debug=debug)
         return results
 
     def retrieve_mappings(self, source, target):
@@ -476,14 +1357,8 @@ class FusekiServer(object):
         and target format
 
         """
-        if isinstance(source, basestring) and \
-                not metocean.Item(source).is_uri():
-            source = os.path.join('<http://www.metarelate.net/metOcean/format',
-                                  '{}>'.format(source.lower()))
-        if isinstance(target, basestring) and \
-                not metocean.Item(target).is_uri():
-            target = os.path.join('<http://www.metarelate.net/metOcean/format',
-                                  '{}>'.format(target.lower()))
+        source = index.format_uri(source)
+        target = index.format_uri(target)
         qstr = '''
         SELECT ?mapping ?source ?sourceFormat ?target ?targetFormat ?inverted
         (GROUP_CONCAT(DISTINCT(?valueMap); SEPARATOR = '&') AS ?valueMaps)
@@ -495,7 +1370,7 @@ class FusekiServer(object):
         BIND("False" AS ?inverted)
         OPTIONAL {?mapping mr:hasValueMap ?valueMap . }
         FILTER (?status NOT IN ("Deprecated", "Broken"))
-        MINUS {?mapping ^dc:replaces+ ?anothermap}
+        GRAPH <http://metarelate.net/currentMappings> { ?mapping a mr:Mapping . }
         }
         UNION {
         ?mapping mr:source ?target ;
@@ -505,7 +1380,7 @@ class FusekiServer(object):
         BIND("True" AS ?inverted)
         OPTIONAL {?mapping mr:hasValueMap ?valueMap . }
         FILTER (?status NOT IN ("Deprecated", "Broken"))
-        MINUS {?mapping ^dc:replaces+ ?anothermap}
+        GRAPH <http://metarelate.net/currentMappings> { ?mapping a mr:Mapping . }
         } }
         GRAPH <http://metarelate.net/concepts.ttl> { 
         ?source mr:hasFormat %s .
@@ -517,54 +1392,31 @@ class FusekiServer(object):
 
         ''' % (source, target)
         mappings = self.run_query(qstr)
-        mapping_list = []
-        for mapping in mappings:
-            mapping_list.append(self.structured_mapping(mapping))
-        return mapping_list
-
-    def _retrieve_component(self, uri, base=True):
-        qstr = metocean.Component.sparql_retriever(uri)
-        qcomp = self.retrieve(qstr)
-        if qcomp is None:
-            msg = 'Cannot retrieve URI {!r} from triple-store.'
-            raise ValueError(msg.format(uri))
-        for key in ['property', 'subComponent']:
-            if qcomp.get(key) is None:
-                qcomp[key] = []
-            if isinstance(qcomp[key], basestring):
-                qcomp[key] = [qcomp[key]]
-        if qcomp['property']:
-            properties = []
-            for puri in qcomp['property']:
-                qstr = metocean.Property.sparql_retriever(puri)
-                qprop = self.retrieve(qstr)
-                name = qprop['name']
-                name = metocean.Item(name, self.get_label(name))
-                curi = qprop.get('component')
-                if curi is not None:
-                    value = self._retrieve_component(curi, base=False)
-                else:
-                    value = qprop.get('value')
-                    if value is not None:
-                        value = metocean.Item(value, self.get_label(value))
-                    op = qprop.get('operator')
-                    if op is not None:
-                        op = metocean.Item(op, self.get_label(op))
-                properties.append(metocean.Property(puri, name, value, op))
-            result = metocean.PropertyComponent(uri, properties)
-        if qcomp['subComponent']:
-            components = []
-            for curi in qcomp['subComponent']:
-                components.append(self._retrieve_component(curi, base=False))
-            if base:
-                result = components
-            else:
-                result = metocean.Component(uri, components)
-        if base:
-            scheme = qcomp['format']
-            scheme = metocean.Item(scheme, self.get_label(scheme))
-            result = metocean.Concept(uri, scheme, result)
-        return result
+        return self.structured_mappings(mappings)
+
+    def _retrieve_concepts(self, uris):
+        """
+        Return the subgraph of the concepts graph describing each of the
+        concept uris, together with all of their components and
+        properties, as a dictionary of subjects to dictionaries of
+        predicates and object lists.
+
+        """
+        graph = {}
+        uris = sorted(set(uris))
+        for i in xrange(0, len(uris), _BULK_CHUNK):
+            qstr = '''
+            CONSTRUCT { ?s ?p ?o . }
+            WHERE {
+            VALUES ?concept { %s }
+            GRAPH <http://metarelate.net/concepts.ttl> {
+                ?concept (mr:hasComponent|mr:hasProperty)* ?s .
+                ?s ?p ?o .
+            }
+            }
+            ''' % '\n\t'.join(uris[i:i + _BULK_CHUNK])
+            graph.update(self.run_query(qstr, output='graph'))
+        return graph
 
     def _retrieve_value_map(self, valmap_id, inv):
         """
@@ -626,10 +1478,67 @@ class FusekiServer(object):
         return value_dict
 
     def structured_mapping(self, template):
-        uri = template['mapping']
-        source = self._retrieve_component(template['source'])
-        target = self._retrieve_component(template['target'])
-        return metocean.Mapping(uri, source, target)
+        """
+        Return the :class:`metocean.Mapping` described by the template,
+        a dictionary providing the 'mapping', 'source' and 'target' uris.
+
+        """
+        return self.structured_mappings([template])[0]
+
+    def structured_mappings(self, templates):
+        """
+        Return the list of :class:`metocean.Mapping` instances described
+        by the list of templates, each a dictionary providing the 'mapping',
+        'source' and 'target' uris.
+
+        The concept subgraphs for all of the templates are retrieved in
+        bulk, together with the skos:notation of every name, operator,
+        value and format which they reference.
+
+        """
+        pre = prefixes.Prefixes()
+        mr = '<{}{{}}>'.format(pre.mr).format
+        rdf = '<{}{{}}>'.format(pre['rdf']).format
+        concepts = [template[role] for template in templates
+                    for role in ['source', 'target']]
+        graph = self._retrieve_concepts(concepts)
+        subjects = set([index.COMPOUND_OPERATOR])
+        for record in graph.itervalues():
+            for pred in [mr('hasFormat'), mr('name'), mr('operator'),
+                         rdf('value')]:
+                subjects.update(record.get(pred, []))
+        labels = self.get_labels(subjects)
+        mappings = []
+        for template in templates:
+            source = index.build_component(template['source'], graph,
+                                           labels)
+            target = index.build_component(template['target'], graph,
+                                           labels)
+            mappings.append(metocean.Mapping(template['mapping'],
+                                             source, target))
+        return mappings
+
+    def mappings_by_uri(self, uris, debug=False):
+        """
+        Return the list of :class:`metocean.Mapping` instances of the
+        mapping uris, in the order given, retrieved in bulk by
+        :meth:`structured_mappings`.
+
+        """
+        templates = {}
+        for i in xrange(0, len(uris), _BULK_CHUNK):
+            qstr = '''SELECT ?mapping ?source ?target
+            WHERE {%s
+            GRAPH <http://metarelate.net/mappings.ttl> {
+            ?mapping mr:source ?source ;
+                     mr:target ?target .
+            }
+            }
+            ''' % _values('?mapping', uris[i:i + _BULK_CHUNK])
+            for template in self.run_query(qstr, debug=debug):
+                templates[template['mapping']] = template
+        return self.structured_mappings([templates[uri] for uri in uris
+                                         if uri in templates])
     
     def retrieve(self, qstr, debug=False):
         """
@@ -663,61 +1572,656 @@ class FusekiServer(object):
             raise ValueError(ec)
         return results
 
-    def mapping_by_properties(self, prop_list):
-        results = self.run_query(mapping_by_properties(prop_list))
-        mapping = None
-        maps = set([r['mapping'] for r in results])
-        if not mapping:
-            mappings = maps
+    def get_or_create(self, record, qstr, upstr, debug=False):
+        """
+        Return the existing record found by the SPARQL query string, or
+        else the record, having created it with the SPARQL update string.
+
+        The record, query and update string are those returned by the
+        sparql_get_or_create method of a metocean record class, for which
+        the record uri is the hash of its content. The query matches an
+        existing record with the same content, as many records of the
+        static data predate content hash uris, and is None for a mapping,
+        which is only identified by its hash, so is created in a single
+        request.
+
+        """
+        if qstr is not None:
+            found = self.run_query(qstr, debug=debug)
+            if found:
+                key, = record
+                return {key: found[0]['record']}
+        self.run_query(upstr, update=True, debug=debug)
+        return record
+
+    def existing_records(self, records, debug=False):
+        """
+        Return a dictionary of the uri of each of the records, an ordered
+        mapping of uris to their (graph, rdf:type, po_dict) content, to
+        the uri of an existing record with the same content, where there
+        is one, as the match function of :func:`metocean.resolve_records`.
+
+        A mapping is only identified by its hash, so is never matched.
+
+        """
+        candidates = {}
+        for uri, (graph, rdf_type, po_dict) in records.iteritems():
+            if rdf_type != 'mr:Mapping':
+                candidates.setdefault((graph, rdf_type), []).append(
+                    (uri, po_dict))
+        matches = {}
+        for (graph, rdf_type), kind_candidates in \
+                sorted(candidates.iteritems()):
+            for i in xrange(0, len(kind_candidates), _MATCH_CHUNK):
+                qstr = metocean.sparql_match_records(
+                    graph, rdf_type, kind_candidates[i:i + _MATCH_CHUNK])
+                for row in self.run_query(qstr, debug=debug):
+                    matches.setdefault(row['key'], row['record'])
+        return matches
+
+    def bulk_create(self, properties=(), components=(), mappings=(),
+                    debug=False):
+        """
+        Create many Property, Component and Mapping records, unless they
+        already exist, in a few SPARQL update requests.
+
+        Each record uri is the hash of its content, so is assigned locally,
+        unless a record with the same content already exists, when that
+        is used in its place. The existing records are found with a few
+        queries, then the other records are created in dependency order,
+        and each distinct record is only submitted once.
+
+        Kwargs:
+        * properties:
+            An iterable of property po_dicts.
+        * components:
+            An iterable of component po_dicts. A property po_dict may be
+            given in place of each mr:hasProperty uri, and a component
+            po_dict in place of each mr:hasComponent uri.
+        * mappings:
+            An iterable of mapping po_dicts. A component po_dict may be
+            given in place of the mr:source and mr:target uri.
+
+        Returns:
+            A tuple of the lists of property, component and mapping uris,
+            in the order given.
+
+        """
+        records = metocean.bulk_records()
+        uris = []
+        for kind, po_dicts in zip(records,
+                                  [properties, components, mappings]):
+            uris.append([metocean.bulk_record(kind, po_dict, records)
+                         for po_dict in po_dicts])
+        resolved = metocean.resolve_records(
+            records, lambda kind_records: self.existing_records(
+                kind_records, debug=debug))
+        uris = [[resolved[uri] for uri in kind_uris] for kind_uris in uris]
+        # The updates drop the indexes, which are instead brought up to
+        # date with just the new mappings.
+        replacements = self._replacements
+        properties = self._properties
+        self.bulk_update(metocean.record_updates(records), debug=debug)
+        if replacements is not None:
+            for uri, (_, _, po_dict) in records['mapping'].iteritems():
+                replacements.add(uri, _replaced(po_dict))
+            self._replacements = replacements
+        if properties is not None:
+            self._index_properties(
+                properties, records['mapping'].keys(),
+                [_replaced(po_dict) for _, _, po_dict in
+                 records['mapping'].itervalues()], debug=debug)
+            self._properties = properties
+        return tuple(uris)
+
+    def create_mapping(self, po_dict, debug=False):
+        """
+        Return the mapping record described by the po_dict, having created
+        it unless it already exists, and added it to the replacement index.
+
+        """
+        record, qstr, upstr = metocean.Mapping.sparql_get_or_create(po_dict)
+        # The update drops the indexes, which are instead brought up to
+        # date with just the new mapping.
+        replacements = self._replacements
+        properties = self._properties
+        self.get_or_create(record, qstr, upstr, debug=debug)
+        if replacements is not None:
+            replacements.add(record['mapping'], _replaced(po_dict))
+            self._replacements = replacements
+        if properties is not None:
+            self._index_properties(properties, [record['mapping']],
+                                   [_replaced(po_dict)], debug=debug)
+            self._properties = properties
+        return record
+
+    def replacement_index(self, debug=False):
+        """
+        Return the :class:`metocean.index.ReplacementIndex` of the
+        dc:replaces lineage of the mappings, built with a single query
+        when first required.
+
+        The index is kept up to date by :meth:`create_mapping` and
+        :meth:`bulk_create`, and rebuilt after a load or any other
+        update.
+
+        """
+        replacements = self._replacements
+        if replacements is None:
+            qstr = '''SELECT ?mapping ?replaces
+            WHERE {
+            GRAPH <http://metarelate.net/mappings.ttl> {
+            ?mapping rdf:type mr:Mapping .
+            OPTIONAL {?mapping dc:date ?date .}
+            OPTIONAL {?mapping dc:replaces ?replaces .}
+            }
+            }
+            ORDER BY ?date ?mapping
+            '''
+            columns = self.run_query(qstr, output='columns', debug=debug)
+            mappings = columns.get('mapping', [])
+            replaced = columns.get('replaces', [None] * len(mappings))
+            replacements = index.ReplacementIndex(zip(mappings, replaced))
+            self._replacements = replacements
+        return replacements
+
+    def mapping_head(self, mapping):
+        """
+        Return the uri of the current head of the replacement history of
+        the mapping uri, which is the mapping itself unless it has been
+        replaced.
+
+        """
+        return self.replacement_index().head(mapping)
+
+    def mapping_history(self, mapping):
+        """
+        Return the list of the mapping uri followed by each mapping it
+        replaces, in turn, back to the original mapping.
+
+        """
+        return self.replacement_index().history(mapping)
+
+    def bulk_update(self, upstrs, debug=False):
+        """
+        Run the SPARQL update strings, in order, combining many updates
+        into each request.
+
+        Returns:
+            The number of requests made.
+
+        """
+        requests = 0
+        for i in xrange(0, len(upstrs), _CREATE_CHUNK):
+            self.run_query(' ;\n'.join(upstrs[i:i + _CREATE_CHUNK]),
+                           update=True, debug=debug)
+            requests += 1
+        return requests
+
+    def property_index(self, debug=False):
+        """
+        Return the :class:`metocean.index.PropertyIndex` of the properties
+        of the current mappings, built with a single query when first
+        required.
+
+        The index is kept up to date by :meth:`create_mapping` and
+        :meth:`bulk_create`, and rebuilt after a load or any other
+        update.
+
+        """
+        properties = self._properties
+        if properties is None:
+            properties = index.PropertyIndex(
+                self._property_entries(debug=debug))
+            self._properties = properties
+        return properties
+
+    def _property_entries(self, mappings=None, debug=False):
+        """
+        Return the list of the (mapping, name, operator, value) of each
+        property of each current mapping, or only of each of the list of
+        mapping uris.
+
+        """
+        entries = []
+        if mappings is None:
+            chunks = [None]
         else:
-            mappings.intersection_update(maps)
-        return mappings
+            mappings = sorted(mappings)
+            chunks = [mappings[i:i + _BULK_CHUNK] for i in
+                      xrange(0, len(mappings), _BULK_CHUNK)]
+        for chunk in chunks:
+            qstr = '''SELECT DISTINCT ?mapping ?name ?operator ?value
+            WHERE {%s
+            GRAPH <http://metarelate.net/mappings.ttl> {
+            ?mapping mr:source|mr:target ?concept ;
+                     mr:status ?status .
+            FILTER (?status NOT IN ("Deprecated", "Broken"))
+            }
+            GRAPH <http://metarelate.net/currentMappings> { ?mapping a mr:Mapping . }
+            OPTIONAL {
+            GRAPH <http://metarelate.net/concepts.ttl> {
+            ?concept mr:hasProperty|mr:hasComponent/mr:hasProperty|
+                     mr:hasProperty/mr:hasComponent/mr:hasProperty ?property .
+            ?property mr:name ?name .
+            OPTIONAL {?property rdf:value ?value . }
+            OPTIONAL {?property mr:operator ?operator . }
+            }
+            }
+            }
+            ''' % _values('?mapping', chunk)
+            columns = self.run_query(qstr, output='columns', debug=debug)
+            found = columns.get('mapping', [])
+            none = [None] * len(found)
+            entries.extend(zip(found, columns.get('name', none),
+                               columns.get('operator', none),
+                               columns.get('value', none)))
+        return entries
+
+    def _index_properties(self, properties, mappings, replaced, debug=False):
+        """
+        Update the property index for the newly created mapping uris, which
+        replace the mappings in the replaced list, where not None.
+
+        """
+        for uri in replaced:
+            if uri is not None:
+                properties.discard(uri)
+        found = {}
+        for mapping, name, operator, value in \
+                self._property_entries(mappings, debug=debug):
+            props = found.setdefault(mapping, [])
+            if name is not None:
+                props.append((name, operator, value))
+        for mapping, props in found.iteritems():
+            properties.add(mapping, props)
+
+    def mapping_by_properties(self, prop_list, offset=0, limit=None):
+        """
+        Return the sorted list of the uris of the current mappings with a
+        property matching each of the property dictionaries in the list,
+        as :meth:`metocean.index.PropertyIndex.search`.
+
+        Kwargs:
+        * offset, limit:
+            The page of the results to return.
+
+        """
+        return self.property_index().search(prop_list, offset=offset,
+                                            limit=limit)
+
+
+class _ConnectionPool(object):
+    """
+    A thread-safe pool of persistent HTTP/1.1 keep-alive connections
+    to an Apache Fuseki SPARQL server.
+
+    Connections are created lazily, up to the configured pool size, and
+    are reused across queries. A caller blocks until a connection is
+    returned to the pool by another thread.
+
+    """
+    _headers = {'Content-Type': 'application/x-www-form-urlencoded',
+                'Connection': 'keep-alive'}
+
+    def __init__(self, host, port, size):
+        self.host = host
+        self.port = port
+        self.size = size
+        self._connections = Queue.LifoQueue(size)
+        for _ in xrange(size):
+            self._connections.put(None)
+
+    def post(self, path, body):
+        """
+        POST the url encoded body to the path on the server.
+
+        A connection that has been dropped by the server whilst idle in
+        the pool is transparently replaced, once.
+
+        Args:
+        * path:
+            The path of the server resource.
+        * body:
+            The url encoded request body.
+
+        Returns:
+            The response content string.
+
+        """
+        conn = self._connections.get()
+        try:
+            conn, response = self._request(conn, path, body)
+            data = response.read()
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (httplib.HTTPException, socket.error):
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            self._connections.put(conn)
+        return data
+
+    def stream(self, path, body):
+        """
+        POST the url encoded body to the path on the server, and generate
+        the response content in blocks, as it is received.
+
+        The connection is returned to the pool once the content has been
+        consumed, or is discarded if the generator is closed early.
+
+        Args:
+        * path:
+            The path of the server resource.
+        * body:
+            The url encoded request body.
+
+        """
+        conn = self._connections.get()
+        try:
+            conn, response = self._request(conn, path, body)
+            for block in iter(lambda: response.read(_STREAM_BLOCK), ''):
+                yield block
+            if response.will_close:
+                conn.close()
+                conn = None
+        except:
+            # Unread content would corrupt the next use of the connection.
+            if conn is not None:
+                conn.close()
+                conn = None
+            raise
+        finally:
+            self._connections.put(conn)
+
+    def _request(self, conn, path, body):
+        # Return the connection and the successful response to the POST,
+        # transparently replacing, once, a pooled connection that has been
+        # dropped by the server whilst idle.
+        reused = conn is not None
+        while True:
+            if conn is None:
+                conn = httplib.HTTPConnection(self.host, self.port)
+            try:
+                conn.request('POST', path, body, self._headers)
+                response = conn.getresponse()
+                break
+            except (httplib.HTTPException, socket.error):
+                conn.close()
+                conn = None
+                if not reused:
+                    raise
+                reused = False
+        if response.status != httplib.OK:
+            response.read()
+            msg = 'HTTP Error {}: {}'.format(response.status, response.reason)
+            raise httplib.HTTPException(msg)
+        return conn, response
+
+    def close(self):
+        """
+        Close all of the idle connections in the pool.
+
+        Connections currently in use are left to be recovered by
+        :meth:`post` when they are next used.
+
+        """
+        idle = 0
+        while True:
+            try:
+                conn = self._connections.get_nowait()
+            except Queue.Empty:
+                break
+            if conn is not None:
+                conn.close()
+            idle += 1
+        for _ in xrange(idle):
+            self._connections.put(None)
+
+
+def _parse_nquads(job):
+    """
+    helper method to parse a static turtle file into an N-Quads file of
+    its named graph, run in a worker process of the bulk loader
+
+    """
+    graph, infile, outfile, number = job
+    start = time.time()
+    triples = set(turtle.parse_file(infile))
+    graph = '<{}>'.format(graph)
+    # Blank node labels are scoped to their document.
+    bnode = '_:f{}_'.format(number)
+    with codecs.open(outfile, 'w', encoding='utf-8') as nquads:
+        for triple in triples:
+            triple = [bnode + term[2:] if term.startswith('_:') else term
+                      for term in triple]
+            nquads.write(turtle.nquad(*triple, graph=graph))
+    return graph[1:-1], len(triples), time.time() - start
+
+
+def _replaced(po_dict):
+    """
+    helper method to return the uri of the mapping replaced by the mapping
+    po_dict, or None
+
+    """
+    replaced = po_dict.get('dc:replaces')
+    if isinstance(replaced, list):
+        replaced = replaced[0] if replaced else None
+    return replaced
+
+
+def _file_checksum(filename):
+    """ helper method to return the SHA-1 hex digest of a file's content"""
+    sha1 = hashlib.sha1()
+    with open(filename, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), ''):
+            sha1.update(block)
+    return sha1.hexdigest()
+
+
+def _append_copy(filename, lines):
+    """
+    helper method to write a temporary copy of a file, in its directory,
+    with the lines appended, synced to disk, returning the temporary file
+    name and the number of bytes appended; the copy is not named as a
+    ttl file, so one left behind by a crash is never loaded as a graph
+
+    """
+    fd, temp = tempfile.mkstemp(suffix='.ttl.tmp',
+                                dir=os.path.dirname(filename))
+    try:
+        with os.fdopen(fd, 'wb') as outfile:
+            with open(filename, 'rb') as infile:
+                shutil.copyfileobj(infile, outfile)
+            outfile.write('\n')
+            size = 1
+            for line in lines:
+                outfile.write(line)
+                size += len(line)
+            outfile.flush()
+            os.fsync(outfile.fileno())
+    except:
+        os.remove(temp)
+        raise
+    return temp, size
+
+
+def _fsync_dirs(filenames):
+    """
+    helper method to sync the directories of the files to disk, so that
+    renames into them are durable
+
+    """
+    for dirname in set(os.path.dirname(filename) for filename in filenames):
+        fd = os.open(dirname, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
 
 
 def process_data(jsondata):
     """ helper method to take JSON output from a query and return the results"""
-    resultslist = []
+    try:
+        return list(iter_data(jsondata))
+    except (ValueError, TypeError):
+        return []
+
+
+def iter_data(jsondata):
+    """
+    Yield each row of the JSON output from a query in turn, as a dictionary
+    of variable names to result values, decoding one binding at a time.
+
+    The JSON output may be a string, or an iterable of the blocks of the
+    output as they are received from the server.
+
+    """
+    for binding in _iter_bindings(jsondata):
+        row = {}
+        for var, term in binding.iteritems():
+            row[var] = index.term_value(term)
+        if row:
+            yield row
+
+
+def process_columns(jsondata):
+    """
+    Return the JSON output from a query, as a string or an iterable of
+    blocks, as a dictionary of each variable name to the list of its
+    result values, in row order, with None where a row has no value for
+    the variable.
+
+    Repeated URI values share a single string.
+
+    """
+    columns = {}
+    try:
+        head = []
+        uris = {}
+        nrows = 0
+        for binding in _iter_bindings(jsondata, head):
+            if not columns:
+                for var in head:
+                    columns[var] = []
+            for var, term in binding.iteritems():
+                value = index.term_value(term)
+                if isinstance(value, basestring) and value.startswith('<'):
+                    value = uris.setdefault(value, value)
+                column = columns.get(var)
+                if column is None:
+                    column = columns[var] = []
+                column.extend([None] * (nrows - len(column)))
+                column.append(value)
+            nrows += 1
+        if not columns:
+            for var in head:
+                columns[var] = []
+    except (ValueError, TypeError):
+        return {}
+    for column in columns.itervalues():
+        column.extend([None] * (nrows - len(column)))
+    return columns
+
+
+def _iter_bindings(jsondata, head=None):
+    # Decode each object of the bindings array of a SPARQL JSON results
+    # document, given as a string or as an iterable of the string blocks
+    # of the document as they are received, without holding more than
+    # the undecoded remainder of a block in memory. The variable names of
+    # the results are appended to the head list, if given.
+    if isinstance(jsondata, basestring):
+        jsondata = [jsondata]
+    blocks = iter(jsondata)
+    data = ''
+    match = None
+    for block in blocks:
+        data += block
+        match = _BINDINGS.search(data)
+        if match is not None:
+            break
+    if head is not None:
+        end = len(data) if match is None else match.start()
+        names = _VARS.search(data, 0, end)
+        if names is not None:
+            head.extend(json.loads(names.group(1)))
+    if match is None:
+        return
+    data = data[match.end():]
+    pos = 0
+    # Whether a binding, or the end of the array, follows.
+    delimiter = False
+    first = True
+    while True:
+        pos = _JSON_SPACE.match(data, pos).end()
+        if pos == len(data):
+            block = next(blocks, None)
+            if block is None:
+                raise ValueError('Unterminated bindings array')
+            data = data[pos:] + block
+            pos = 0
+            continue
+        token = data[pos]
+        if (delimiter or first) and token == ']':
+            break
+        if delimiter:
+            if token != ',':
+                msg = 'Expecting , or ] delimiter: char {}'.format(pos)
+                raise ValueError(msg)
+            pos += 1
+            delimiter = False
+            continue
+        try:
+            binding, pos = _JSON.raw_decode(data, pos)
+        except ValueError:
+            # The binding may continue in the next block.
+            block = next(blocks, None)
+            if block is None:
+                raise
+            data = data[pos:] + block
+            pos = 0
+            continue
+        yield binding
+        delimiter = True
+        first = False
+
+
+def process_graph(jsondata):
+    """
+    helper method to take RDF/JSON output from a CONSTRUCT query and return
+    a dictionary of subjects to dictionaries of predicates and object lists
+
+    """
+    graph = {}
     try:
         jdata = json.loads(jsondata)
     except (ValueError, TypeError):
-        return resultslist
-    vars = jdata['head']['vars']
-    data = jdata['results']['bindings']
-    for item in data:
-        tmpdict = {}
-        for var in vars:
-            tmpvar = item.get(var)
-            if tmpvar:
-                val = tmpvar.get('value')
-                if str(val).startswith('http://') or \
-                   str(val).startswith('https://') :
-                    if len(val.split('&')) == 1:
-                        val = '<{}>'.format(val)
-                    else:
-                        val = ['<{}>'.format(v) for v in val.split('&')]
-                    # val = ['<{}>'.format(v) for v in val.split('&')]
-                else:
-                    try:
-                        int(val)
-                    except ValueError:
-                        try:
-                            float(val)
-                        except ValueError:
-                            if not val.startswith('<'):
-                                val = '"{}"'.format(val)
-                tmpdict[var] = val
-        if tmpdict != {}:
-            resultslist.append(tmpdict)
-    return resultslist
-
-
-def multiple_mappings(test_source=None):
+        return graph
+    for subject, predicates in jdata.iteritems():
+        record = graph.setdefault(index.result_value(subject), {})
+        for predicate, objects in predicates.iteritems():
+            values = record.setdefault(index.result_value(predicate), [])
+            for obj in objects:
+                value = index.term_value(obj)
+                if value not in values:
+                    values.append(value)
+    return graph
+
+
+def multiple_mappings(test_source=None, amaps=None, bmaps=None):
     """
     returns all the mappings which map the same source to a different target
     where the targets are the same format
     filter to a single test mapping with test_map
+    or to the pairs of mappings with the first mapping in the amaps
+    list of uris, or the second mapping in the bmaps list of uris
     
     """
+    values = _values('?amap', amaps) + _values('?bmap', bmaps)
     tm_filter = ''
     if test_source:
         pattern = '<http.*>'
@@ -726,7 +2230,7 @@ def multiple_mappings(test_source=None):
             tm_filter = '\n\tFILTER(?asource = {})'.format(test_source)
     qstr = '''SELECT ?amap ?asource ?atarget ?bmap ?bsource ?btarget
     (GROUP_CONCAT(DISTINCT(?value); SEPARATOR='&') AS ?signature)
-    WHERE {
+    WHERE {%s
     GRAPH <http://metarelate.net/mappings.ttl> { {
     ?amap mr:status ?astatus ;
          mr:source ?asource ;
@@ -738,7 +2242,7 @@ def multiple_mappings(test_source=None):
          mr:target ?asource ;
          mr:source ?atarget . } 
     FILTER (?astatus NOT IN ("Deprecated", "Broken"))
-    MINUS {?amap ^dc:replaces+ ?anothermap} %s
+    GRAPH <http://metarelate.net/currentMappings> { ?amap a mr:Mapping . } %s
     } 
     GRAPH <http://metarelate.net/mappings.ttl> { {
     ?bmap mr:status ?bstatus ;
@@ -751,7 +2255,7 @@ def multiple_mappings(test_source=None):
          mr:target ?bsource ;
          mr:source ?btarget . } 
     FILTER (?bstatus NOT IN ("Deprecated", "Broken"))
-    MINUS {?bmap ^dc:replaces+ ?bnothermap}
+    GRAPH <http://metarelate.net/currentMappings> { ?bmap a mr:Mapping . }
     filter (?bmap != ?amap)
     filter (?bsource = ?asource)
     filter (?btarget != ?atarget)
@@ -779,23 +2283,24 @@ def multiple_mappings(test_source=None):
     } }
     GROUP BY ?amap ?asource ?atarget ?bmap ?bsource ?btarget
     ORDER BY ?asource
-    ''' % tm_filter
+    ''' % (values, tm_filter)
     return qstr
 
 
-def valid_vocab():
+def valid_vocab(amaps=None):
     """
     find all valid mapping and every property they reference
+    optionally only for the mappings in the amaps list of uris
 
     """
     qstr = '''
     SELECT DISTINCT  ?amap 
     (GROUP_CONCAT(DISTINCT(?vocab); SEPARATOR = '&') AS ?signature)
-    WHERE {      
+    WHERE {%s
     GRAPH <http://metarelate.net/mappings.ttl> { {  
     ?amap mr:status ?astatus ; 
     FILTER (?astatus NOT IN ("Deprecated", "Broken")) 
-    MINUS {?amap ^dc:replaces+ ?anothermap}      }
+    GRAPH <http://metarelate.net/currentMappings> { ?amap a mr:Mapping . }      }
     { 
     ?amap mr:source ?fc .      }
     UNION {
@@ -816,64 +2321,72 @@ def valid_vocab():
     OPTIONAL {GRAPH ?g{?vocab ?p ?o .} }
     FILTER(!BOUND(?g))      }
     GROUP BY ?amap
-    '''
+    ''' % _values('?amap', amaps)
     return qstr
 
 
+def _row_key(row):
+    """
+    helper method to order the results of a validation check, whether
+    read from a persisted report or not
+
+    """
+    return json.dumps(row, sort_keys=True)
+
+
+def _values(var, uris):
+    """
+    helper method to return a SPARQL VALUES block binding the variable to
+    each of the uris, or an empty string if uris is None
+
+    """
+    if uris is None:
+        return ''
+    return '\n    VALUES %s { %s }' % (var, ' '.join(uris))
+
+
 def mapping_by_properties(prop_list):
     """
-    Return the mapping id's which contain all of the proerties
-    in the list of property dictionaries
-    
+    Return the query for the mapping id's which contain all of the
+    properties in the list of property dictionaries, each of which
+    may be in the source or the target of the mapping
+
     """
-    for prop_dict in prop_list:
+    concepts = ''
+    properties = ''
+    for i, prop_dict in enumerate(prop_list):
         fstr = ''
         name = prop_dict.get('mr:name')
         op = prop_dict.get('mr:operator')
         value = prop_dict.get('rdf:value')
         if name:
-            fstr += '\tFILTER(?name = {})\n'.format(name)
+            fstr += '\tFILTER(?name{} = {})\n'.format(i, name)
         if op:
-            fstr += '\tFILTER(?operator = {})\n'.format(op)
+            fstr += '\tFILTER(?operator{} = {})\n'.format(i, op)
         if value:
-            fstr += '\tFILTER(?value = {})\n'.format(value)
-            
-        qstr = '''SELECT DISTINCT ?mapping 
+            fstr += '\tFILTER(?value{} = {})\n'.format(i, value)
+        concepts += '''
+        ?mapping mr:source|mr:target ?concept{} .'''.format(i)
+        properties += '''
+        ?concept{0} mr:hasProperty|mr:hasComponent/mr:hasProperty|
+            mr:hasProperty/mr:hasComponent/mr:hasProperty ?property{0} .
+        ?property{0} mr:name ?name{0} .
+        OPTIONAL{{?property{0} rdf:value ?value{0} . }}
+        OPTIONAL{{?property{0} mr:operator ?operator{0} . }}
+{1}'''.format(i, fstr)
+    qstr = '''SELECT DISTINCT ?mapping
         WHERE {
-        GRAPH <http://metarelate.net/mappings.ttl> {    
+        GRAPH <http://metarelate.net/mappings.ttl> {
         ?mapping rdf:type mr:Mapping ;
-                 mr:source ?source ;
-                 mr:target ?target ;
-                 mr:status ?status ;
-
+                 mr:status ?status .%s
         FILTER (?status NOT IN ("Deprecated", "Broken"))
-        MINUS {?mapping ^dc:replaces+ ?anothermap}
-        }
-        GRAPH <http://metarelate.net/concepts.ttl> { {
-        ?source mr:hasProperty ?property
+        GRAPH <http://metarelate.net/currentMappings> { ?mapping a mr:Mapping . }
         }
-        UNION {
-        ?target mr:hasProperty ?property
+        GRAPH <http://metarelate.net/concepts.ttl> {%s
         }
-        UNION {
-        ?source mr:hasComponent/mr:hasProperty ?property
         }
-        UNION {
-        ?target mr:hasComponent/mr:hasProperty ?property
-        }
-        UNION {
-        ?source mr:hasProperty/mr:hasComponent/mr:hasProperty ?property
-        }
-        UNION {
-        ?target mr:hasProperty/mr:hasComponent/mr:hasProperty ?property
-        }
-        ?property mr:name ?name .
-        OPTIONAL{?property rdf:value ?value . }
-        OPTIONAL{?property mr:operator ?operator . }
-        %s
-        }
-        }
-        ''' % fstr
+        ORDER BY ?mapping
+        ''' % (concepts, properties)
     return qstr
 
 
@@ -896,13 +2409,4 @@ def mapping_by_properties(prop_list):
 
 def _vocab_graphs():
     """returns a list of the graphs which contain thirds party vocabularies """
-    vocab_graphs = []
-    vocab_graphs.append('<http://metarelate.net/formats.ttl>')
-    vocab_graphs.append('<http://um/umdpF3.ttl>')
-    vocab_graphs.append('<http://um/stashconcepts.ttl>')
-    vocab_graphs.append('<http://um/fieldcode.ttl>')
-    vocab_graphs.append('<http://cf/cf-model.ttl>')
-    vocab_graphs.append('<http://cf/cf-standard-name-table.ttl>')
-    vocab_graphs.append('<http://grib/apikeys.ttl>')
-    vocab_graphs.append('<http://openmath/ops.ttl>')
-    return vocab_graphs
+    return list(index.VOCAB_GRAPHS)
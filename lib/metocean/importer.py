@@ -0,0 +1,492 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides a pipeline for the bulk import of mappings from external
+resources into the metOcean triple store.
+
+Linkages are read from each source reader, resolved in parallel to
+their content hash record uris and content, deduplicated by those
+uris, matched against the existing records with the same content, then
+written either to the triple store in a few bulk requests, or offline
+as Turtle to the static data files, with no server running.
+
+A linkage is a dictionary of the mr:source and mr:target component
+po_dicts, each with its mr:hasFormat and a list of mr:hasProperty
+property po_dicts, and the mr:invertible literal. Any iterable of
+linkages may be used as a source reader.
+
+"""
+
+import codecs
+import csv
+import multiprocessing
+import os
+import shutil
+import tempfile
+import time
+
+import metocean
+import metocean.index as index
+import metocean.prefixes as prefixes
+import metocean.turtle as turtle
+
+
+# The operator of each imported property.
+_OPERATOR = '<http://www.openmath.org/cd/relation1.xhtml#eq>'
+
+# The number of linkages resolved between reports of progress.
+_PROGRESS = 1000
+
+# The saveCache flag predicate, which is not part of the content of a
+# record.
+_SAVE_CACHE = u'<http://www.metarelate.net/vocabulary/index.html#saveCache>'
+
+
+def linkage(source_format, source_properties, target_format,
+            target_properties, invertible=False):
+    """
+    Return the linkage between the properties of the source format and
+    the properties of the target format.
+
+    Args:
+    * source_format, target_format:
+        The format uri or notation, such as 'um' or 'cf'.
+    * source_properties, target_properties:
+        A list of the (name, value) pairs of each property, as SPARQL
+        terms such as 'cfm:units' and '"K"'.
+
+    Kwargs:
+    * invertible:
+        Whether the linkage also holds from the target to the source.
+
+    """
+    def component(fformat, properties):
+        props = [{'mr:name': name, 'mr:operator': _OPERATOR,
+                  'rdf:value': value} for name, value in properties]
+        return {'mr:hasFormat': [index.format_uri(fformat)],
+                'mr:hasProperty': props}
+
+    return {'mr:source': component(source_format, source_properties),
+            'mr:target': component(target_format, target_properties),
+            'mr:invertible': '"True"' if invertible else '"False"'}
+
+
+def _cf_properties(standard_name, units):
+    return [('cfm:standard_name', 'cfsn:%s' % standard_name),
+            ('cfm:units', '"%s"' % units),
+            ('cfm:type', 'cfm:Field')]
+
+
+class IrisReader(object):
+    """
+    Reads the UM field code and STASH to CF linkages of the Iris
+    :mod:`iris.fileformats.um_cf_map` tables.
+
+    """
+    def __init__(self, stash_to_cf=None):
+        """
+        Kwargs:
+        * stash_to_cf:
+            A dictionary of additional STASH codes to CF (standard name,
+            units) pairs, which take precedence over the Iris table.
+
+        """
+        self.stash_to_cf = stash_to_cf or {}
+
+    def __iter__(self):
+        import iris.fileformats.um_cf_map as umcf
+
+        for fc, cf in umcf.LBFC_TO_CF.iteritems():
+            invertible = umcf.CF_TO_LBFC.get(cf) == fc
+            yield linkage('um', [('moumdpF3:lbfc', 'mofc:%s' % fc)],
+                          'cf', _cf_properties(cf[0], cf[1]), invertible)
+        for cf, fc in umcf.CF_TO_LBFC.iteritems():
+            if umcf.LBFC_TO_CF.get(fc) != cf:
+                yield linkage('cf', _cf_properties(cf[0], cf[1]),
+                              'um', [('moumdpF3:lbfc', 'mofc:%i' % fc)])
+        stash_to_cf = dict(umcf.STASH_TO_CF, **self.stash_to_cf)
+        for stash, cf in stash_to_cf.iteritems():
+            yield linkage('um', [('moumdpF3:stash', 'moStCon:%s' % stash)],
+                          'cf', _cf_properties(cf[0], cf[1]))
+
+
+class GribParamRulesReader(object):
+    """
+    Reads the GRIB edition 2 parameter to CF linkages of an Iris
+    grib2paramrules file.
+
+    """
+    def __init__(self, filename):
+        self.filename = filename
+
+    def _rules(self):
+        # Yield the dictionary of the GRIB keys and CF attributes of each
+        # rule which sets a standard name.
+        container = {}
+        with open(self.filename) as rules:
+            for line in rules:
+                end = False
+                if line.startswith('IF'):
+                    container = {}
+                elif line.startswith('grib'):
+                    elems = line.split('==')
+                    key = elems[0].split('.')[1].strip()
+                    container[key] = elems[1].strip()
+                elif line.startswith('CM'):
+                    # CMAttribute("standard_name", "potential_temperature")
+                    line = line.split('CMAttribute("')[1]
+                    line = line.split('")')[0]
+                    name, value = line.split('", "')
+                    container[name] = value
+                elif not line.startswith('THEN'):
+                    end = True
+                if end and 'standard_name' in container:
+                    yield container
+                    container = {}
+        if 'standard_name' in container:
+            yield container
+
+    def __iter__(self):
+        standard_names = set()
+        for rule in self._rules():
+            if rule['standard_name'] in standard_names:
+                msg = 'Duplicate GRIB rule for the standard name {!r}.'
+                raise ValueError(msg.format(rule['standard_name']))
+            standard_names.add(rule['standard_name'])
+            grib = [('gribapi:editionNumber', '2'),
+                    ('gribapi:discipline', rule['discipline']),
+                    ('gribapi:parameterCategory', rule['parameterCategory']),
+                    ('gribapi:parameterNumber', rule['parameterNumber'])]
+            yield linkage('grib', grib, 'cf',
+                          _cf_properties(rule['standard_name'],
+                                         rule['units']),
+                          invertible=True)
+
+
+class CSVReader(object):
+    """
+    Reads linkages from a CSV file with a header row naming the columns
+    source_format, source_properties, target_format, target_properties
+    and invertible.
+
+    The properties of each component are given as '|' separated
+    name=value pairs of SPARQL terms, such as
+    cfm:standard_name=cfsn:air_temperature|cfm:units="K", and the
+    invertible column as True or False, defaulting to False.
+
+    """
+    def __init__(self, filename):
+        self.filename = filename
+
+    def __iter__(self):
+        with open(self.filename, 'rb') as csvfile:
+            for row in csv.DictReader(csvfile):
+                yield linkage(row['source_format'],
+                              _csv_properties(row['source_properties']),
+                              row['target_format'],
+                              _csv_properties(row['target_properties']),
+                              (row['invertible'] or '').strip() == 'True')
+
+
+def _csv_properties(text):
+    return [tuple(item.strip() for item in prop.split('=', 1))
+            for prop in text.split('|')]
+
+
+def _resolve(map_dict):
+    # Return the uri of the mapping, and the content of it and of its
+    # components and properties.
+    records = metocean.bulk_records()
+    uri = metocean.bulk_record('mapping', map_dict, records)
+    return uri, records
+
+
+class Importer(object):
+    """
+    Imports the linkages of source readers as mappings in the metOcean
+    triple store.
+
+    """
+    def __init__(self, fuseki_process, readers, mapping_p_o,
+                 processes=None, dry_run=False, turtle_dir=None):
+        """
+        Args:
+        * fuseki_process:
+            The :class:`metocean.fuseki.FusekiServer` to import into,
+            which may be None for a dry run or a Turtle import.
+        * readers:
+            An iterable of source readers, each an iterable of linkages.
+        * mapping_p_o:
+            The mapping po_dict of the creator, date, status, reason and
+            note shared by each imported mapping.
+
+        Kwargs:
+        * processes:
+            The number of worker processes which resolve the linkages,
+            defaulting to the number of CPUs.
+        * dry_run:
+            Resolve and report the records, without writing them to the
+            triple store.
+        * turtle_dir:
+            The static data directory to which the records are written
+            as Turtle, in place of the triple store.
+
+        """
+        self.fuseki_process = fuseki_process
+        self.readers = readers
+        self.mapping_p_o = mapping_p_o
+        self.processes = processes
+        self.dry_run = dry_run
+        self.turtle_dir = turtle_dir
+
+    def read(self):
+        """
+        Return the list of mapping po_dicts of the linkages of each reader.
+
+        """
+        map_dicts = []
+        for reader in self.readers:
+            start = time.time()
+            count = 0
+            for link in reader:
+                map_dict = dict(self.mapping_p_o)
+                map_dict.update(link)
+                map_dicts.append(map_dict)
+                count += 1
+            _report('read', count, 'linkages from {}'.format(
+                type(reader).__name__), start)
+        return map_dicts
+
+    def resolve(self, map_dicts):
+        """
+        Return the uri of each mapping and the deduplicated content of
+        each mapping, component and property record.
+
+        """
+        start = time.time()
+        uris = []
+        records = metocean.bulk_records()
+        pool = multiprocessing.Pool(self.processes)
+        try:
+            results = pool.imap(_resolve, map_dicts, chunksize=100)
+            for count, (uri, link_records) in enumerate(results, 1):
+                uris.append(uri)
+                for kind, kind_records in link_records.iteritems():
+                    for record, content in kind_records.iteritems():
+                        records[kind].setdefault(record, content)
+                if count % _PROGRESS == 0:
+                    _report('resolved', count, 'linkages', start)
+        finally:
+            pool.close()
+            pool.join()
+        _report('resolved', len(uris), 'linkages', start)
+        for kind, kind_records in records.iteritems():
+            print '  {} distinct {} records'.format(len(kind_records), kind)
+        return uris, records
+
+    def reuse(self, records):
+        """
+        Replace the records which already exist with the same content, in
+        the triple store or, for a Turtle import, in the static data
+        files, with the existing records, as by
+        :func:`metocean.resolve_records`.
+
+        Returns:
+            The dictionary of the uri of each record to the uri of the
+            record to use in its place.
+
+        """
+        start = time.time()
+        count = sum(len(kind_records) for kind_records in records.values())
+        if self.turtle_dir is not None:
+            match = _TurtleRecords(self.turtle_dir).existing_records
+        else:
+            match = self.fuseki_process.existing_records
+        resolved = metocean.resolve_records(records, match)
+        count -= sum(len(kind_records) for kind_records in records.values())
+        _report('reused', count, 'existing records', start)
+        return resolved
+
+    def write(self, records):
+        """
+        Write the records to the triple store, in dependency order.
+
+        Returns:
+            The number of requests made.
+
+        """
+        start = time.time()
+        upstrs = metocean.record_updates(records)
+        requests = self.fuseki_process.bulk_update(upstrs)
+        _report('wrote', len(upstrs), 'records in {} requests'.format(
+            requests), start)
+        return requests
+
+    def write_turtle(self, records):
+        """
+        Append the records to the Turtle file of their graph below the
+        static data directory, sorted by uri, skipping any record whose
+        uri is already a subject of that file. Each file is replaced
+        atomically, so is never left partially written.
+
+        Returns:
+            The number of records written.
+
+        """
+        start = time.time()
+        graphs = {}
+        for kind_records in records.itervalues():
+            for uri, (graph, rdf_type, po_dict) in kind_records.iteritems():
+                graphs.setdefault(graph, {})[uri] = (rdf_type, po_dict)
+        count = 0
+        for graph, graph_records in sorted(graphs.iteritems()):
+            fname = _graph_file(self.turtle_dir, graph)
+            count += _append_turtle(fname, graph_records)
+        _report('wrote', count, 'records as Turtle', start)
+        return count
+
+    def run(self):
+        """
+        Run the import pipeline.
+
+        Returns:
+            A dictionary of the import statistics.
+
+        """
+        start = time.time()
+        map_dicts = self.read()
+        uris, records = self.resolve(map_dicts)
+        if self.fuseki_process is not None or self.turtle_dir is not None:
+            resolved = self.reuse(records)
+            uris = [resolved[uri] for uri in uris]
+        stats = dict(linkages=len(map_dicts), mappings=len(set(uris)),
+                     duplicates=len(uris) - len(set(uris)), requests=0)
+        for kind, kind_records in records.iteritems():
+            stats[kind] = len(kind_records)
+        if self.dry_run:
+            print 'dry run, nothing written'
+        elif self.turtle_dir is not None:
+            self.write_turtle(records)
+        else:
+            stats['requests'] = self.write(records)
+        stats['seconds'] = time.time() - start
+        msg = 'imported {mappings} mappings from {linkages} linkages ' \
+            '({duplicates} duplicates) in {seconds:.2f}s'
+        print msg.format(**stats)
+        return stats
+
+
+def _report(action, count, what, start):
+    elapsed = time.time() - start
+    rate = count / elapsed if elapsed else 0.0
+    print '{} {} {} in {:.2f}s ({:.0f}/s)'.format(action, count, what,
+                                                  elapsed, rate)
+
+
+def _statements(rdf_type, po_dict):
+    # Return the sorted (predicate, object) statements of a record, with
+    # its rdf:type first.
+    statements = [('rdf:type', rdf_type)]
+    for pred in sorted(po_dict):
+        objs = po_dict[pred]
+        if not isinstance(objs, list):
+            objs = [objs]
+        statements.extend((pred, obj) for obj in sorted(objs))
+    return statements
+
+
+def _graph_file(turtle_dir, graph):
+    # A graph <http://metarelate.net/concepts.ttl> is loaded from the
+    # metarelate.net/concepts.ttl static data file.
+    return os.path.join(turtle_dir, graph.strip('<>').split('://', 1)[-1])
+
+
+class _TurtleRecords(object):
+    # The records of the static data Turtle files, by their content, as
+    # the match function of metocean.resolve_records for an offline
+    # import. Each file is read when first required.
+    def __init__(self, turtle_dir):
+        self.turtle_dir = turtle_dir
+        self._prefixes = prefixes.Prefixes().turtle
+        self._contents = {}
+
+    def _graph_contents(self, graph):
+        contents = self._contents.get(graph)
+        if contents is None:
+            statements = {}
+            fname = _graph_file(self.turtle_dir, graph)
+            if os.path.exists(fname):
+                for subject, pred, obj in turtle.parse_file(fname):
+                    if pred != _SAVE_CACHE:
+                        statements.setdefault(subject, set()).add((pred, obj))
+            contents = {}
+            # The first of several records with the same content is used.
+            for subject in sorted(statements, reverse=True):
+                contents[frozenset(statements[subject])] = subject
+            self._contents[graph] = contents
+        return contents
+
+    def existing_records(self, records):
+        matches = {}
+        for uri, (graph, rdf_type, po_dict) in records.iteritems():
+            # A mapping is only identified by its hash.
+            if rdf_type == 'mr:Mapping':
+                continue
+            # Parse the record as written, for the same terms as the file.
+            block = turtle.subject_block(uri, _statements(rdf_type, po_dict))
+            content = frozenset((pred, obj) for _, pred, obj in
+                                turtle.parse(self._prefixes + block))
+            existing = self._graph_contents(graph).get(content)
+            if existing is not None:
+                matches[uri] = existing
+        return matches
+
+
+def _append_turtle(fname, records):
+    # Append the records, a dictionary of uris to their (rdf:type,
+    # po_dict) content, to the Turtle file via a temporary copy, returning
+    # the number of records written. The copy is not named as a ttl file,
+    # so one left behind by a crash is never loaded as a graph.
+    existing = set()
+    if os.path.exists(fname):
+        existing = set(subject for subject, _, _ in turtle.parse_file(fname))
+    uris = sorted(uri for uri in records if uri not in existing)
+    if not uris:
+        return 0
+    dirname = os.path.dirname(fname)
+    if not os.path.isdir(dirname):
+        os.makedirs(dirname)
+    fd, temp = tempfile.mkstemp(suffix='.ttl.tmp', dir=dirname)
+    try:
+        with codecs.getwriter('utf-8')(os.fdopen(fd, 'wb')) as outfile:
+            if os.path.exists(fname):
+                with open(fname, 'rb') as infile:
+                    shutil.copyfileobj(infile, outfile.stream)
+                shutil.copymode(fname, temp)
+            else:
+                outfile.write(prefixes.Prefixes().turtle)
+                outfile.write(u'\n')
+                os.chmod(temp, 0644)
+            for uri in uris:
+                rdf_type, po_dict = records[uri]
+                outfile.write(turtle.subject_block(
+                    uri, _statements(rdf_type, po_dict)))
+        os.rename(temp, fname)
+    finally:
+        if os.path.exists(temp):
+            os.remove(temp)
+    return len(uris)
@@ -0,0 +1,713 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides a read-only, in-memory index of the metOcean mappings, which
+answers mapping retrievals without an Apache Fuseki SPARQL server,
+in-memory indexes of the replacement lineage of the mappings, of the
+declared subjects of each graph and of the properties of the current
+mappings, and the detection of ambiguous mappings from a flat table of
+mappings.
+
+"""
+
+from collections import defaultdict
+import glob
+import os
+import threading
+
+import metocean
+import metocean.prefixes as prefixes
+import metocean.turtle as turtle
+
+
+# The named graphs of the metarelate mappings and concepts.
+MAPPINGS_GRAPH = '<http://metarelate.net/mappings.ttl>'
+CONCEPTS_GRAPH = '<http://metarelate.net/concepts.ttl>'
+
+# The named graphs which contain third party vocabularies.
+VOCAB_GRAPHS = ['<http://metarelate.net/formats.ttl>',
+                '<http://um/umdpF3.ttl>',
+                '<http://um/stashconcepts.ttl>',
+                '<http://um/fieldcode.ttl>',
+                '<http://cf/cf-model.ttl>',
+                '<http://cf/cf-standard-name-table.ttl>',
+                '<http://grib/apikeys.ttl>',
+                '<http://openmath/ops.ttl>']
+
+# The operator of a compound property which does not state one.
+COMPOUND_OPERATOR = '<http://www.openmath.org/cd/relation1.xhtml#eq>'
+
+# Mappings with any other status are current.
+_EXCLUDED_STATUS = set(['"Deprecated"', '"Broken"'])
+
+# The characters which may start the value of a numeric literal.
+_NUMERIC_START = frozenset('0123456789+-.iInN')
+
+# Datatypes whose lexical values are always numeric.
+_NUMERIC_DATATYPES = frozenset(
+    'http://www.w3.org/2001/XMLSchema#{}'.format(name) for name in
+    ['integer', 'int', 'long', 'short', 'byte', 'nonNegativeInteger',
+     'positiveInteger', 'nonPositiveInteger', 'negativeInteger',
+     'unsignedLong', 'unsignedInt', 'unsignedShort', 'unsignedByte',
+     'decimal', 'float', 'double'])
+
+
+def format_uri(fmt):
+    """
+    Return the format uri for either a format uri or a format notation,
+    such as 'um' or 'cf'.
+
+    """
+    if isinstance(fmt, basestring) and not metocean.Item(fmt).is_uri():
+        fmt = os.path.join('<http://www.metarelate.net/metOcean/format',
+                           '{}>'.format(fmt.lower()))
+    return fmt
+
+
+def result_value(val):
+    """
+    Format a single query result value, wrapping URIs in angle brackets
+    and quoting non numeric literals.
+
+    """
+    if val.startswith(('http://', 'https://')):
+        if len(val.split('&')) == 1:
+            val = '<{}>'.format(val)
+        else:
+            val = ['<{}>'.format(v) for v in val.split('&')]
+    else:
+        head = val[:1]
+        if head.isspace():
+            head = val.lstrip()[:1]
+        # Only attempt to parse values which could start a number.
+        numeric = head in _NUMERIC_START or head.isdigit()
+        if numeric:
+            try:
+                int(val)
+            except ValueError:
+                try:
+                    float(val)
+                except ValueError:
+                    numeric = False
+        if not numeric and not val.startswith('<'):
+            val = '"{}"'.format(val)
+    return val
+
+
+def term_value(term):
+    """
+    Format a single SPARQL JSON or RDF/JSON result term, as
+    :func:`result_value`, using the type of the term to avoid inspecting
+    its value where possible.
+
+    """
+    val = term['value']
+    if term.get('datatype') in _NUMERIC_DATATYPES:
+        result = val
+    elif term['type'] == 'uri' and '&' not in val and \
+            val.startswith(('http://', 'https://')):
+        result = '<{}>'.format(val)
+    else:
+        result = result_value(val)
+    return result
+
+
+def notation_label(subject, notations):
+    """
+    Return the label for a subject from its list of skos:notation values,
+    falling back to the fragment of a hash URI or the subject itself.
+
+    """
+    if len(notations) == 0:
+        hash_split = subject.split('#')
+        if len(hash_split) == 2 and hash_split[1].endswith('>'):
+            label = hash_split[1].rstrip('>')
+        else:
+            # raise ValueError('{} returns no notation'.format(subject))
+            label = subject
+    elif len(notations) >1:
+        raise ValueError('{} returns multiple notation'.format(subject))
+    else:
+        label = notations[0]
+    return label
+
+
+def ambiguous_pairs(table):
+    """
+    Return the ambiguous pairs of mappings, which map the same source to
+    different targets of the same format.
+
+    The mappings are grouped by source and target format in a single
+    pass, an invertible mapping also being grouped by its target and
+    source format, so only the mappings within a group are compared.
+
+    Args:
+    * table:
+        An iterable of the (mapping, source, source format, target,
+        target format, invertible) of each mapping, where invertible is
+        a boolean.
+
+    Returns:
+        The sorted list of the (amap, asource, atarget, bmap, bsource,
+        btarget) of each ambiguous pair, in both orders, with the source
+        and target of an inverted mapping exchanged.
+
+    """
+    groups = defaultdict(set)
+    for mapping, source, source_format, target, target_format, \
+            invertible in table:
+        groups[(source, target_format)].add((mapping, target))
+        if invertible:
+            groups[(target, source_format)].add((mapping, source))
+    pairs = set()
+    for (source, _), members in groups.iteritems():
+        if len(members) < 2:
+            continue
+        for amap, atarget in members:
+            for bmap, btarget in members:
+                if amap != bmap and atarget != btarget:
+                    pairs.add((amap, source, atarget, bmap, source, btarget))
+    return sorted(pairs)
+
+
+def build_component(uri, graph, labels, base=True):
+    """
+    Construct the :class:`metocean.Concept` or :class:`metocean.Component`
+    identified by the uri.
+
+    Args:
+    * uri:
+        The uri of the concept or component.
+    * graph:
+        The concepts graph, as a dictionary of subjects to dictionaries
+        of predicates and object lists, in the form returned by
+        :func:`metocean.fuseki.process_graph`.
+    * labels:
+        A dictionary of the notation label of each name, operator,
+        value and format.
+
+    Kwargs:
+    * base:
+        Whether the uri identifies a concept, rather than a component
+        of a concept.
+
+    """
+    pre = prefixes.Prefixes()
+    mr = '<{}{{}}>'.format(pre.mr).format
+    rdf = '<{}{{}}>'.format(pre['rdf']).format
+    record = graph.get(uri, {})
+    if not record.get(mr('hasFormat')):
+        msg = 'Cannot retrieve URI {!r} from triple-store.'
+        raise ValueError(msg.format(uri))
+    result = None
+    puris = record.get(mr('hasProperty'), [])
+    if puris:
+        properties = []
+        for puri in puris:
+            prop = graph.get(puri, {})
+            if len(prop.get(mr('name'), [])) != 1:
+                msg = '{} is a malformed property'.format(puri)
+                raise ValueError(msg)
+            name, = prop[mr('name')]
+            name = metocean.Item(name, labels[name])
+            value = op = None
+            curis = prop.get(mr('hasComponent'), [])
+            values = prop.get(rdf('value'), [])
+            ops = prop.get(mr('operator'), [])
+            if len(curis) > 1 or len(ops) > 1 or len(values) > 1:
+                msg = '{} is a malformed property'.format(puri)
+                raise ValueError(msg)
+            if curis:
+                value = build_component(curis[0], graph, labels, base=False)
+                # A compound property relates its name to its component
+                # by equality, unless an operator is stated.
+                op = ops[0] if ops else COMPOUND_OPERATOR
+                op = metocean.Item(op, labels[op])
+            elif values and ops:
+                # A value is only meaningful with its operator.
+                value = metocean.Item(values[0], labels[values[0]])
+                op = metocean.Item(ops[0], labels[ops[0]])
+            properties.append(metocean.Property(puri, name, value, op))
+        result = metocean.PropertyComponent(uri, properties)
+    curis = record.get(mr('hasComponent'), [])
+    if curis:
+        components = []
+        for curi in curis:
+            components.append(build_component(curi, graph, labels,
+                                              base=False))
+        if base:
+            result = components
+        else:
+            result = metocean.Component(uri, components)
+    if result is None:
+        msg = '{} is a malformed component'.format(uri)
+        raise ValueError(msg)
+    if base:
+        scheme, = record[mr('hasFormat')]
+        scheme = metocean.Item(scheme, labels[scheme])
+        result = metocean.Concept(uri, scheme, result)
+    return result
+
+
+def _term_value(term):
+    # Format an N-Triples term as the equivalent query result value.
+    if turtle.is_iri(term):
+        value = result_value(term[1:-1])
+    elif turtle.is_literal(term):
+        value = result_value(turtle.literal_parts(term)[0])
+    else:
+        value = result_value(term)
+    return value
+
+
+class _Labels(dict):
+    # Lazily derive the notation label of each subject.
+    def __init__(self, notations):
+        super(_Labels, self).__init__()
+        self._notations = notations
+
+    def __missing__(self, subject):
+        label = notation_label(subject, self._notations.get(subject, []))
+        self[subject] = label
+        return label
+
+
+class MappingIndex(object):
+    """
+    A read-only, in-memory index of the current metOcean mappings
+    between each pair of formats.
+
+    The index applies the same semantics as
+    :meth:`metocean.fuseki.FusekiServer.retrieve_mappings`: mappings with
+    a "Deprecated" or "Broken" status, or which are replaced by another
+    mapping, are excluded, and invertible mappings are also indexed from
+    their target format to their source format.
+
+    """
+    def __init__(self, quads):
+        """
+        Build the index from the (subject, predicate, object, graph)
+        N-Triples terms of the mappings, concepts and vocabulary graphs.
+
+        """
+        pre = prefixes.Prefixes()
+        mr = '<{}{{}}>'.format(pre.mr).format
+        notation = '<{}notation>'.format(pre.skos)
+        vocab_graphs = set(VOCAB_GRAPHS)
+        records = defaultdict(lambda: defaultdict(list))
+        concepts = {}
+        notations = defaultdict(list)
+        for subject, predicate, obj, graph in set(quads):
+            if graph == MAPPINGS_GRAPH:
+                records[subject][predicate].append(obj)
+            elif graph == CONCEPTS_GRAPH:
+                record = concepts.setdefault(_term_value(subject), {})
+                values = record.setdefault(_term_value(predicate), [])
+                value = _term_value(obj)
+                if value not in values:
+                    values.append(value)
+            if graph in vocab_graphs and predicate == notation:
+                notations[subject].append(_term_value(obj))
+        replaced = set()
+        for record in records.itervalues():
+            replaced.update(_term_value(term) for term in
+                            record.get('<{}replaces>'.format(pre.dc), []))
+        rows = defaultdict(list)
+        for uri, record in records.iteritems():
+            uri = _term_value(uri)
+            statuses = set(record.get(mr('status'), []))
+            if uri in replaced or not statuses - _EXCLUDED_STATUS:
+                continue
+            invertible = '"True"' in record.get(mr('invertible'), [])
+            for source in map(_term_value, record.get(mr('source'), [])):
+                for target in map(_term_value, record.get(mr('target'), [])):
+                    for sformat in concepts.get(source, {}).get(
+                            mr('hasFormat'), []):
+                        for tformat in concepts.get(target, {}).get(
+                                mr('hasFormat'), []):
+                            rows[(sformat, tformat)].append((uri, source,
+                                                             target))
+                            if invertible:
+                                rows[(tformat, sformat)].append((uri, target,
+                                                                 source))
+        for key in rows:
+            rows[key].sort(key=lambda row: row[0])
+        self._rows = dict(rows)
+        self._concepts = concepts
+        self._labels = _Labels(dict(notations))
+        self._mappings = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_static(cls, static_dir):
+        """
+        Build the index from the turtle files of the static data
+        directory, as loaded by :meth:`metocean.fuseki.FusekiServer.load`.
+
+        """
+        graphs = set(VOCAB_GRAPHS + [MAPPINGS_GRAPH, CONCEPTS_GRAPH])
+        quads = []
+        for insubgraph in glob.glob(os.path.join(static_dir, '*', '*.ttl')):
+            graph = '<http://{}/{}>'.format(
+                os.path.basename(os.path.dirname(insubgraph)),
+                os.path.basename(insubgraph))
+            if graph in graphs:
+                quads.extend(triple + (graph,) for triple in
+                             turtle.parse_file(insubgraph))
+        return cls(quads)
+
+    @classmethod
+    def from_nquads(cls, filename):
+        """
+        Build the index from an N-Quads dump of the triple store, such as
+        an Apache Fuseki backup, which may be gzip compressed.
+
+        """
+        return cls(turtle.parse_nquads_file(filename))
+
+    def __len__(self):
+        return sum(len(rows) for rows in self._rows.itervalues())
+
+    def formats(self):
+        """
+        Return the list of (source, target) format uri pairs which have
+        mappings.
+
+        """
+        return sorted(self._rows)
+
+    def retrieve_mappings(self, source, target):
+        """
+        Return the list of :class:`metocean.Mapping` instances for a
+        particular source and target format, given either as format uris
+        or notations.
+
+        The returned mappings are shared between callers, and must not
+        be modified.
+
+        """
+        key = (format_uri(source), format_uri(target))
+        with self._lock:
+            mappings = self._mappings.get(key)
+            if mappings is None:
+                mappings = []
+                for uri, source, target in self._rows.get(key, []):
+                    source = build_component(source, self._concepts,
+                                             self._labels)
+                    target = build_component(target, self._concepts,
+                                             self._labels)
+                    mappings.append(metocean.Mapping(uri, source, target))
+                self._mappings[key] = mappings
+        return list(mappings)
+
+
+class ReplacementIndex(object):
+    """
+    An in-memory index of the dc:replaces lineage of the metOcean
+    mappings.
+
+    Each mapping replaces at most one earlier mapping, so the history of
+    a mapping is a chain back to its original mapping, although a mapping
+    may be replaced by more than one later mapping. The head of a mapping
+    is the most recently created mapping which descends from it, or the
+    mapping itself when it has not been replaced.
+
+    The head of each mapping is maintained as mappings are added, so is
+    found in constant time, whilst a history takes time proportional to
+    its length.
+
+    """
+    def __init__(self, lineage=()):
+        """
+        Kwargs:
+        * lineage:
+            An iterable of the (mapping, replaced) uris of each mapping,
+            in order of creation, where replaced is None for a mapping
+            which replaces no other.
+
+        """
+        self._replaces = {}
+        self._heads = {}
+        self._lock = threading.Lock()
+        mappings = []
+        for mapping, replaced in lineage:
+            if replaced is not None:
+                self._replaces[mapping] = replaced
+            mappings.append(mapping)
+        # All of the links are known before the heads are propagated, so
+        # a mapping may be listed before the mapping it replaces.
+        for mapping in mappings:
+            self._promote(mapping)
+
+    def __len__(self):
+        return len(self._heads)
+
+    def __contains__(self, mapping):
+        return mapping in self._heads
+
+    def _promote(self, mapping):
+        # Make the head of the mapping, which is the mapping itself unless
+        # a descendant has already been promoted, the head of its history.
+        head = self._heads.setdefault(mapping, mapping)
+        for ancestor in self._lineage(mapping)[1:]:
+            self._heads[ancestor] = head
+
+    def _lineage(self, mapping):
+        # Return the chain of replaced mappings, guarding against cycles.
+        history = [mapping]
+        seen = set(history)
+        replaced = self._replaces.get(mapping)
+        while replaced is not None and replaced not in seen:
+            history.append(replaced)
+            seen.add(replaced)
+            replaced = self._replaces.get(replaced)
+        return history
+
+    def add(self, mapping, replaced=None):
+        """
+        Index a newly created mapping, which replaces the replaced
+        mapping, if given, making it the head of its history.
+
+        Returns:
+            Whether the mapping was added, as it was not already indexed.
+
+        """
+        with self._lock:
+            if mapping in self._heads:
+                return False
+            if replaced is not None:
+                self._replaces[mapping] = replaced
+            self._promote(mapping)
+        return True
+
+    def head(self, mapping):
+        """
+        Return the current head of the history of the mapping uri.
+
+        """
+        return self._heads.get(mapping, mapping)
+
+    def history(self, mapping):
+        """
+        Return the list of the mapping uri followed by each mapping it
+        replaces, in turn, back to the original mapping.
+
+        """
+        with self._lock:
+            return self._lineage(mapping)
+
+
+def _namespace(uri):
+    # The namespace of a uri, up to and including its last '#' or '/'.
+    return uri[:max(uri.rfind('#'), uri.rfind('/')) + 1]
+
+
+class VocabularyIndex(object):
+    """
+    An in-memory index of the subject uris declared by each named graph,
+    so that the uris referenced by the mappings may be checked against
+    the vocabularies by set membership.
+
+    An undeclared uri which differs from a declared subject only in case,
+    or which shares the namespace of the subjects of a vocabulary graph,
+    is attributed to that vocabulary as a near miss.
+
+    """
+    def __init__(self, declarations=()):
+        """
+        Kwargs:
+        * declarations:
+            An iterable of the (graph, subject) uris of each subject
+            declared in each graph.
+
+        """
+        self._subjects = defaultdict(set)
+        for graph, subject in declarations:
+            self._subjects[graph].add(subject)
+        self._declared = set()
+        for subjects in self._subjects.itervalues():
+            self._declared.update(subjects)
+        self._folded = {}
+        namespaces = defaultdict(lambda: defaultdict(int))
+        for graph in VOCAB_GRAPHS:
+            for subject in self._subjects.get(graph, ()):
+                self._folded.setdefault(subject.lower(), graph)
+                namespaces[_namespace(subject)][graph] += 1
+        # Attribute each namespace to the vocabulary declaring the most
+        # subjects in it.
+        self._namespaces = {}
+        for namespace, counts in namespaces.iteritems():
+            self._namespaces[namespace] = max(sorted(counts),
+                                              key=counts.get)
+
+    def __len__(self):
+        return len(self._declared)
+
+    def __contains__(self, uri):
+        return uri in self._declared
+
+    def subjects(self, graph):
+        """
+        Return the frozenset of the subject uris declared in the graph.
+
+        """
+        return frozenset(self._subjects.get(graph, ()))
+
+    def undeclared(self, uris):
+        """
+        Return the sorted list of the uris which are not declared as a
+        subject in any graph.
+
+        """
+        return sorted(set(uris).difference(self._declared))
+
+    def vocabulary(self, uri):
+        """
+        Return the vocabulary graph to which the undeclared uri probably
+        belongs, or None if there is no near miss.
+
+        """
+        graph = self._folded.get(uri.lower())
+        if graph is None:
+            graph = self._namespaces.get(_namespace(uri))
+        return graph
+
+
+class PropertyIndex(object):
+    """
+    An in-memory inverted index of the (name, operator, value) of each
+    property of the source and target concepts of the current mappings
+    to the mapping uris, so that the mappings with all of a number of
+    properties are found by set intersection.
+
+    """
+    # The search term keys of the name, operator and value of a property.
+    _KEYS = ('mr:name', 'mr:operator', 'rdf:value')
+
+    def __init__(self, entries=()):
+        """
+        Kwargs:
+        * entries:
+            An iterable of the (mapping, name, operator, value) of each
+            property of each mapping, where operator or value are None
+            for a property which does not state one, and name is None
+            for a mapping without properties.
+
+        """
+        # The mappings with each property, the properties of each
+        # mapping, and the properties with each name, operator or value.
+        self._postings = defaultdict(set)
+        self._properties = defaultdict(set)
+        self._fields = [defaultdict(set) for _ in self._KEYS]
+        self._lock = threading.Lock()
+        for mapping, name, operator, value in entries:
+            if name is None:
+                self._properties[mapping]
+            else:
+                self._add(mapping, (name, operator, value))
+
+    def __len__(self):
+        return len(self._properties)
+
+    def __contains__(self, mapping):
+        return mapping in self._properties
+
+    def _add(self, mapping, prop):
+        self._postings[prop].add(mapping)
+        self._properties[mapping].add(prop)
+        for field, term in zip(self._fields, prop):
+            if term is not None:
+                field[term].add(prop)
+
+    def add(self, mapping, properties):
+        """
+        Index the (name, operator, value) of each of the properties of a
+        newly current mapping.
+
+        """
+        with self._lock:
+            # A mapping without properties may still be searched for.
+            self._properties[mapping]
+            for prop in properties:
+                self._add(mapping, tuple(prop))
+
+    def discard(self, mapping):
+        """
+        Remove a mapping which is no longer current from the index.
+
+        """
+        with self._lock:
+            for prop in self._properties.pop(mapping, ()):
+                mappings = self._postings[prop]
+                mappings.discard(mapping)
+                if not mappings:
+                    del self._postings[prop]
+                    for field, term in zip(self._fields, prop):
+                        if term is not None:
+                            field[term].discard(prop)
+                            if not field[term]:
+                                del field[term]
+
+    def _matches(self, term):
+        # Return the set of the mappings with a property matching every
+        # name, operator and value stated by the search term.
+        props = None
+        for field, key in zip(self._fields, self._KEYS):
+            if term.get(key):
+                matched = field.get(term[key], set())
+                if props is None:
+                    props = set(matched)
+                else:
+                    props.intersection_update(matched)
+        if props is None:
+            result = set(self._properties)
+        else:
+            result = set()
+            for prop in props:
+                result.update(self._postings[prop])
+        return result
+
+    def search(self, terms, offset=0, limit=None):
+        """
+        Return the sorted list of the uris of the mappings with a property
+        matching each of the search terms.
+
+        Args:
+        * terms:
+            A list of dictionaries of any of the 'mr:name', 'mr:operator'
+            and 'rdf:value' of a property. Every mapping matches an empty
+            list.
+
+        Kwargs:
+        * offset, limit:
+            The page of the results to return.
+
+        """
+        with self._lock:
+            # Intersect the smallest sets first.
+            matches = sorted((self._matches(term) for term in terms),
+                             key=len)
+            if matches:
+                result = matches[0]
+                for match in matches[1:]:
+                    result.intersection_update(match)
+            else:
+                result = set(self._properties)
+        result = sorted(result)
+        stop = None if limit is None else offset + limit
+        return result[offset:stop]
+
@@ -2,75 +2,130 @@
 
 import StringIO
 import re
+import threading
+
+
+_PREFIXES = {
+    'rdfs'     : 'http://www.w3.org/2000/01/rdf-schema#',
+    'rdf'      : 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
+    'skos'     : 'http://www.w3.org/2004/02/skos/core#',
+    'xsd'      : 'http://www.w3.org/2001/XMLSchema#',
+    'dc'       : 'http://purl.org/dc/terms/',
+    'github'   : 'https://github.com/' ,
+    'map'      : 'http://www.metarelate.net/metOcean/mapping/',
+    'mr'       : 'http://www.metarelate.net/vocabulary/index.html#',
+    'metoc'    : 'http://www.metarelate.net/metOcean/' ,
+    'metocFormat' : 'http://www.metarelate.net/metOcean/format/' ,
+    'metocMed' : 'http://www.metarelate.net/metOcean/mediator/' ,
+    'moStCon'  : 'http://reference.metoffice.gov.uk/def/um/stash/concept/' ,
+    'moStND'   : 'http://reference.metoffice.gov.uk/def/um/stash/new_dynamics/' ,
+    'moStEG'   : 'http://reference.metoffice.gov.uk/def/um/stash/endgame/' ,
+    'mofc'     : 'http://reference.metoffice.gov.uk/def/um/fieldcode/',
+    'moumdpF3' : 'http://reference.metoffice.gov.uk/def/um/umdp/F3/',
+    'moumdpC4' : 'http://reference.metoffice.gov.uk/def/um/umdp/c4/',
+    'moumdpC4Pseud' : 'http://reference.metoffice.gov.uk/def/um/umdp/c4/pseudo/',
+    'momet08'  : 'http://reference.metoffice.gov.uk/def/um/met08/',
+    'cfsn'     : 'http://def.cfconventions.org/standard_names/' ,
+    'cfm'      : 'http://def.cfconventions.org/datamodel/' ,
+    'gribapi'  : 'http://def.ecmwf.int/api/grib/keys/',
+    'openmathr1' : 'http://www.openmath.org/cd/relation1.xhtml#',
+    'openmatha1' : 'http://www.openmath.org/cd/arith1.xhtml#',
+    'meta'     : 'http://reference.metoffice.gov.uk/data/wmo/def/met#',
+    'metamap'  : 'http://reference.metoffice.gov.uk/data/wmo/meta/mapping#',
+    }
+
+
+def _readonly(self, *args, **kwargs):
+    raise TypeError('The metOcean prefixes are read-only.')
 
 
 class Prefixes(dict):
-    __slots__ = []
-    
+    """
+    The read-only mapping of the metOcean prefix names to namespace IRIs.
+
+    The prefixes are built once per process, and every construction
+    returns that same shared instance, with its renderings memoized.
+
+    """
+    __slots__ = ['_namespaces', '_lengths', '_renderings']
+
+    _instance = None
+    _lock = threading.Lock()
+
+    def __new__(cls):
+        with cls._lock:
+            if cls._instance is None:
+                self = dict.__new__(cls)
+                dict.update(self, _PREFIXES)
+                self._namespaces = dict((v, k) for k, v in self.iteritems())
+                self._lengths = sorted(set(len(v) for v in self.itervalues()),
+                                       reverse=True)
+                self._renderings = {}
+                cls._instance = self
+        return cls._instance
+
     def __init__(self):
-        #super(Prefixes, self).__init__()
-        prefixd = {
-        'rdfs'     : 'http://www.w3.org/2000/01/rdf-schema#',
-        'rdf'      : 'http://www.w3.org/1999/02/22-rdf-syntax-ns#',
-        'skos'     : 'http://www.w3.org/2004/02/skos/core#',
-        'xsd'      : 'http://www.w3.org/2001/XMLSchema#',
-        'dc'       : 'http://purl.org/dc/terms/',
-        'github'   : 'https://github.com/' ,
-        'map'      : 'http://www.metarelate.net/metOcean/mapping/',
-        'mr'       : 'http://www.metarelate.net/vocabulary/index.html#',
-        'metoc'    : 'http://www.metarelate.net/metOcean/' ,
-        'metocFormat' : 'http://www.metarelate.net/metOcean/format/' ,
-        'metocMed' : 'http://www.metarelate.net/metOcean/mediator/' ,
-        'moStCon'  : 'http://reference.metoffice.gov.uk/def/um/stash/concept/' ,
-        'moStND'   : 'http://reference.metoffice.gov.uk/def/um/stash/new_dynamics/' ,
-        'moStEG'   : 'http://reference.metoffice.gov.uk/def/um/stash/endgame/' ,
-        'mofc'     : 'http://reference.metoffice.gov.uk/def/um/fieldcode/',
-        'moumdpF3' : 'http://reference.metoffice.gov.uk/def/um/umdp/F3/',
-        'moumdpC4' : 'http://reference.metoffice.gov.uk/def/um/umdp/c4/',
-        'moumdpC4Pseud' : 'http://reference.metoffice.gov.uk/def/um/umdp/c4/pseudo/',
-        'momet08'  : 'http://reference.metoffice.gov.uk/def/um/met08/',
-        'cfsn'     : 'http://def.cfconventions.org/standard_names/' ,
-        'cfm'      : 'http://def.cfconventions.org/datamodel/' ,
-        'gribapi'  : 'http://def.ecmwf.int/api/grib/keys/',
-        'openmathr1' : 'http://www.openmath.org/cd/relation1.xhtml#',
-        'openmatha1' : 'http://www.openmath.org/cd/arith1.xhtml#',
-        'meta'     : 'http://reference.metoffice.gov.uk/data/wmo/def/met#',
-        'metamap'  : 'http://reference.metoffice.gov.uk/data/wmo/meta/mapping#',
-        
-        }
-        self.update(prefixd)
+        pass
+
+    __setitem__ = __delitem__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
 
     def __getattr__(self, key):
         return self[key]
 
+    def _render(self, fmt):
+        result = self._renderings.get(fmt)
+        if result is None:
+            ios = StringIO.StringIO()
+            for key, value in sorted(self.items()):
+                ios.write(fmt % (key, value))
+            ios.write('\n')
+            result = self._renderings[fmt] = ios.getvalue()
+        return result
+
     def value2key(self, value):
-        for k, v in self.items():
-           if v == value:
-                return k 
+        return self._namespaces.get(value)
+
+    def expand(self, curie):
+        """
+        Return the IRI of the prefixed name, e.g. 'skos:notation'.
+
+        """
+        key, sep, local = curie.partition(':')
+        if not sep or key not in self:
+            msg = 'No metOcean prefix matches {!r}.'
+            raise ValueError(msg.format(curie))
+        return '%s%s' % (self[key], local)
+
+    def compact(self, iri):
+        """
+        Return the prefixed name of the IRI, which may be enclosed in angle
+        brackets, using the longest matching namespace, or None if no
+        namespace matches.
+
+        """
+        result = None
+        if iri.startswith('<') and iri.endswith('>'):
+            iri = iri[1:-1]
+        # Check each distinct namespace length, longest first.
+        for length in self._lengths:
+            key = self._namespaces.get(iri[:length])
+            if key is not None:
+                result = '%s:%s' % (key, iri[length:])
+                break
+        return result
 
     @property
     def sparql(self):
-        ios = StringIO.StringIO()
-        for key, value in sorted(self.items()):
-            ios.write('PREFIX %s: <%s>\n' % (key, value))
-        ios.write('\n')
-        return ios.getvalue()
+        return self._render('PREFIX %s: <%s>\n')
 
     @property
     def turtle(self):
-        ios = StringIO.StringIO()
-        for key, value in sorted(self.items()):
-            ios.write('@prefix %s: <%s> .\n' % (key, value))
-        ios.write('\n')
-        return ios.getvalue()
+        return self._render('@prefix %s: <%s> .\n')
 
     @property
     def rdf(self):
-        ios = StringIO.StringIO()
-        for key, value in sorted(self.items()):
-            ios.write('xmlns:%s="%s"\n' % (key, value))
-        ios.write('\n')
-        return ios.getvalue()
+        return self._render('xmlns:%s="%s"\n')
 
     @property
     def irilist(self):
@@ -19,15 +19,29 @@ Test the metOcean Apache Fuseki server.
 
 """
 
+import os
+import shutil
+import tempfile
+import threading
 import unittest
 
 import metocean
 import metocean.tests as tests
-from metocean.fuseki import FusekiServer
+import metocean.validation as validation
+from metocean.fuseki import (FusekiServer, iter_data, mapping_by_properties,
+                              process_columns, process_data, valid_vocab)
+from metocean.index import MappingIndex
 
 SCHEME_CF = '<http://www.metarelate.net/metOcean/format/cf>'
 SCHEME_UM = '<http://www.metarelate.net/metOcean/format/um>'
 
+# The content of the test data property p001.
+STASH = {'mr:name': '<http://reference.metoffice.gov.uk/def/um/umdp/F3/'
+                    'stash>',
+         'rdf:value': '<http://reference.metoffice.gov.uk/def/um/stash/'
+                      'concept/m02s32i202>',
+         'mr:operator': '<http://www.openmath.org/cd/relation1.xhtml#eq>'}
+
 
 class TestFuseki(tests.MetOceanTestCase):
     @classmethod
@@ -40,6 +54,21 @@ class TestFuseki(tests.MetOceanTestCase):
     def tearDownClass(cls):
         cls.fuseki.stop()
 
+    def _replacing_po_dict(self, uri):
+        # The content of a draft mapping which replaces the mapping uri.
+        qstr = '''SELECT ?source ?target
+        WHERE { GRAPH <http://metarelate.net/mappings.ttl> {
+        %s mr:source ?source ; mr:target ?target . } }''' % uri
+        result = self.fuseki.retrieve(qstr)
+        return {'mr:source': result['source'],
+                'mr:target': result['target'],
+                'mr:invertible': '"False"', 'mr:status': '"Draft"',
+                'mr:reason': '"update"',
+                'dc:date': '"2013-01-01T00:00:00"^^xsd:dateTime',
+                'dc:creator': '<http://www.metarelate.net/metOcean/'
+                              'people/test>',
+                'dc:replaces': [uri]}
+
     def test_retrieve_um_cf(self):
         # Provide the full scheme URI.
         mappings = self.fuseki.retrieve_mappings(SCHEME_UM, SCHEME_CF)
@@ -48,11 +77,587 @@ class TestFuseki(tests.MetOceanTestCase):
         mappings = self.fuseki.retrieve_mappings('um', 'cf')
         self.assertEqual(len(mappings), 1)
 
+    def test_retrieve_values(self):
+        mappings = self.fuseki.retrieve_mappings('um', 'cf')
+        for mapping in mappings:
+            for concept in [mapping.source, mapping.target]:
+                for prop in concept.components[0].values():
+                    if prop.simple:
+                        self.assertIsNotNone(prop.value)
+                        self.assertIsNotNone(prop.operator)
+
     def test_dot_um_cf(self):
         mappings = self.fuseki.retrieve_mappings(SCHEME_UM, SCHEME_CF)
         for mapping in sorted(mappings, key=lambda mapping: mapping.uri.data):
             self.check_dot(mapping)
 
+    def test_mapping_index(self):
+        index = MappingIndex.from_static(
+            metocean.site_config['test_static_dir'])
+        for source, target in [('um', 'cf'), ('cf', 'um')]:
+            self.assertEqual(index.retrieve_mappings(source, target),
+                             self.fuseki.retrieve_mappings(source, target))
+
+    def test_get_labels(self):
+        subjects = [SCHEME_CF, SCHEME_UM, '"1"',
+                    '<http://www.example.com/scheme#fragment>']
+        labels = self.fuseki.get_labels(subjects)
+        for subject in subjects:
+            self.assertEqual(labels[subject], self.fuseki.get_label(subject))
+
+    def test_label_cache(self):
+        self.fuseki.get_label(SCHEME_CF)
+        hits = self.fuseki.label_cache_stats()['hits']
+        self.fuseki.get_label(SCHEME_CF)
+        self.assertEqual(self.fuseki.label_cache_stats()['hits'], hits + 1)
+        # Any update invalidates the cached labels.
+        self.fuseki.run_query('INSERT DATA {}', update=True)
+        self.assertEqual(self.fuseki.label_cache_stats()['entries'], 0)
+
+    def test_preload_labels(self):
+        self.assertGreater(self.fuseki.preload_labels(), 0)
+        hits = self.fuseki.label_cache_stats()['hits']
+        self.assertEqual(self.fuseki.get_label(SCHEME_UM), '"um"')
+        self.assertEqual(self.fuseki.label_cache_stats()['hits'], hits + 1)
+
+    def test_subject_and_plabel_columns(self):
+        graph = 'http://metarelate.net/formats.ttl'
+        rows = self.fuseki.subject_and_plabel(graph)
+        columns = self.fuseki.subject_and_plabel(graph, columns=True)
+        self.assertEqual(sorted(columns), ['notation', 'prefLabel', 'subject'])
+        for var, column in columns.iteritems():
+            self.assertEqual(column, [row.get(var) for row in rows])
+
+    def test_get_or_create(self):
+        po_dict = {'mr:name': '<http://def.cfconventions.org/datamodel/units>',
+                   'rdf:value': '"K"',
+                   'mr:operator': '<http://www.openmath.org/cd/'
+                                  'relation1.xhtml#eq>'}
+        record, qstr, upstr = metocean.Property.sparql_get_or_create(po_dict)
+        try:
+            for _ in range(2):
+                result = self.fuseki.get_or_create(record, qstr, upstr)
+                self.assertEqual(result, record)
+                creator, _ = metocean.Property.sparql_creator(po_dict)
+                self.assertEqual(self.fuseki.run_query(creator), [record])
+        finally:
+            self.fuseki.revert()
+
+    def test_get_or_create_existing(self):
+        # The records of the test data predate content hash uris.
+        prop = '<http://www.metarelate.net/metOcean/property/p001>'
+        comp = '<http://www.metarelate.net/metOcean/component/c001>'
+        record, qstr, upstr = metocean.Property.sparql_get_or_create(STASH)
+        self.assertNotEqual(record['property'], prop)
+        self.assertEqual(self.fuseki.get_or_create(record, qstr, upstr),
+                         {'property': prop})
+        po_dict = {'mr:hasFormat': SCHEME_UM, 'mr:hasProperty': [prop]}
+        record, qstr, upstr = metocean.Component.sparql_get_or_create(po_dict)
+        self.assertEqual(self.fuseki.get_or_create(record, qstr, upstr),
+                         {'component': comp})
+        try:
+            # Nor does the update alone create a second record.
+            self.fuseki.run_query(upstr, update=True)
+            self.assertEqual(self.fuseki.query_cache(), [])
+        finally:
+            self.fuseki.revert()
+
+    def test_query_cache(self):
+        self.assertEqual(self.fuseki.query_cache(), [])
+        self.assertEqual(self.fuseki.cache_count(), 0)
+        po_dict = {'mr:name': '<http://def.cfconventions.org/datamodel/units>',
+                   'rdf:value': '"hPa"',
+                   'mr:operator': '<http://www.openmath.org/cd/'
+                                  'relation1.xhtml#eq>'}
+        record, qstr, upstr = metocean.Property.sparql_get_or_create(po_dict)
+        try:
+            self.fuseki.get_or_create(record, qstr, upstr)
+            cached = self.fuseki.query_cache()
+            self.assertEqual(set(row['s'] for row in cached),
+                             set([record['property']]))
+            self.assertEqual(self.fuseki.cache_count(), len(cached))
+            self.assertEqual(len(self.fuseki.query_cache(limit=2)), 2)
+        finally:
+            self.fuseki.revert()
+        self.assertEqual(self.fuseki.query_cache(), [])
+        self.assertEqual(self.fuseki.cache_count(), 0)
+
+    def test_bulk_create(self):
+        eq = '<http://www.openmath.org/cd/relation1.xhtml#eq>'
+        stash = {'mr:name': '<http://reference.metoffice.gov.uk/def/um/'
+                            'umdp/F3/stash>',
+                 'mr:operator': eq,
+                 'rdf:value': '<http://reference.metoffice.gov.uk/def/um/'
+                              'stash/concept/m01s00i001>'}
+        units = {'mr:name': '<http://def.cfconventions.org/datamodel/units>',
+                 'mr:operator': eq, 'rdf:value': '"Pa"'}
+        source = {'mr:hasFormat': SCHEME_UM, 'mr:hasProperty': [stash]}
+        target = {'mr:hasFormat': SCHEME_CF, 'mr:hasProperty': [units]}
+        mapping = {'mr:source': source, 'mr:target': target,
+                   'mr:invertible': '"False"', 'mr:status': '"Draft"',
+                   'mr:reason': '"new mapping"',
+                   'dc:date': '"2013-01-01T00:00:00"^^xsd:dateTime',
+                   'dc:creator': '<http://www.metarelate.net/metOcean/'
+                                 'people/test>'}
+        try:
+            props, comps, maps = self.fuseki.bulk_create(
+                properties=[units, units], components=[source],
+                mappings=[mapping])
+            record, _, _ = metocean.Property.sparql_get_or_create(units)
+            self.assertEqual(props, [record['property']] * 2)
+            record, _, _ = metocean.Property.sparql_get_or_create(stash)
+            po_dict = dict(source, **{'mr:hasProperty': [record['property']]})
+            record, _, _ = metocean.Component.sparql_get_or_create(po_dict)
+            self.assertEqual(comps, [record['component']])
+            qstr = metocean.Mapping.sparql_retriever(maps[0])
+            result = self.fuseki.retrieve(qstr)
+            self.assertEqual(result['source'], comps[0])
+        finally:
+            self.fuseki.revert()
+
+    def test_bulk_create_existing(self):
+        source = {'mr:hasFormat': SCHEME_UM, 'mr:hasProperty': [STASH]}
+        try:
+            props, comps, _ = self.fuseki.bulk_create(properties=[STASH],
+                                                      components=[source])
+            self.assertEqual(props, ['<http://www.metarelate.net/metOcean/'
+                                     'property/p001>'])
+            self.assertEqual(comps, ['<http://www.metarelate.net/metOcean/'
+                                     'component/c001>'])
+            self.assertEqual(self.fuseki.query_cache(), [])
+        finally:
+            self.fuseki.revert()
+
+    def test_stream_query(self):
+        qstr = '''CONSTRUCT { ?s ?p ?o }
+        WHERE { GRAPH <http://metarelate.net/formats.ttl> { ?s ?p ?o } }'''
+        lines = list(self.fuseki.stream_query(qstr))
+        self.assertGreater(len(lines), 1)
+        self.assertEqual(''.join(lines),
+                         self.fuseki.run_query(qstr, output='text'))
+
+    def test_current_mappings(self):
+        mapping, = self.fuseki.retrieve_mappings('um', 'cf')
+        uri = mapping.uri.data
+        po_dict = self._replacing_po_dict(uri)
+        record, qstr, upstr = metocean.Mapping.sparql_get_or_create(po_dict)
+        try:
+            self.fuseki.get_or_create(record, qstr, upstr)
+            # The replaced mapping is no longer current.
+            mapping, = self.fuseki.retrieve_mappings('um', 'cf')
+            self.assertEqual(mapping.uri.data, record['mapping'])
+        finally:
+            self.fuseki.revert()
+        mapping, = self.fuseki.retrieve_mappings('um', 'cf')
+        self.assertEqual(mapping.uri.data, uri)
+
+    def test_replacements(self):
+        mapping, = self.fuseki.retrieve_mappings('um', 'cf')
+        uri = mapping.uri.data
+        self.assertIn(uri, self.fuseki.replacement_index())
+        self.assertEqual(self.fuseki.mapping_head(uri), uri)
+        po_dict = self._replacing_po_dict(uri)
+        try:
+            record = self.fuseki.create_mapping(po_dict)
+            head = record['mapping']
+            self.assertEqual(self.fuseki.mapping_head(uri), head)
+            self.assertEqual(self.fuseki.mapping_history(head), [head, uri])
+            # A rebuilt index agrees with the maintained index.
+            self.fuseki._replacements = None
+            self.assertEqual(self.fuseki.mapping_head(uri), head)
+        finally:
+            self.fuseki.revert()
+        self.assertEqual(self.fuseki.mapping_head(uri), uri)
+
+    def test_validate(self):
+        result = self.fuseki.validate()
+        self.assertEqual(sorted(result), [validation.AMBIGUOUS,
+                                          validation.UNDECLARED])
+        self.assertEqual(sorted(result.timings), ['ambiguous', 'undeclared'])
+        self.assertEqual(result.timed_out, [])
+        self.assertEqual(result.failed, {})
+
+    def test_validate_failed(self):
+        @validation.register('test_broken', 'broken mappings')
+        def check(fuseki, mappings):
+            raise RuntimeError('broken')
+
+        try:
+            result = self.fuseki.validate()
+        finally:
+            validation.unregister('test_broken')
+        self.assertEqual(result.failed.keys(), ['test_broken'])
+        self.assertIn(validation.AMBIGUOUS, result)
+        self.assertNotIn('broken mappings', result)
+        # The failed check is left out of the persisted report.
+        self.assertNotIn('broken mappings',
+                         self.fuseki._read_report()['failures'])
+
+    def test_validate_registered(self):
+        mapping, = self.fuseki.retrieve_mappings('um', 'cf')
+        uri = mapping.uri.data
+
+        # A check registered with the runner is performed by validate.
+        @validation.register('test_all', 'all mappings')
+        def check(fuseki, mappings):
+            return [{'amap': uri}]
+
+        try:
+            result = self.fuseki.validate()
+        finally:
+            validation.unregister('test_all')
+        self.assertEqual(result['all mappings'], [{'amap': uri}])
+
+    def test_validate_incremental(self):
+        checked = []
+
+        # A check which records the mappings it is given to check.
+        @validation.register('test_recorded', 'recorded mappings')
+        def check(fuseki, mappings):
+            checked.append(mappings)
+            return []
+
+        try:
+            expected = self.fuseki.validate()
+            self.assertEqual(checked, [None])
+            # Nothing has changed, so nothing is checked.
+            self.assertEqual(self.fuseki.validate(incremental=True),
+                             expected)
+            self.assertEqual(checked, [None])
+            mapping, = self.fuseki.retrieve_mappings('um', 'cf')
+            uri = mapping.uri.data
+            po_dict = self._replacing_po_dict(uri)
+            try:
+                record = self.fuseki.create_mapping(po_dict)
+                # Only the new mapping is checked, against the last report.
+                result = self.fuseki.validate(incremental=True)
+                self.assertEqual(checked[1:], [[record['mapping']]])
+                self.assertEqual(result, self.fuseki.validate())
+            finally:
+                self.fuseki.revert()
+            self.assertEqual(self.fuseki.validate(incremental=True),
+                             expected)
+        finally:
+            validation.unregister('test_recorded')
+
+    def test_ambiguous_mappings(self):
+        self.assertEqual(self.fuseki.ambiguous_mappings(), [])
+        # Map the source of a mapping to another target of the same format.
+        uri = '<http://www.metarelate.net/metOcean/mapping/' \
+              '5548eb9f06bac6416855247e5ea8d3a016088be2>'
+        qstr = '''SELECT ?source ?target
+        WHERE {
+        GRAPH <http://metarelate.net/mappings.ttl> {
+        %s mr:source ?source ; mr:target ?existing . }
+        GRAPH <http://metarelate.net/concepts.ttl> {
+        ?existing mr:hasFormat ?format .
+        ?target mr:hasFormat ?format ; mr:hasProperty ?prop .
+        FILTER (?target != ?existing) } }
+        ORDER BY ?target
+        LIMIT 1''' % uri
+        po_dict = dict(self.fuseki.retrieve(qstr))
+        po_dict = {'mr:source': po_dict['source'],
+                   'mr:target': po_dict['target'],
+                   'mr:invertible': '"False"', 'mr:status': '"Draft"',
+                   'mr:reason': '"ambiguous"',
+                   'dc:date': '"2013-01-01T00:00:00"^^xsd:dateTime',
+                   'dc:creator': '<http://www.metarelate.net/metOcean/'
+                                 'people/test>'}
+        try:
+            record = self.fuseki.create_mapping(po_dict)
+            result = self.fuseki.ambiguous_mappings()
+            self.assertEqual([(row['amap'], row['bmap']) for row in result],
+                             sorted([(uri, record['mapping']),
+                                     (record['mapping'], uri)]))
+            for row in result:
+                self.assertEqual(row['asource'], po_dict['mr:source'])
+                self.assertEqual(row['bsource'], po_dict['mr:source'])
+                self.assertIn('signature', row)
+            result = self.fuseki.ambiguous_mappings(amaps=[uri])
+            self.assertEqual([row['bmap'] for row in result],
+                             [record['mapping']])
+        finally:
+            self.fuseki.revert()
+
+    def test_undeclared_vocab(self):
+        def signature(row):
+            # A signature of several uris is given as a list of them.
+            value = row['signature']
+            if not isinstance(value, list):
+                value = value.split('&')
+            return sorted(value)
+        result = self.fuseki.undeclared_vocab()
+        expected = self.fuseki.run_query(valid_vocab())
+        self.assertEqual(dict((row['amap'], signature(row))
+                              for row in result),
+                         dict((row['amap'], signature(row))
+                              for row in expected))
+        self.assertTrue(result, 'The test data should include a mapping '
+                                'with undeclared vocabulary.')
+        amap = result[0]['amap']
+        self.assertEqual(self.fuseki.undeclared_vocab(amaps=[amap]),
+                         result[:1])
+
+    def test_vocabulary_index(self):
+        vocabulary = self.fuseki.vocabulary_index()
+        self.assertIn(SCHEME_CF, vocabulary)
+        self.assertIs(self.fuseki.vocabulary_index(), vocabulary)
+        # Any update may declare a subject.
+        self.fuseki.run_query('INSERT DATA {}', update=True)
+        self.assertIsNot(self.fuseki.vocabulary_index(), vocabulary)
+
+    def test_mapping_by_properties(self):
+        entries = self.fuseki._property_entries()
+        self.assertGreater(len(entries), 0)
+        mapping, name, operator, value = entries[0]
+        terms = [{'mr:name': name}]
+        if value is not None:
+            terms.append({'mr:name': name, 'rdf:value': value})
+        result = self.fuseki.mapping_by_properties(terms)
+        self.assertIn(mapping, result)
+        expected = self.fuseki.run_query(mapping_by_properties(terms))
+        self.assertEqual(result, [row['mapping'] for row in expected])
+        self.assertEqual(self.fuseki.mapping_by_properties(terms, limit=1),
+                         result[:1])
+
+    def test_mappings_by_uri(self):
+        uris = self.fuseki.property_index().search([])[::-1]
+        missing = '<http://www.metarelate.net/metOcean/mapping/missing>'
+        mappings = self.fuseki.mappings_by_uri(uris + [missing])
+        self.assertEqual([mapping.uri.data for mapping in mappings], uris)
+        expected, = self.fuseki.retrieve_mappings('um', 'cf')
+        mapping, = [mapping for mapping in mappings
+                    if mapping.uri.data == expected.uri.data]
+        self.assertEqual(mapping.json_referrer(), expected.json_referrer())
+
+    def test_property_index(self):
+        mapping, = self.fuseki.retrieve_mappings('um', 'cf')
+        uri = mapping.uri.data
+        properties = self.fuseki.property_index()
+        self.assertIn(uri, properties)
+        po_dict = self._replacing_po_dict(uri)
+        try:
+            record = self.fuseki.create_mapping(po_dict)
+            # The replacing mapping is indexed in place of the original.
+            self.assertIs(self.fuseki.property_index(), properties)
+            self.assertIn(record['mapping'], properties)
+            self.assertNotIn(uri, properties)
+            self.fuseki._properties = None
+            rebuilt = self.fuseki.property_index()
+            self.assertEqual(rebuilt.search([]), properties.search([]))
+            # Any other update drops the index.
+            qstr = '''DELETE DATA {
+            GRAPH <http://metarelate.net/currentMappings> {
+            %s a mr:Mapping . } }''' % record['mapping']
+            self.fuseki.run_query(qstr, update=True)
+            self.assertNotIn(record['mapping'], self.fuseki.property_index())
+        finally:
+            self.fuseki.revert()
+        self.assertIn(uri, self.fuseki.property_index())
+
+    def test_ready(self):
+        self.assertTrue(self.fuseki.ready())
+        self.assertIsNotNone(self.fuseki.startup_time)
+
+    def test_recover(self):
+        # A query relaunches a server process that has died.
+        expected = self.fuseki.retrieve_mappings('um', 'cf')
+        process = self.fuseki._process
+        process.kill()
+        process.wait()
+        self.assertEqual(self.fuseki.retrieve_mappings('um', 'cf'), expected)
+        self.assertIsNot(self.fuseki._process, process)
+        self.assertIsNone(self.fuseki._process.poll())
+
+    def test_concurrent_queries(self):
+        # Share the pooled connections across more threads than the pool.
+        results = []
+        def query():
+            results.append(self.fuseki.retrieve_mappings('um', 'cf'))
+        threads = [threading.Thread(target=query) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 8)
+        for mappings in results:
+            self.assertEqual(mappings, results[0])
+
+
+class TestFusekiLoad(tests.MetOceanTestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.static_dir = os.path.join(tempfile.mkdtemp(), 'static')
+        shutil.copytree(metocean.site_config['test_static_dir'],
+                        cls.static_dir)
+        cls.fuseki = FusekiServer(test=True)
+        cls.fuseki._static_dir = cls.static_dir
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.fuseki.stop()
+        shutil.rmtree(os.path.dirname(cls.static_dir))
+
+    def test_full(self):
+        self.fuseki.clean()
+        # Without a manifest an incremental load loads every graph.
+        graphs = self.fuseki.load(incremental=True)
+        self.assertIn('http://metarelate.net/mappings.ttl', graphs)
+        self.assertEqual(graphs, self.fuseki.load())
+
+    def test_incremental(self):
+        self.fuseki.load()
+        self.assertEqual(self.fuseki.load(incremental=True), [])
+        formats = os.path.join(self.static_dir, 'metarelate.net',
+                               'formats.ttl')
+        with open(formats, 'a') as outfile:
+            outfile.write('\n<http://www.metarelate.net/metOcean/format/x> '
+                          '<http://www.w3.org/2004/02/skos/core#notation> '
+                          '"x" .\n')
+        self.assertEqual(self.fuseki.load(incremental=True),
+                         ['http://metarelate.net/formats.ttl'])
+        self.fuseki.start()
+        label = self.fuseki.get_label(
+            '<http://www.metarelate.net/metOcean/format/x>')
+        self.assertEqual(label, '"x"')
+        self.assertEqual(len(self.fuseki.retrieve_mappings('um', 'cf')), 1)
+        self.fuseki.stop()
+
+    def test_save(self):
+        self.fuseki.load()
+        self.fuseki.start()
+        concepts = os.path.join(self.static_dir, 'metarelate.net',
+                                'concepts.ttl')
+        formats = os.path.join(self.static_dir, 'metarelate.net',
+                               'formats.ttl')
+        with open(concepts) as infile:
+            content = infile.read()
+        mtime = os.stat(formats).st_mtime
+        listing = sorted(os.listdir(os.path.dirname(concepts)))
+        po_dict = {'mr:name': '<http://def.cfconventions.org/datamodel/units>',
+                   'rdf:value': '"degC"',
+                   'mr:operator': '<http://www.openmath.org/cd/'
+                                  'relation1.xhtml#eq>'}
+        record, qstr, upstr = metocean.Property.sparql_get_or_create(po_dict)
+        self.fuseki.get_or_create(record, qstr, upstr)
+        graph = 'http://metarelate.net/concepts.ttl'
+        # A dry run reports the changes, without saving them.
+        report = self.fuseki.save(dry_run=True)
+        self.assertEqual(sorted(report), [graph])
+        self.assertEqual(report[graph]['records'], 1)
+        self.assertEqual(report[graph]['triples'], 4)
+        self.assertEqual(len(self.fuseki.query_cache()), 5)
+        with open(concepts) as infile:
+            self.assertEqual(infile.read(), content)
+        # A save which fails to clear the flags restores the files.
+        def fail(snapshot, debug=False):
+            raise RuntimeError('clear failed')
+        self.fuseki._clear_cache = fail
+        try:
+            self.assertRaises(RuntimeError, self.fuseki.save)
+        finally:
+            del self.fuseki._clear_cache
+        with open(concepts) as infile:
+            self.assertEqual(infile.read(), content)
+        self.assertEqual(sorted(os.listdir(os.path.dirname(concepts))),
+                         listing)
+        self.assertEqual(len(self.fuseki.query_cache()), 5)
+        self.assertEqual(self.fuseki.save(), report)
+        self.assertEqual(self.fuseki.query_cache(), [])
+        self.assertEqual(self.fuseki.save(), {})
+        self.fuseki.stop()
+        with open(concepts) as infile:
+            saved = infile.read()
+        self.assertTrue(saved.startswith(content))
+        self.assertEqual(len(saved), len(content) + report[graph]['bytes'])
+        # Only the changed graph files are rewritten.
+        self.assertEqual(os.stat(formats).st_mtime, mtime)
+        self.assertEqual(self.fuseki.load(incremental=True),
+                         ['http://metarelate.net/concepts.ttl'])
+        self.fuseki.start()
+        qstr, instr = metocean.Property.sparql_creator(po_dict)
+        self.assertEqual(self.fuseki.run_query(qstr), [record])
+        self.assertEqual(self.fuseki.query_cache(), [])
+        self.fuseki.stop()
+
+    def test_append_copy(self):
+        concepts = os.path.join(self.static_dir, 'metarelate.net',
+                                'concepts.ttl')
+        graphs = self.fuseki._static_graphs()
+        temp, size = metocean.fuseki._append_copy(concepts, ['# appended\n'])
+        try:
+            # A copy left behind by a failed save is not a static graph.
+            self.assertEqual(os.path.dirname(temp),
+                             os.path.dirname(concepts))
+            self.assertEqual(size, 12)
+            self.assertEqual(self.fuseki._static_graphs(), graphs)
+        finally:
+            os.remove(temp)
+
+
+class TestProcessData(unittest.TestCase):
+    def setUp(self):
+        xsd = 'http://www.w3.org/2001/XMLSchema#'
+        self.data = '''{
+          "head": {"vars": ["s", "o"]},
+          "results": {"bindings": [
+            {"s": {"type": "uri", "value": "http://a/b"},
+             "o": {"type": "literal", "value": "12"}},
+            {"s": {"type": "uri", "value": "urn:x"},
+             "o": {"type": "literal", "datatype": "%sdouble",
+                   "value": "1.5E2"}},
+            {"s": {"type": "bnode", "value": "b0"},
+             "o": {"type": "literal", "value": "http://a/c&http://a/d"}},
+            {"o": {"type": "literal", "value": "a \\"bindings\\": ["}}
+          ]}
+        }''' % xsd
+
+    def test_rows(self):
+        expected = [{'s': '<http://a/b>', 'o': '12'},
+                    {'s': '"urn:x"', 'o': '1.5E2'},
+                    {'s': '"b0"', 'o': ['<http://a/c>', '<http://a/d>']},
+                    {'o': '"a "bindings": ["'}]
+        self.assertEqual(process_data(self.data), expected)
+
+    def test_incremental(self):
+        # Rows are decoded before any malformed trailing content.
+        rows = iter_data(self.data[:self.data.index('{"o"')] + '{')
+        self.assertEqual(next(rows)['s'], '<http://a/b>')
+        self.assertEqual(next(rows)['s'], '"urn:x"')
+        self.assertEqual(next(rows)['s'], '"b0"')
+        with self.assertRaises(ValueError):
+            next(rows)
+
+    def test_blocks(self):
+        # Results received in blocks decode as a whole document does,
+        # wherever the blocks are split.
+        for size in [1, 7, 64]:
+            blocks = [self.data[i:i + size]
+                      for i in xrange(0, len(self.data), size)]
+            self.assertEqual(process_data(iter(blocks)),
+                             process_data(self.data))
+            self.assertEqual(process_columns(iter(blocks)),
+                             process_columns(self.data))
+
+    def test_columns(self):
+        columns = process_columns(self.data)
+        self.assertEqual(columns['s'], ['<http://a/b>', '"urn:x"', '"b0"',
+                                        None])
+        self.assertEqual(columns['o'][:2], ['12', '1.5E2'])
+        data = self.data.replace('"o"]', '"o", "x"]')
+        self.assertEqual(process_columns(data), dict(columns, x=[None] * 4))
+
+    def test_columns_interned(self):
+        data = self.data.replace('urn:x', 'http://a/b')
+        columns = process_columns(data)
+        self.assertIs(columns['s'][0], columns['s'][1])
+
+    def test_invalid(self):
+        self.assertEqual(process_data('{"head": '), [])
+        self.assertEqual(process_columns('{"head": '), {})
+        self.assertEqual(process_data(None), [])
+        self.assertEqual(process_data('{"head": {}, "boolean": true}'), [])
+
 
 if __name__ == '__main__':
     unittest.main()
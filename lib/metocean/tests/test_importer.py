@@ -0,0 +1,205 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Test the metOcean bulk mapping importer.
+
+"""
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import metocean
+import metocean.prefixes as prefixes
+import metocean.turtle as turtle
+from metocean.importer import (CSVReader, GribParamRulesReader, Importer,
+                               linkage)
+
+
+GRIB_RULES = '''IF
+grib.edition == 2
+grib.discipline == 0
+grib.parameterCategory == 0
+grib.parameterNumber == 0
+THEN
+CMAttribute("standard_name", "air_temperature")
+CMAttribute("units", "K")
+
+IF
+grib.edition == 2
+grib.discipline == 0
+grib.parameterCategory == 3
+grib.parameterNumber == 0
+THEN
+CMAttribute("standard_name", "air_pressure")
+CMAttribute("units", "Pa")
+'''
+
+CSV = '''source_format,source_properties,target_format,target_properties,invertible
+um,moumdpF3:stash=moStCon:m01s00i004,cf,"cfm:standard_name=cfsn:air_potential_temperature|cfm:units=""K"""
+um,moumdpF3:stash=moStCon:m01s00i004,cf,"cfm:standard_name=cfsn:air_potential_temperature|cfm:units=""K""",False
+'''
+
+MAPPING_P_O = {'dc:creator': ['<http://www.metarelate.net/metOcean/'
+                              'people/test>'],
+               'dc:date': ['"2013-01-01T00:00:00"^^xsd:dateTime'],
+               'mr:status': ['"Draft"'],
+               'mr:reason': ['"new mapping"']}
+
+
+class _Fuseki(object):
+    # Records the updates written by the importer, to a store without
+    # any existing records.
+    def __init__(self):
+        self.upstrs = []
+
+    def existing_records(self, records):
+        return {}
+
+    def bulk_update(self, upstrs):
+        self.upstrs.extend(upstrs)
+        return 1
+
+
+class TestImporter(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _file(self, name, content):
+        fname = os.path.join(self.tmpdir, name)
+        with open(fname, 'w') as fh:
+            fh.write(content)
+        return fname
+
+    def test_linkage(self):
+        link = linkage('um', [('moumdpF3:lbfc', 'mofc:16')],
+                       'cf', [('cfm:units', '"K"')], invertible=True)
+        self.assertEqual(link['mr:invertible'], '"True"')
+        self.assertEqual(link['mr:source']['mr:hasFormat'],
+                         ['<http://www.metarelate.net/metOcean/format/um>'])
+        self.assertEqual(link['mr:target']['mr:hasProperty'],
+                         [{'mr:name': 'cfm:units', 'rdf:value': '"K"',
+                           'mr:operator': '<http://www.openmath.org/cd/'
+                                          'relation1.xhtml#eq>'}])
+
+    def test_grib_rules(self):
+        links = list(GribParamRulesReader(self._file('rules', GRIB_RULES)))
+        self.assertEqual(len(links), 2)
+        names = [link['mr:target']['mr:hasProperty'][0]['rdf:value']
+                 for link in links]
+        self.assertEqual(names, ['cfsn:air_temperature', 'cfsn:air_pressure'])
+        values = [prop['rdf:value']
+                  for prop in links[1]['mr:source']['mr:hasProperty']]
+        self.assertEqual(values, ['2', '0', '3', '0'])
+
+    def test_csv(self):
+        link, = list(CSVReader(self._file('links.csv', CSV)))[1:]
+        self.assertEqual(link['mr:invertible'], '"False"')
+        values = [prop['rdf:value']
+                  for prop in link['mr:target']['mr:hasProperty']]
+        self.assertEqual(values, ['cfsn:air_potential_temperature', '"K"'])
+
+    def test_dry_run(self):
+        readers = [CSVReader(self._file('links.csv', CSV)),
+                   GribParamRulesReader(self._file('rules', GRIB_RULES))]
+        stats = Importer(None, readers, MAPPING_P_O, processes=1,
+                         dry_run=True).run()
+        self.assertEqual(stats['linkages'], 4)
+        # The CSV linkages only differ by their invertible default.
+        self.assertEqual(stats['duplicates'], 1)
+        self.assertEqual(stats['mappings'], 3)
+        self.assertEqual(stats['component'], 6)
+        self.assertEqual(stats['requests'], 0)
+
+    def test_write(self):
+        fuseki = _Fuseki()
+        readers = [GribParamRulesReader(self._file('rules', GRIB_RULES))]
+        stats = Importer(fuseki, readers, MAPPING_P_O, processes=1).run()
+        self.assertEqual(stats['requests'], 1)
+        self.assertEqual(len(fuseki.upstrs), stats['property'] +
+                         stats['component'] + stats['mapping'])
+        # Records are written in dependency order.
+        self.assertIn('mr:Property', fuseki.upstrs[0])
+        self.assertIn('mr:Mapping', fuseki.upstrs[-1])
+
+    def test_write_turtle(self):
+        static_dir = os.path.join(self.tmpdir, 'static')
+        readers = [GribParamRulesReader(self._file('rules', GRIB_RULES))]
+        importer = Importer(None, readers, MAPPING_P_O, processes=1,
+                            turtle_dir=static_dir)
+        stats = importer.run()
+        concepts = os.path.join(static_dir, 'metarelate.net', 'concepts.ttl')
+        mappings = os.path.join(static_dir, 'metarelate.net', 'mappings.ttl')
+        rdf_type = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+        subjects = {}
+        for fname in [concepts, mappings]:
+            subjects[fname] = [s for s, p, o in turtle.parse_file(fname)
+                               if p == rdf_type]
+            self.assertEqual(subjects[fname], sorted(subjects[fname]))
+        self.assertEqual(len(subjects[concepts]),
+                         stats['property'] + stats['component'])
+        self.assertEqual(len(subjects[mappings]), stats['mapping'])
+        # The records are hashed as by the triple store import.
+        _, records = importer.resolve(importer.read())
+        self.assertEqual(subjects[mappings], sorted(records['mapping']))
+        # Records already in a file are not written again.
+        with open(concepts) as infile:
+            content = infile.read()
+        self.assertEqual(importer.write_turtle(records), 0)
+        with open(concepts) as infile:
+            self.assertEqual(infile.read(), content)
+
+    def test_write_turtle_existing(self):
+        static_dir = os.path.join(self.tmpdir, 'static')
+        os.makedirs(os.path.join(static_dir, 'metarelate.net'))
+        concepts = os.path.join(static_dir, 'metarelate.net', 'concepts.ttl')
+        # A property which predates content hash uris.
+        legacy = '<http://www.metarelate.net/metOcean/property/legacy>'
+        units = {'mr:name': 'cfm:units', 'rdf:value': '"K"',
+                 'mr:operator': '<http://www.openmath.org/cd/'
+                                'relation1.xhtml#eq>'}
+        with open(concepts, 'w') as outfile:
+            outfile.write(prefixes.Prefixes().turtle)
+            outfile.write(turtle.subject_block(
+                legacy, [('rdf:type', 'mr:Property')] +
+                sorted(units.items())))
+        readers = [GribParamRulesReader(self._file('rules', GRIB_RULES))]
+        importer = Importer(None, readers, MAPPING_P_O, processes=1,
+                            turtle_dir=static_dir)
+        stats = importer.run()
+        has_property = '<http://www.metarelate.net/vocabulary/' \
+                       'index.html#hasProperty>'
+        value = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#value>'
+        triples = turtle.parse_file(concepts)
+        # The existing property is used in place of a new one.
+        self.assertEqual([s for s, p, o in triples
+                          if p == value and o == '"K"'], [legacy])
+        self.assertIn(legacy, [o for s, p, o in triples
+                               if p == has_property])
+        rdf_type = '<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>'
+        properties = [s for s, p, o in triples if p == rdf_type and
+                      o.endswith('#Property>')]
+        self.assertEqual(len(properties), stats['property'] + 1)
+
+
+
+if __name__ == '__main__':
+    unittest.main()
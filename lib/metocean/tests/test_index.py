@@ -0,0 +1,253 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Test the metOcean in-memory mapping index.
+
+"""
+
+import unittest
+
+import metocean
+from metocean.index import (MappingIndex, ReplacementIndex, MAPPINGS_GRAPH,
+                            VocabularyIndex, PropertyIndex, CONCEPTS_GRAPH,
+                            ambiguous_pairs)
+import metocean.tests as tests
+import metocean.turtle as turtle
+
+
+PREFIXES = '''
+@prefix cfm: <http://def.cfconventions.org/datamodel/> .
+@prefix dc: <http://purl.org/dc/terms/> .
+@prefix map: <http://www.metarelate.net/metOcean/mapping/> .
+@prefix comp: <http://www.metarelate.net/metOcean/component/> .
+@prefix prop: <http://www.metarelate.net/metOcean/property/> .
+@prefix metocFormat: <http://www.metarelate.net/metOcean/format/> .
+@prefix mr: <http://www.metarelate.net/vocabulary/index.html#> .
+@prefix skos: <http://www.w3.org/2004/02/skos/core#> .
+'''
+
+CONCEPTS = PREFIXES + '''
+comp:um mr:hasFormat metocFormat:um ; mr:hasProperty prop:um .
+comp:cf mr:hasFormat metocFormat:cf ;
+    mr:hasProperty prop:cf, prop:coordinate .
+comp:coordinate mr:hasFormat metocFormat:cf ; mr:hasProperty prop:cf .
+prop:um mr:name cfm:units .
+prop:cf mr:name cfm:standard_name .
+prop:coordinate mr:name cfm:coordinate ; mr:hasComponent comp:coordinate .
+'''
+
+MAPPINGS = PREFIXES + '''
+map:current mr:source comp:um ; mr:target comp:cf ;
+    mr:status "Draft" ; mr:invertible "True" .
+map:deprecated mr:source comp:um ; mr:target comp:cf ;
+    mr:status "Deprecated" .
+map:broken mr:source comp:um ; mr:target comp:cf ; mr:status "Broken" .
+map:replaced mr:source comp:um ; mr:target comp:cf ; mr:status "Draft" .
+map:replacement mr:source comp:um ; mr:target comp:cf ;
+    mr:status "Draft" ; mr:invertible "False" ;
+    dc:replaces map:replaced .
+'''
+
+FORMATS = PREFIXES + '''
+metocFormat:um skos:notation "um" .
+metocFormat:cf skos:notation "cf" .
+'''
+
+
+def _quads(text, graph):
+    return [triple + (graph,) for triple in turtle.parse(text)]
+
+
+class TestMappingIndex(tests.MetOceanTestCase):
+    def setUp(self):
+        quads = _quads(CONCEPTS, CONCEPTS_GRAPH)
+        quads += _quads(MAPPINGS, MAPPINGS_GRAPH)
+        quads += _quads(FORMATS, '<http://metarelate.net/formats.ttl>')
+        self.index = MappingIndex(quads)
+
+    def test_status_and_replaces(self):
+        mappings = self.index.retrieve_mappings('um', 'cf')
+        uris = [mapping.uri.data for mapping in mappings]
+        self.assertEqual(uris,
+                         ['<http://www.metarelate.net/metOcean/mapping/'
+                          'current>',
+                          '<http://www.metarelate.net/metOcean/mapping/'
+                          'replacement>'])
+
+    def test_inversion(self):
+        mappings = self.index.retrieve_mappings('cf', 'um')
+        self.assertEqual(len(mappings), 1)
+        mapping, = mappings
+        self.assertEqual(mapping.source.scheme.notation, 'cf')
+        self.assertEqual(mapping.target.scheme.notation, 'um')
+
+    def test_compound_property(self):
+        mapping = self.index.retrieve_mappings('um', 'cf')[0]
+        prop, = [prop for prop in mapping.target.components[0].values()
+                 if prop.name.data.endswith('coordinate>')]
+        self.assertFalse(prop.simple)
+        self.assertEqual(prop.operator.data,
+                         '<http://www.openmath.org/cd/relation1.xhtml#eq>')
+
+    def test_format_uri(self):
+        self.assertEqual(self.index.retrieve_mappings(
+            '<http://www.metarelate.net/metOcean/format/um>',
+            '<http://www.metarelate.net/metOcean/format/cf>'),
+            self.index.retrieve_mappings('um', 'cf'))
+
+    def test_unknown_formats(self):
+        self.assertEqual(self.index.retrieve_mappings('grib', 'cf'), [])
+
+    def test_from_static(self):
+        index = MappingIndex.from_static(
+            metocean.site_config['test_static_dir'])
+        self.assertEqual(len(index.retrieve_mappings('um', 'cf')), 1)
+
+
+class TestAmbiguousPairs(unittest.TestCase):
+    def test_same_format(self):
+        table = [('m1', 's', 'sf', 't1', 'tf', False),
+                 ('m2', 's', 'sf', 't2', 'tf', False),
+                 ('m3', 's', 'sf', 't3', 'other', False)]
+        self.assertEqual(ambiguous_pairs(table),
+                         [('m1', 's', 't1', 'm2', 's', 't2'),
+                          ('m2', 's', 't2', 'm1', 's', 't1')])
+
+    def test_same_target(self):
+        table = [('m1', 's', 'sf', 't', 'tf', False),
+                 ('m2', 's', 'sf', 't', 'tf', False)]
+        self.assertEqual(ambiguous_pairs(table), [])
+
+    def test_inverted(self):
+        table = [('m1', 's', 'sf', 't1', 'tf', False),
+                 ('m2', 't2', 'tf', 's', 'sf', True),
+                 ('m3', 't3', 'tf', 's', 'sf', False)]
+        self.assertEqual(ambiguous_pairs(table),
+                         [('m1', 's', 't1', 'm2', 's', 't2'),
+                          ('m2', 's', 't2', 'm1', 's', 't1')])
+
+
+class TestReplacementIndex(unittest.TestCase):
+    def setUp(self):
+        # m1 <- m2 <- m3, and m1 <- m4, listed out of order.
+        self.index = ReplacementIndex([('m3', 'm2'), ('m1', None),
+                                       ('m2', 'm1'), ('m4', 'm1'),
+                                       ('m5', None)])
+
+    def test_head(self):
+        self.assertEqual(self.index.head('m1'), 'm4')
+        self.assertEqual(self.index.head('m2'), 'm3')
+        self.assertEqual(self.index.head('m3'), 'm3')
+        self.assertEqual(self.index.head('m5'), 'm5')
+        self.assertEqual(self.index.head('unknown'), 'unknown')
+
+    def test_history(self):
+        self.assertEqual(self.index.history('m3'), ['m3', 'm2', 'm1'])
+        self.assertEqual(self.index.history('m4'), ['m4', 'm1'])
+        self.assertEqual(self.index.history('m1'), ['m1'])
+
+    def test_add(self):
+        self.assertTrue(self.index.add('m6', 'm3'))
+        self.assertFalse(self.index.add('m6', 'm3'))
+        for mapping in ['m1', 'm2', 'm3', 'm6']:
+            self.assertEqual(self.index.head(mapping), 'm6')
+        self.assertEqual(self.index.head('m4'), 'm4')
+        self.assertEqual(self.index.history('m6'), ['m6', 'm3', 'm2', 'm1'])
+        self.assertEqual(len(self.index), 6)
+
+    def test_cycle(self):
+        index = ReplacementIndex([('a', 'b'), ('b', 'a')])
+        self.assertEqual(index.history('a'), ['a', 'b'])
+
+
+class TestVocabularyIndex(unittest.TestCase):
+    def setUp(self):
+        self.keys = '<http://grib/apikeys.ttl>'
+        self.names = '<http://cf/cf-standard-name-table.ttl>'
+        self.index = VocabularyIndex(
+            [(self.keys, '<http://grib/keys/gridType>'),
+             (self.keys, '<http://grib/keys/Ni>'),
+             (self.names, '<http://cf/names#air_temperature>'),
+             (CONCEPTS_GRAPH, '<http://concepts/c001>')])
+
+    def test_undeclared(self):
+        uris = ['<http://grib/keys/Ni>', '<http://concepts/c001>',
+                '<http://grib/keys/Nj>', '<http://other/thing>']
+        self.assertEqual(self.index.undeclared(uris),
+                         ['<http://grib/keys/Nj>', '<http://other/thing>'])
+        self.assertIn('<http://concepts/c001>', self.index)
+        self.assertEqual(len(self.index), 4)
+
+    def test_subjects(self):
+        self.assertEqual(self.index.subjects(self.names),
+                         frozenset(['<http://cf/names#air_temperature>']))
+        self.assertEqual(self.index.subjects('<http://missing>'),
+                         frozenset())
+
+    def test_vocabulary(self):
+        self.assertEqual(self.index.vocabulary('<http://grib/keys/Nj>'),
+                         self.keys)
+        self.assertEqual(
+            self.index.vocabulary('<http://cf/NAMES#Air_Temperature>'),
+            self.names)
+        self.assertIsNone(self.index.vocabulary('<http://other/thing>'))
+        # Only the third party vocabularies are near misses.
+        self.assertIsNone(self.index.vocabulary('<http://concepts/c002>'))
+
+
+class TestPropertyIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = PropertyIndex(
+            [('m1', '<stash>', None, '"m01s00i024"'),
+             ('m1', '<units>', '<eq>', '"K"'),
+             ('m2', '<stash>', None, '"m01s00i024"'),
+             ('m2', '<units>', '<eq>', '"Pa"'),
+             ('m3', '<units>', '<eq>', '"K"'),
+             ('m4', None, None, None)])
+
+    def test_search(self):
+        stash = {'mr:name': '<stash>', 'rdf:value': '"m01s00i024"'}
+        kelvin = {'rdf:value': '"K"'}
+        self.assertEqual(self.index.search([stash]), ['m1', 'm2'])
+        self.assertEqual(self.index.search([kelvin]), ['m1', 'm3'])
+        self.assertEqual(self.index.search([stash, kelvin]), ['m1'])
+        self.assertEqual(self.index.search([{'mr:operator': '<eq>'}]),
+                         ['m1', 'm2', 'm3'])
+        self.assertEqual(self.index.search([]), ['m1', 'm2', 'm3', 'm4'])
+
+    def test_same_property(self):
+        # Each term is matched by a single property of a mapping.
+        term = {'mr:name': '<stash>', 'rdf:value': '"K"'}
+        self.assertEqual(self.index.search([term]), [])
+
+    def test_paging(self):
+        self.assertEqual(self.index.search([], offset=1, limit=2),
+                         ['m2', 'm3'])
+        self.assertEqual(self.index.search([], offset=3), ['m4'])
+
+    def test_add_discard(self):
+        self.index.add('m5', [('<units>', '<eq>', '"K"')])
+        self.index.discard('m1')
+        self.index.discard('m9')
+        self.assertEqual(self.index.search([{'rdf:value': '"K"'}]),
+                         ['m3', 'm5'])
+        self.assertNotIn('m1', self.index)
+        self.assertEqual(len(self.index), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -387,5 +387,48 @@ class TestMapping(tests.MetOceanTestCase):
         self.check_dot(self.mapping)
 
 
+
+class TestMakeHash(unittest.TestCase):
+    def test_list_order(self):
+        # The same record is identified whatever the order of its lists.
+        first = {'mr:hasFormat': '<http://www.metarelate.net/metOcean/'
+                                 'format/cf>',
+                 'mr:hasProperty': ['<a>', '<b>']}
+        second = dict(first, **{'mr:hasProperty': ['<b>', '<a>']})
+        self.assertEqual(metocean.make_hash(first),
+                         metocean.make_hash(second))
+        self.assertEqual(metocean.Component.hash_record(first),
+                         metocean.Component.hash_record(second))
+
+
+class TestResolveRecords(unittest.TestCase):
+    def test_existing(self):
+        units = {'mr:name': '<http://def.cfconventions.org/datamodel/units>',
+                 'mr:operator': '<http://www.openmath.org/cd/'
+                                'relation1.xhtml#eq>',
+                 'rdf:value': '"K"'}
+        comp = {'mr:hasFormat': '<http://www.metarelate.net/metOcean/'
+                                'format/cf>',
+                'mr:hasProperty': [units]}
+        records = metocean.bulk_records()
+        uri = metocean.bulk_record('component', comp, records)
+        prop, = records['property']
+        legacy = '<http://www.metarelate.net/metOcean/property/legacy>'
+
+        def match(kind_records):
+            return dict((uri, legacy) for uri in kind_records
+                        if uri == prop)
+
+        resolved = metocean.resolve_records(records, match)
+        self.assertEqual(resolved[prop], legacy)
+        self.assertEqual(records['property'], {})
+        # The component refers to the existing property, so is rehashed.
+        po_dict = dict(comp, **{'mr:hasProperty': [legacy]})
+        expected, _, _ = metocean.Component.hash_record(po_dict)
+        self.assertNotEqual(expected, uri)
+        self.assertEqual(resolved[uri], expected)
+        self.assertEqual(records['component'].keys(), [expected])
+
+
 if __name__ == '__main__':
     unittest.main()
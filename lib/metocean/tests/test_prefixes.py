@@ -0,0 +1,75 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Test the metOcean prefixes.
+
+"""
+
+import unittest
+
+from metocean.prefixes import Prefixes
+
+
+class TestPrefixes(unittest.TestCase):
+    def setUp(self):
+        self.pre = Prefixes()
+
+    def test_shared(self):
+        self.assertIs(Prefixes(), self.pre)
+        self.assertIs(self.pre.sparql, Prefixes().sparql)
+
+    def test_readonly(self):
+        with self.assertRaises(TypeError):
+            self.pre['ex'] = 'http://example.com/'
+        with self.assertRaises(TypeError):
+            self.pre.update(ex='http://example.com/')
+        self.assertNotIn('ex', self.pre)
+
+    def test_sparql(self):
+        lines = self.pre.sparql.split('\n')
+        self.assertEqual(lines[0], 'PREFIX cfm: '
+                         '<http://def.cfconventions.org/datamodel/>')
+        self.assertEqual(len(lines), len(self.pre) + 2)
+
+    def test_value2key(self):
+        self.assertEqual(self.pre.value2key(self.pre.skos), 'skos')
+        self.assertIsNone(self.pre.value2key('http://example.com/'))
+
+    def test_expand(self):
+        self.assertEqual(self.pre.expand('skos:notation'),
+                         'http://www.w3.org/2004/02/skos/core#notation')
+        with self.assertRaises(ValueError):
+            self.pre.expand('ex:notation')
+        with self.assertRaises(ValueError):
+            self.pre.expand('notation')
+
+    def test_compact(self):
+        self.assertEqual(self.pre.compact('<http://www.w3.org/2004/02/skos/'
+                                          'core#notation>'),
+                         'skos:notation')
+        self.assertIsNone(self.pre.compact('http://example.com/notation'))
+
+    def test_compact_longest(self):
+        # Both metoc and metocFormat are namespaces of the IRI.
+        iri = 'http://www.metarelate.net/metOcean/format/um'
+        self.assertEqual(self.pre.compact(iri), 'metocFormat:um')
+        iri = 'http://reference.metoffice.gov.uk/def/um/umdp/c4/pseudo/1'
+        self.assertEqual(self.pre.compact(iri), 'moumdpC4Pseud:1')
+
+
+if __name__ == '__main__':
+    unittest.main()
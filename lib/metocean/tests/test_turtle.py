@@ -0,0 +1,133 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Test the metOcean Turtle and N-Quads parsing.
+
+"""
+
+import unittest
+
+import metocean.turtle as turtle
+
+
+XSD_INTEGER = '<http://www.w3.org/2001/XMLSchema#integer>'
+
+
+class TestParse(unittest.TestCase):
+    def test_prefixed_statements(self):
+        text = '''
+        @prefix ex: <http://example.com/> .
+        # A comment.
+        ex:s a ex:Thing ;
+             ex:p ex:o1, ex:o2 ;
+             .
+        '''
+        expected = [
+            (u'<http://example.com/s>',
+             u'<http://www.w3.org/1999/02/22-rdf-syntax-ns#type>',
+             u'<http://example.com/Thing>'),
+            (u'<http://example.com/s>', u'<http://example.com/p>',
+             u'<http://example.com/o1>'),
+            (u'<http://example.com/s>', u'<http://example.com/p>',
+             u'<http://example.com/o2>')]
+        self.assertEqual(turtle.parse(text), expected)
+
+    def test_literals(self):
+        text = r'''
+        @prefix ex: <http://example.com/> .
+        @prefix xsd: <http://www.w3.org/2001/XMLSchema#> .
+        ex:s ex:p "plain", 'single "quoted"', "tagged"@en,
+            "2013-03-22"^^xsd:date, 6, "tab\there", """long
+        string""" .
+        '''
+        objects = [obj for _, _, obj in turtle.parse(text)]
+        expected = [u'"plain"', u'"single \\"quoted\\""', u'"tagged"@en',
+                    u'"2013-03-22"^^<http://www.w3.org/2001/XMLSchema#date>',
+                    u'"6"^^{}'.format(XSD_INTEGER), u'"tab\there"',
+                    u'"long\\n        string"']
+        self.assertEqual(objects, expected)
+
+    def test_blank_nodes(self):
+        text = '''
+        @prefix ex: <http://example.com/> .
+        ex:s ex:p [ ex:q _:b1 ] .
+        '''
+        expected = [(u'_:genid1', u'<http://example.com/q>', u'_:b1'),
+                    (u'<http://example.com/s>', u'<http://example.com/p>',
+                     u'_:genid1')]
+        self.assertEqual(turtle.parse(text), expected)
+
+    def test_undeclared_prefix(self):
+        with self.assertRaises(turtle.ParseError):
+            turtle.parse('ex:s ex:p ex:o .')
+
+    def test_literal_parts(self):
+        term = turtle.literal(u'say "hi"\n', language='en')
+        self.assertEqual(turtle.literal_parts(term),
+                         (u'say "hi"\n', u'en', None))
+
+
+class TestSubjectBlock(unittest.TestCase):
+    def test_layout(self):
+        block = turtle.subject_block(u'<http://example.com/s>',
+                                     [(u'rdf:type', u'ex:Thing'),
+                                      (u'ex:p', u'"1"')])
+        self.assertEqual(block, u'<http://example.com/s>\n'
+                                u'      rdf:type      ex:Thing ;\n'
+                                u'      ex:p          "1" .\n\n')
+
+    def test_round_trip(self):
+        statements = [(u'ex:p', u'ex:o1'), (u'ex:p', u'ex:o2'),
+                      (u'ex:q', turtle.literal(u'a "b"'))]
+        text = u'@prefix ex: <http://example.com/> .\n{}'.format(
+            turtle.subject_block(u'<http://example.com/s>', statements))
+        expected = [(u'<http://example.com/s>', u'<http://example.com/p>',
+                     u'<http://example.com/o1>'),
+                    (u'<http://example.com/s>', u'<http://example.com/p>',
+                     u'<http://example.com/o2>'),
+                    (u'<http://example.com/s>', u'<http://example.com/q>',
+                     u'"a \\"b\\""')]
+        self.assertEqual(turtle.parse(text), expected)
+
+
+class TestParseNQuads(unittest.TestCase):
+    def test_quads(self):
+        lines = ['<http://example.com/s> <http://example.com/p> '
+                 '"6"^^{} <http://example.com/g> .'.format(XSD_INTEGER),
+                 '# A comment.',
+                 '_:b0 <http://example.com/p> <http://example.com/o> .']
+        expected = [(u'<http://example.com/s>', u'<http://example.com/p>',
+                     u'"6"^^{}'.format(XSD_INTEGER),
+                     u'<http://example.com/g>'),
+                    (u'_:b0', u'<http://example.com/p>',
+                     u'<http://example.com/o>', None)]
+        self.assertEqual(list(turtle.parse_nquads(lines)), expected)
+
+    def test_round_trip(self):
+        quad = (u'<http://example.com/s>', u'<http://example.com/p>',
+                turtle.literal(u'two\nlines "quoted"', language='en'),
+                u'<http://example.com/g>')
+        line = turtle.nquad(*quad)
+        self.assertEqual(list(turtle.parse_nquads([line])), [quad])
+
+    def test_invalid(self):
+        with self.assertRaises(turtle.ParseError):
+            list(turtle.parse_nquads(['<http://example.com/s> .']))
+
+
+if __name__ == '__main__':
+    unittest.main()
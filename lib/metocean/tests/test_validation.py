@@ -0,0 +1,92 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Test the metOcean validation check registry and runner.
+
+"""
+
+import threading
+import unittest
+
+import metocean.validation as validation
+
+
+class TestRun(unittest.TestCase):
+    def setUp(self):
+        self.release = threading.Event()
+
+        @validation.register('test_fast', 'fast failures')
+        def fast(fuseki, mappings):
+            return [{'amap': fuseki, 'mappings': mappings}]
+
+        @validation.register('test_slow', 'slow failures')
+        def slow(fuseki, mappings):
+            self.release.wait(5)
+            return []
+
+        self.names = ['test_fast', 'test_slow']
+
+    def tearDown(self):
+        self.release.set()
+        for name in self.names:
+            validation.unregister(name)
+
+    def test_registry(self):
+        names = [check.name for check in validation.checks()]
+        self.assertEqual(names[:2], ['ambiguous', 'undeclared'])
+        self.assertEqual(names[-2:], self.names)
+
+    def test_run(self):
+        self.release.set()
+        report = validation.run('server', names=self.names,
+                                mappings={'test_fast': ['<m>']})
+        self.assertEqual(report, {'fast failures': [{'amap': 'server',
+                                                     'mappings': ['<m>']}],
+                                  'slow failures': []})
+        self.assertEqual(sorted(report.timings), self.names)
+        self.assertEqual(report.timed_out, [])
+        self.assertEqual(report.failed, {})
+
+    def test_failure(self):
+        @validation.register('test_broken', 'broken failures')
+        def broken(fuseki, mappings):
+            raise RuntimeError('broken')
+
+        self.names.append('test_broken')
+        self.release.set()
+        report = validation.run('server', names=self.names)
+        # The results of the other checks are kept.
+        self.assertEqual(sorted(report), ['fast failures', 'slow failures'])
+        self.assertEqual(report.failed.keys(), ['test_broken'])
+        self.assertIsInstance(report.failed['test_broken'], RuntimeError)
+        self.assertIn('test_broken', report.timings)
+        self.assertEqual(report.timed_out, [])
+
+    def test_timeout(self):
+        report = validation.run('server', names=self.names, timeout=0.1)
+        # The results of the checks which completed are kept.
+        self.assertEqual(report, {'fast failures': [{'amap': 'server',
+                                                     'mappings': None}]})
+        self.assertEqual(report.timed_out, ['test_slow'])
+        self.assertGreaterEqual(report.timings['test_slow'], 0.1)
+
+    def test_no_checks(self):
+        self.assertEqual(validation.run('server', names=[]), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,441 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides pure Python parsing of the RDF Turtle and N-Quads serialisations
+used for the metOcean static data and Apache Jena triple store dumps.
+
+RDF terms are represented as unicode strings in their N-Triples form,
+for example u'<http://www.metarelate.net/metOcean/format/um>',
+u'_:b0', u'"air_temperature"', u'"text"@en' or
+u'"6"^^<http://www.w3.org/2001/XMLSchema#integer>'.
+
+"""
+
+import codecs
+import gzip
+import re
+import urlparse
+
+
+RDF = 'http://www.w3.org/1999/02/22-rdf-syntax-ns#'
+XSD = 'http://www.w3.org/2001/XMLSchema#'
+
+_RDF_TYPE = u'<{}type>'.format(RDF)
+_RDF_FIRST = u'<{}first>'.format(RDF)
+_RDF_REST = u'<{}rest>'.format(RDF)
+_RDF_NIL = u'<{}nil>'.format(RDF)
+
+_XSD_INTEGER = u'{}integer'.format(XSD)
+_XSD_DECIMAL = u'{}decimal'.format(XSD)
+_XSD_DOUBLE = u'{}double'.format(XSD)
+_XSD_BOOLEAN = u'{}boolean'.format(XSD)
+
+# Turtle token classes, in order of precedence.
+_TOKENS = [
+    ('space', r'(?:\s+|#[^\n\r]*)+'),
+    ('iri', r'<[^<>"{}|^`\\\x00-\x20]*>'),
+    ('long_string', r'"""(?:[^"\\]|\\.|"(?!""))*"""|'
+                    r"'''(?:[^'\\]|\\.|'(?!''))*'''"),
+    ('string', r'"(?:[^"\\\n\r]|\\.)*"|' r"'(?:[^'\\\n\r]|\\.)*'"),
+    ('at', r'@[A-Za-z]+(?:-[A-Za-z0-9]+)*'),
+    ('datatype', r'\^\^'),
+    ('double', r'[+-]?(?:[0-9]+\.[0-9]*[eE][+-]?[0-9]+|'
+               r'\.[0-9]+[eE][+-]?[0-9]+|[0-9]+[eE][+-]?[0-9]+)'),
+    ('decimal', r'[+-]?[0-9]*\.[0-9]+'),
+    ('integer', r'[+-]?[0-9]+'),
+    ('bnode', r'_:\w(?:[\w.\-]*[\w\-])?'),
+    ('pname', r'(?:[^\W\d_](?:[\w.\-]*[\w\-])?)?:'
+              r'(?:(?:[\w:\-]|%[0-9A-Fa-f]{2}|\\[^\s])'
+              r'(?:[\w.:\-]|%[0-9A-Fa-f]{2}|\\[^\s])*(?<!\.))?'),
+    ('word', r'[A-Za-z]+'),
+    ('punct', r'[.;,\[\]()]'),
+    ]
+
+_TOKEN_RE = re.compile('|'.join('(?P<{}>{})'.format(name, pattern)
+                                for name, pattern in _TOKENS),
+                       re.UNICODE)
+
+_ESCAPES = {'t': u'\t', 'b': u'\b', 'n': u'\n', 'r': u'\r', 'f': u'\f',
+            '"': u'"', "'": u"'", '\\': u'\\'}
+
+_ESCAPE_RE = re.compile(r'\\(?:u([0-9A-Fa-f]{4})|U([0-9A-Fa-f]{8})|(.))')
+
+_LOCAL_ESCAPE_RE = re.compile(r'\\(.)')
+
+_NQUAD_TERM = r'<[^>]*>|_:\S+'
+_NQUAD_RE = re.compile(
+    r'^({term})\s*(<[^>]*>)\s*'
+    r'({term}|"(?:[^"\\]|\\.)*"(?:@[A-Za-z]+(?:-[A-Za-z0-9]+)*|'
+    r'\^\^<[^>]*>)?)\s*({term})?\s*\.$'.format(term=_NQUAD_TERM),
+    re.UNICODE)
+
+_LITERAL_RE = re.compile(r'^"((?:[^"\\]|\\.)*)"'
+                         r'(?:@([A-Za-z]+(?:-[A-Za-z0-9]+)*)|\^\^<([^>]*)>)?$',
+                         re.UNICODE | re.DOTALL)
+
+
+class ParseError(ValueError):
+    """Raised when a Turtle or N-Quads document is malformed."""
+
+
+def _unescape(text):
+    def replace(match):
+        short, long_, char = match.groups()
+        if short or long_:
+            return unichr(int(short or long_, 16))
+        if char not in _ESCAPES:
+            raise ParseError('Invalid escape sequence {!r}.'.format(
+                match.group()))
+        return _ESCAPES[char]
+    return _ESCAPE_RE.sub(replace, text)
+
+
+def _escape(text):
+    return text.replace(u'\\', u'\\\\').replace(u'"', u'\\"')\
+               .replace(u'\n', u'\\n').replace(u'\r', u'\\r')
+
+
+def literal(lexical, language=None, datatype=None):
+    """
+    Return the N-Triples form of the literal with the lexical form, and
+    optional language tag or datatype IRI.
+
+    """
+    term = u'"{}"'.format(_escape(unicode(lexical)))
+    if language:
+        term = u'{}@{}'.format(term, language)
+    elif datatype:
+        term = u'{}^^<{}>'.format(term, datatype)
+    return term
+
+
+def literal_parts(term):
+    """
+    Return the lexical form, language tag and datatype IRI of the
+    N-Triples literal term.
+
+    """
+    match = _LITERAL_RE.match(term)
+    if match is None:
+        raise ValueError('{!r} is not a literal term.'.format(term))
+    lexical, language, datatype = match.groups()
+    return _unescape(lexical), language, datatype
+
+
+def is_iri(term):
+    """Determine whether the N-Triples term is an IRI."""
+    return term.startswith(u'<')
+
+
+def is_literal(term):
+    """Determine whether the N-Triples term is a literal."""
+    return term.startswith(u'"')
+
+
+class _Parser(object):
+    """
+    A recursive descent parser of a single Turtle document.
+
+    """
+    def __init__(self, text, base=None):
+        self.text = text
+        self.base = base
+        self.prefixes = {}
+        self.bnodes = 0
+        self.triples = []
+        self._tokens = self._tokenize()
+        self._next()
+
+    def _tokenize(self):
+        pos = 0
+        end = len(self.text)
+        match = _TOKEN_RE.match
+        while pos < end:
+            token = match(self.text, pos)
+            if token is None:
+                line = self.text.count(u'\n', 0, pos) + 1
+                msg = 'Unexpected character {!r} at line {}.'
+                raise ParseError(msg.format(self.text[pos], line))
+            pos = token.end()
+            if token.lastgroup != 'space':
+                yield token.lastgroup, token.group()
+        yield None, None
+
+    def _next(self):
+        self.kind, self.value = next(self._tokens)
+
+    def _error(self, expected):
+        msg = 'Expected {} but found {!r}.'
+        raise ParseError(msg.format(expected, self.value))
+
+    def _expect(self, value):
+        if self.value != value:
+            self._error(repr(value))
+        self._next()
+
+    def parse(self):
+        while self.kind is not None:
+            if self.value in ('@prefix', '@base'):
+                self._directive(self.value[1:])
+                self._expect('.')
+            elif self.kind == 'word' and self.value.lower() in ('prefix',
+                                                                'base'):
+                self._directive(self.value.lower())
+            else:
+                self._triples()
+                self._expect('.')
+        return self.triples
+
+    def _directive(self, directive):
+        self._next()
+        if directive == 'prefix':
+            if self.kind != 'pname' or not self.value.endswith(':'):
+                self._error('a prefix name')
+            prefix = self.value[:-1]
+            self._next()
+            self.prefixes[prefix] = self._iriref()[1:-1]
+        else:
+            self.base = self._iriref()[1:-1]
+
+    def _iriref(self):
+        if self.kind != 'iri':
+            self._error('an IRI')
+        iri = _unescape(self.value[1:-1])
+        if self.base is not None:
+            iri = urlparse.urljoin(self.base, iri)
+        self._next()
+        return u'<{}>'.format(iri)
+
+    def _bnode(self):
+        self.bnodes += 1
+        return u'_:genid{}'.format(self.bnodes)
+
+    def _triples(self):
+        if self.value == '[':
+            subject = self._blank_node_property_list()
+            if self.value == '.':
+                return
+        else:
+            subject = self._subject()
+        self._predicate_object_list(subject)
+
+    def _subject(self):
+        if self.kind == 'iri':
+            return self._iriref()
+        elif self.kind == 'pname':
+            return self._pname()
+        elif self.kind == 'bnode':
+            return self._labelled_bnode()
+        elif self.value == '(':
+            return self._collection()
+        self._error('a subject')
+
+    def _predicate_object_list(self, subject):
+        while True:
+            if self.kind == 'word' and self.value == 'a':
+                predicate = _RDF_TYPE
+                self._next()
+            elif self.kind == 'iri':
+                predicate = self._iriref()
+            elif self.kind == 'pname':
+                predicate = self._pname()
+            else:
+                self._error('a predicate')
+            while True:
+                self.triples.append((subject, predicate, self._object()))
+                if self.value != ',':
+                    break
+                self._next()
+            if self.value != ';':
+                break
+            while self.value == ';':
+                self._next()
+            if self.value in ('.', ']') or self.kind is None:
+                break
+
+    def _object(self):
+        kind = self.kind
+        if kind == 'iri':
+            return self._iriref()
+        elif kind == 'pname':
+            return self._pname()
+        elif kind == 'bnode':
+            return self._labelled_bnode()
+        elif kind in ('string', 'long_string'):
+            return self._literal()
+        elif kind in ('integer', 'decimal', 'double'):
+            datatype = {'integer': _XSD_INTEGER, 'decimal': _XSD_DECIMAL,
+                        'double': _XSD_DOUBLE}[kind]
+            term = literal(self.value, datatype=datatype)
+            self._next()
+            return term
+        elif kind == 'word' and self.value in ('true', 'false'):
+            term = literal(self.value, datatype=_XSD_BOOLEAN)
+            self._next()
+            return term
+        elif self.value == '[':
+            return self._blank_node_property_list()
+        elif self.value == '(':
+            return self._collection()
+        self._error('an object')
+
+    def _literal(self):
+        if self.kind == 'long_string':
+            lexical = self.value[3:-3]
+        else:
+            lexical = self.value[1:-1]
+        lexical = _unescape(lexical)
+        self._next()
+        if self.kind == 'at':
+            term = literal(lexical, language=self.value[1:])
+            self._next()
+        elif self.kind == 'datatype':
+            self._next()
+            if self.kind == 'iri':
+                datatype = self._iriref()
+            else:
+                datatype = self._pname()
+            term = literal(lexical, datatype=datatype[1:-1])
+        else:
+            term = literal(lexical)
+        return term
+
+    def _pname(self):
+        if self.kind != 'pname':
+            self._error('a prefixed name')
+        prefix, local = self.value.split(':', 1)
+        if prefix not in self.prefixes:
+            raise ParseError('Undeclared prefix {!r}.'.format(prefix))
+        local = _LOCAL_ESCAPE_RE.sub(r'\1', local)
+        self._next()
+        return u'<{}{}>'.format(self.prefixes[prefix], local)
+
+    def _labelled_bnode(self):
+        term = self.value
+        self._next()
+        return term
+
+    def _blank_node_property_list(self):
+        self._expect('[')
+        subject = self._bnode()
+        if self.value != ']':
+            self._predicate_object_list(subject)
+        self._expect(']')
+        return subject
+
+    def _collection(self):
+        self._expect('(')
+        head = node = _RDF_NIL
+        while self.value != ')':
+            if self.kind is None:
+                self._error("')'")
+            item = self._bnode()
+            if node == _RDF_NIL:
+                head = item
+            else:
+                self.triples.append((node, _RDF_REST, item))
+            self.triples.append((item, _RDF_FIRST, self._object()))
+            node = item
+        if node != _RDF_NIL:
+            self.triples.append((node, _RDF_REST, _RDF_NIL))
+        self._next()
+        return head
+
+
+def parse(text, base=None):
+    """
+    Return the list of (subject, predicate, object) N-Triples terms
+    parsed from the Turtle document text.
+
+    Kwargs:
+    * base:
+        The base IRI against which relative IRIs are resolved.
+
+    """
+    if isinstance(text, str):
+        text = text.decode('utf-8')
+    return _Parser(text, base=base).parse()
+
+
+def parse_file(filename):
+    """
+    Return the list of (subject, predicate, object) N-Triples terms
+    parsed from the Turtle file.
+
+    """
+    with codecs.open(filename, encoding='utf-8') as infile:
+        return parse(infile.read())
+
+
+def nquad(subject, predicate, obj, graph=None):
+    """
+    Return the N-Quads statement line of the N-Triples terms, in the
+    default graph if the graph is None.
+
+    """
+    if graph is None:
+        return u'{} {} {} .\n'.format(subject, predicate, obj)
+    return u'{} {} {} {} .\n'.format(subject, predicate, obj, graph)
+
+
+def subject_block(subject, statements):
+    """
+    Return the Turtle block of the (predicate, object) statements about
+    the subject, laid out as in the metOcean static data, with the
+    subject on a line of its own followed by one indented line for each
+    statement.
+
+    The terms may be IRIs, literals or prefixed names.
+
+    """
+    lines = [subject]
+    for predicate, obj in statements:
+        lines.append(u'      {:<13} {} ;'.format(predicate, obj))
+    lines[-1] = u'{}.'.format(lines[-1][:-1])
+    return u'{}\n\n'.format(u'\n'.join(lines))
+
+
+def parse_nquads(lines):
+    """
+    Generate the (subject, predicate, object, graph) N-Triples terms
+    for each statement of the N-Quads lines. The graph is None for
+    statements in the default graph.
+
+    """
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, str):
+            line = line.decode('utf-8')
+        stripped = line.strip()
+        if not stripped or stripped.startswith(u'#'):
+            continue
+        match = _NQUAD_RE.match(stripped)
+        if match is None:
+            msg = 'Invalid N-Quads statement at line {}: {!r}'
+            raise ParseError(msg.format(number, stripped))
+        yield match.groups()
+
+
+def parse_nquads_file(filename):
+    """
+    Generate the (subject, predicate, object, graph) N-Triples terms
+    for each statement of the N-Quads file, which may be gzip compressed.
+
+    """
+    opener = gzip.open if filename.endswith('.gz') else open
+    with opener(filename, 'rb') as infile:
+        for quad in parse_nquads(infile):
+            yield quad
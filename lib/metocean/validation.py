@@ -0,0 +1,194 @@
+# (C) British Crown Copyright 2013, Met Office
+#
+# This file is part of metOcean-mapping.
+#
+# metOcean-mapping is free software: you can redistribute it and/or
+# modify it under the terms of the GNU Lesser General Public License
+# as published by the Free Software Foundation, either version 3 of
+# the License, or (at your option) any later version.
+#
+# metOcean-mapping is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# GNU Lesser General Public License for more details.
+#
+# You should have received a copy of the GNU Lesser General Public License
+# along with metOcean-mapping. If not, see <http://www.gnu.org/licenses/>.
+"""
+Provides the registry of the named validation checks of the metOcean
+mappings, and a runner which performs the checks concurrently against an
+Apache Fuseki SPARQL server, each with a timeout.
+
+A check is a function of the :class:`metocean.fuseki.FusekiServer` and
+the list of the uris of the mappings to check, or None to check all of the
+current mappings, which returns the list of the failing results. Each
+result is a dictionary with the uri of the failing mapping as 'amap' and,
+for a failure involving a pair of mappings, the other mapping as 'bmap'.
+
+"""
+
+from collections import OrderedDict, namedtuple
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import threading
+import time
+
+
+# The descriptions of the failures of the standard checks.
+AMBIGUOUS = 'The following mappings are ambiguous, providing multiple ' \
+            'targets in the same format for a particular source'
+UNDECLARED = 'The following mappings contain an undeclared URI'
+
+
+Check = namedtuple('Check', 'name label function')
+
+# The registered checks, by name, in order of registration.
+_CHECKS = OrderedDict()
+_LOCK = threading.Lock()
+
+
+def register(name, label):
+    """
+    Decorator which registers the function as the named validation check,
+    replacing any check already registered with the name.
+
+    Args:
+    * name:
+        The name of the check.
+    * label:
+        The description of the failures of the check.
+
+    """
+    def decorator(function):
+        with _LOCK:
+            _CHECKS[name] = Check(name, label, function)
+        return function
+    return decorator
+
+
+def unregister(name):
+    """
+    Remove the named validation check from the registry.
+
+    """
+    with _LOCK:
+        del _CHECKS[name]
+
+
+def checks():
+    """
+    Return the list of the registered :class:`Check` instances, in order
+    of registration.
+
+    """
+    with _LOCK:
+        return _CHECKS.values()
+
+
+class Report(dict):
+    """
+    The dictionary of the description of each validation check which
+    completed to the list of its failing results.
+
+    The wall-clock time in seconds taken by each check is recorded by name
+    in timings, the names of the checks which did not complete within the
+    timeout in timed_out, and the exception raised by each check which
+    failed by name in failed.
+
+    """
+    def __init__(self, *args, **kwargs):
+        super(Report, self).__init__(*args, **kwargs)
+        self.timings = {}
+        self.timed_out = []
+        self.failed = {}
+
+
+def _timed(function, *args):
+    # Return the result of the function, or the exception it raised, and
+    # the time taken to call it.
+    start = time.time()
+    try:
+        result = function(*args)
+    except Exception as err:
+        return None, err, time.time() - start
+    return result, None, time.time() - start
+
+
+def run(fuseki, names=None, mappings=None, timeout=None):
+    """
+    Perform the validation checks concurrently, each in its own thread.
+
+    Args:
+    * fuseki:
+        The :class:`metocean.fuseki.FusekiServer` to validate.
+
+    Kwargs:
+    * names:
+        The names of the checks to perform, defaulting to all of the
+        registered checks.
+    * mappings:
+        A dictionary of the name of each check to the list of the uris of
+        the mappings to check, for any check which need not check all of
+        the current mappings.
+    * timeout:
+        The time in seconds to wait for the checks to complete, or None
+        to wait indefinitely. A check which does not complete in time is
+        abandoned to finish in the background.
+
+    Returns:
+        The :class:`Report` of the checks, holding the results of only
+        the checks which completed without raising an exception.
+
+    """
+    registered = checks()
+    if names is not None:
+        registered = [check for check in registered if check.name in names]
+    mappings = mappings or {}
+    report = Report()
+    if not registered:
+        return report
+    pool = ThreadPool(len(registered))
+    try:
+        start = time.time()
+        pending = [(check, pool.apply_async(_timed,
+                                            (check.function, fuseki,
+                                             mappings.get(check.name))))
+                   for check in registered]
+        for check, pending_result in pending:
+            wait = None
+            if timeout is not None:
+                wait = max(0, start + timeout - time.time())
+            try:
+                result, error, elapsed = pending_result.get(wait)
+            except multiprocessing.TimeoutError:
+                report.timed_out.append(check.name)
+                report.timings[check.name] = time.time() - start
+            else:
+                if error is None:
+                    report[check.label] = result
+                else:
+                    report.failed[check.name] = error
+                report.timings[check.name] = elapsed
+    finally:
+        # Abandoned checks still hold their threads, so do not wait.
+        pool.close()
+    return report
+
+
+@register('ambiguous', AMBIGUOUS)
+def ambiguous(fuseki, mappings):
+    """
+    Check for pairs of mappings which map the same source to different
+    targets of the same format.
+
+    """
+    return fuseki.ambiguous_mappings(amaps=mappings, bmaps=mappings)
+
+
+@register('undeclared', UNDECLARED)
+def undeclared(fuseki, mappings):
+    """
+    Check for mappings which reference a uri which no graph declares.
+
+    """
+    return fuseki.undeclared_vocab(amaps=mappings)